@@ -1,13 +1,19 @@
+import base64
+import binascii
+import json
 import logging
+from collections.abc import AsyncIterator
+from dataclasses import asdict
 from typing import Any, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from app.core.database import get_session
-from app.services.llm import LLMService
-from app.services.retrieval import RetrievalService
+from app.services.chat_context import ChatContext, ChatContextService
+from app.services.conversations import ConversationState, conversations
+from app.services.llm import LLMService, extract_interlocutor_facts
+from app.services.summarizer import SummarizedHistory, summarizer
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +29,33 @@ class ChatRequest(BaseModel):
     message: str
     user_id: str
     conversation_history: list[ConversationMessage] | None = None
+    # Server-side history: when set, history and client facts are kept by
+    # the service and conversation_history is only used to seed a new
+    # conversation. The user turn and the reply are stored after each call
+    # that does not end in tool calls
+    conversation_id: str | None = Field(default=None, max_length=255)
+    # Stored as the user's turn instead of `message`, e.g. for the
+    # follow-up call that carries tool results
+    history_message: str | None = None
+    # False when this turn is already stored, e.g. a follow-up for tool
+    # calls the caller derived from a stored reply
+    store_turn: bool = True
+    # The customer the conversation is with (e.g. a Telegram peer), when
+    # one tenant talks to many; scopes state derived from the history
+    peer_id: str | None = Field(default=None, max_length=255)
     top_k: int | None = None
+    ef_search: int | None = None
     product_context: str | None = None
     cart_context: str | None = None
+    # Server-side product search: when set, products are searched together
+    # with documents and product_context is built here unless provided
+    search_products: bool = False
+    product_top_k: int = 3
+    product_min_similarity: float = 0.15
+    images: list[str] | None = None  # base64-encoded customer photos
+    # Used as product_context when neither it nor the search gives one
+    # (e.g. the caller's keyword matches or alternatives)
+    fallback_product_context: str | None = None
 
 
 class ToolCall(BaseModel):
@@ -33,30 +63,61 @@ class ToolCall(BaseModel):
     arguments: dict[str, Any]
 
 
+class ProductMatch(BaseModel):
+    product_id: str
+    product_name: str
+    product_description: str | None
+    similarity: float
+
+
+class PromptTokens(BaseModel):
+    system: int
+    documents: int
+    products: int
+    cart: int
+    summary: int
+    history: int
+    message: int
+    total: int
+    cached: int
+    chunks_dropped: int
+    turns_dropped: int
+    truncated: list[str]
+
+
 class ChatResponse(BaseModel):
     reply: str
     sources_count: int
     tool_calls: list[ToolCall] | None = None
+    cached: bool = False
+    products: list[ProductMatch] | None = None
+    # The product context the reply was based on, for follow-up calls
+    product_context: str | None = None
+    prompt_tokens: PromptTokens | None = None
 
 
-@router.post(
-    "/chat",
-    response_model=ChatResponse,
-    status_code=status.HTTP_200_OK,
-    tags=["Chat"],
-)
-async def chat(
-    request: ChatRequest,
-    session: AsyncSession = Depends(get_session),
-) -> ChatResponse:
-    retrieval_service = RetrievalService(session)
-    llm_service = LLMService()
+def _decode_images(request: ChatRequest) -> list[bytes]:
+    try:
+        return [base64.b64decode(img, validate=True) for img in request.images or []]
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="images must be base64-encoded",
+        )
 
+
+async def _gather_context(request: ChatRequest) -> ChatContext:
+    images = _decode_images(request)
     try:
-        chunks = await retrieval_service.similarity_search(
-            query=request.message,
+        return await ChatContextService().gather(
+            message=request.message,
             user_id=request.user_id,
             top_k=request.top_k,
+            ef_search=request.ef_search,
+            search_products=request.search_products,
+            product_top_k=request.product_top_k,
+            product_min_similarity=request.product_min_similarity,
+            images=images,
         )
     except Exception as e:
         raise HTTPException(
@@ -64,19 +125,105 @@ async def chat(
             detail=f"Retrieval failed: {str(e)}",
         )
 
-    history = (
+
+def _product_matches(context: ChatContext) -> list[ProductMatch] | None:
+    if not context.products:
+        return None
+    return [
+        ProductMatch(
+            product_id=p.product_id,
+            product_name=p.product_name,
+            product_description=p.product_description,
+            similarity=p.similarity,
+        )
+        for p in context.products
+    ]
+
+
+def _product_context(request: ChatRequest, context: ChatContext) -> str | None:
+    return request.product_context or context.product_context or request.fallback_product_context
+
+
+def _history(request: ChatRequest) -> list[dict[str, str]] | None:
+    return (
         [{"role": m.role, "content": m.content} for m in request.conversation_history]
         if request.conversation_history
         else None
     )
 
+
+async def _load_conversation(request: ChatRequest) -> ConversationState | None:
+    if request.conversation_id is None:
+        return None
+    try:
+        state = await conversations.load(request.user_id, request.conversation_id)
+        if not state.turn_count and request.conversation_history:
+            await conversations.append(state, _history(request) or [])
+        return state
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Conversation load failed: {str(e)}",
+        )
+
+
+async def _prompt_history(
+    request: ChatRequest, conversation: ConversationState | None
+) -> tuple[SummarizedHistory, dict[str, str]]:
+    """History for the prompt (summary plus recent turns) and the client facts."""
+    if conversation is not None:
+        return summarizer.for_conversation(conversation), conversation.facts_with(request.message)
+
+    history = _history(request) or []
+    # Facts come from the whole history, including turns the summary replaces
+    facts = extract_interlocutor_facts(
+        [m["content"] for m in history if m["role"] == "user" and m["content"]]
+        + [request.message]
+    )
+    return await summarizer.for_history(request.user_id, request.peer_id, history), facts
+
+
+async def _record_turn(request: ChatRequest, conversation: ConversationState | None, reply: str) -> None:
+    if conversation is None or not request.store_turn:
+        return
+    try:
+        await conversations.append(conversation, [
+            {"role": "user", "content": request.history_message or request.message},
+            {"role": "assistant", "content": reply},
+        ])
+    except Exception as e:
+        logger.error("Could not store turn of conversation %s: %s", request.conversation_id, e)
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post(
+    "/chat",
+    response_model=ChatResponse,
+    status_code=status.HTTP_200_OK,
+    tags=["Chat"],
+)
+async def chat(
+    request: ChatRequest,
+) -> ChatResponse:
+    llm_service = LLMService()
+    context = await _gather_context(request)
+    conversation = await _load_conversation(request)
+    history, facts = await _prompt_history(request, conversation)
+
     try:
         result = await llm_service.generate_response(
             message=request.message,
-            context_chunks=chunks,
-            conversation_history=history,
-            product_context=request.product_context,
+            context_chunks=context.chunks,
+            conversation_history=history.turns,
+            product_context=_product_context(request, context),
             cart_context=request.cart_context,
+            user_id=request.user_id,
+            query_embedding=context.query_embedding,
+            interlocutor_facts=facts,
+            conversation_summary=history.summary,
         )
     except Exception as e:
         raise HTTPException(
@@ -87,9 +234,94 @@ async def chat(
     tool_calls = None
     if result.get("tool_calls"):
         tool_calls = [ToolCall(**tc) for tc in result["tool_calls"]]
+    else:
+        await _record_turn(request, conversation, result["reply"])
 
     return ChatResponse(
         reply=result["reply"],
-        sources_count=len(chunks),
+        sources_count=len(context.chunks),
         tool_calls=tool_calls,
+        cached=result.get("cached", False),
+        products=_product_matches(context),
+        product_context=_product_context(request, context),
+        prompt_tokens=PromptTokens(**asdict(result["prompt_tokens"])),
     )
+
+
+@router.post(
+    "/chat/stream",
+    status_code=status.HTTP_200_OK,
+    tags=["Chat"],
+)
+async def chat_stream(
+    request: ChatRequest,
+) -> StreamingResponse:
+    """
+    Server-sent events version of /chat.
+
+    Events: `sources` (once, with matched products if searched), `token`
+    (text delta), `tool_calls`, `reset` (discard text received so far, a
+    regenerated reply follows), `done` (full reply) and `error`.
+    """
+    llm_service = LLMService()
+    context = await _gather_context(request)
+    conversation = await _load_conversation(request)
+    history, facts = await _prompt_history(request, conversation)
+    products = _product_matches(context)
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("sources", {
+            "sources_count": len(context.chunks),
+            "products": [p.model_dump() for p in products] if products else None,
+        })
+        called_tools = False
+        try:
+            async for event, data in llm_service.stream_response(
+                message=request.message,
+                context_chunks=context.chunks,
+                conversation_history=history.turns,
+                product_context=_product_context(request, context),
+                cart_context=request.cart_context,
+                user_id=request.user_id,
+                query_embedding=context.query_embedding,
+                interlocutor_facts=facts,
+                conversation_summary=history.summary,
+            ):
+                if event == "tool_calls":
+                    called_tools = True
+                elif event == "done" and not called_tools:
+                    await _record_turn(request, conversation, data["reply"])
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error("LLM streaming failed: %s", e)
+            yield _sse("error", {"detail": f"LLM generation failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete(
+    "/chat/conversations",
+    status_code=status.HTTP_204_NO_CONTENT,
+    tags=["Chat"],
+)
+async def delete_conversations(user_id: str) -> None:
+    """Forget every server-side conversation and history summary of a user."""
+    await conversations.delete_all(user_id)
+
+
+@router.delete(
+    "/chat/conversations/{conversation_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    tags=["Chat"],
+)
+async def delete_conversation(conversation_id: str, user_id: str) -> None:
+    """Forget a server-side conversation (history and facts)."""
+    if not await conversations.delete(user_id, conversation_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Conversation {conversation_id} not found",
+        )
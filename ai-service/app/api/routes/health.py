@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response, status
 from pydantic import BaseModel
 
+from app.services.warmup import warmup
+
 router = APIRouter()
 
 
@@ -12,3 +14,22 @@ class HealthResponse(BaseModel):
 @router.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check() -> HealthResponse:
     return HealthResponse(status="ok", service="ai-service")
+
+
+class ReadinessResponse(BaseModel):
+    status: str
+    checks: dict[str, bool]
+    error: str | None = None
+
+
+@router.get("/ready", response_model=ReadinessResponse, tags=["Health"])
+async def readiness_check(response: Response) -> ReadinessResponse:
+    """503 until startup warm-up (models, DB pool) has finished."""
+    ready = warmup.ready
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return ReadinessResponse(
+        status="ready" if ready else "warming_up" if warmup.error is None else "failed",
+        checks=warmup.status(),
+        error=warmup.error,
+    )
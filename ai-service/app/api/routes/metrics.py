@@ -0,0 +1,55 @@
+from typing import Any
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from app.services.batching import batcher_stats
+from app.services.cache_events import cache_events
+from app.services.conversations import conversations
+from app.services.embedding_cache import query_embedding_cache
+from app.services.inference import inference_executor
+from app.services.ingestion_jobs import ingestion_jobs
+from app.services.llm import prompt_cache_stats
+from app.services.llm_client import llm_clients
+from app.services.llm_router import llm_router
+from app.services.reembed_jobs import reembed_jobs
+from app.services.response_cache import response_cache
+from app.services.summarizer import summarizer
+from app.services.warmup import warmup
+
+router = APIRouter()
+
+
+class MetricsResponse(BaseModel):
+    inference: dict[str, float]
+    batching: dict[str, dict[str, float]]
+    cache_events: dict[str, float]
+    conversations: dict[str, float]
+    conversation_summaries: dict[str, float]
+    embedding_cache: dict[str, float]
+    ingestion_jobs: dict[str, float]
+    llm_connections: dict[str, dict[str, float]]
+    llm_routing: dict[str, Any]
+    prompt_cache: dict[str, float]
+    reembed_jobs: dict[str, float]
+    response_cache: dict[str, float]
+    warmup: dict[str, float]
+
+
+@router.get("/metrics", response_model=MetricsResponse, tags=["Health"])
+async def metrics() -> MetricsResponse:
+    return MetricsResponse(
+        inference=inference_executor.stats(),
+        batching=batcher_stats(),
+        cache_events=cache_events.stats(),
+        conversations=conversations.stats(),
+        conversation_summaries=summarizer.stats(),
+        embedding_cache=query_embedding_cache.stats(),
+        ingestion_jobs=ingestion_jobs.stats(),
+        llm_connections=llm_clients.stats(),
+        llm_routing=llm_router.stats(),
+        prompt_cache=prompt_cache_stats.stats(),
+        reembed_jobs=reembed_jobs.stats(),
+        response_cache=response_cache.stats(),
+        warmup=warmup.stats(),
+    )
@@ -1,12 +1,14 @@
 import logging
+from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
-from app.services.chunking import ChunkingService
-from app.services.local_embedding import LocalEmbeddingService
+from app.services.ingestion import ingest_file
+from app.services.ingestion_jobs import IngestionJob, ingestion_jobs
+from app.services.response_cache import response_cache
 from app.services.retrieval import RetrievalService
 
 logger = logging.getLogger(__name__)
@@ -27,6 +29,24 @@ class ProcessFileResponse(BaseModel):
     status: str
 
 
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    file_id: str
+    status: str
+    attempts: int
+    pages_extracted: int
+    chunks_total: int
+    chunks_embedded: int
+    chunks_reused: int
+    rows_written: int
+    rows_deleted: int
+    chunks_count: int | None
+    error: str | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+
+
 @router.post(
     "/process",
     response_model=ProcessFileResponse,
@@ -37,51 +57,115 @@ async def process_file(
     request: ProcessFileRequest,
     session: AsyncSession = Depends(get_session),
 ) -> ProcessFileResponse:
-    chunking_service = ChunkingService()
-    embedding_service = LocalEmbeddingService()
-    retrieval_service = RetrievalService(session)
-
     try:
-        text = chunking_service.extract_text(request.file_path, request.mime_type)
+        chunks_count = await ingest_file(
+            session,
+            file_id=request.file_id,
+            user_id=request.user_id,
+            file_path=request.file_path,
+            mime_type=request.mime_type,
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=str(e),
         )
-    except Exception as e:
+    except RuntimeError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to extract text: {str(e)}",
+            detail=str(e),
         )
 
-    chunks = chunking_service.chunk_text(text)
+    return ProcessFileResponse(
+        file_id=request.file_id,
+        chunks_count=chunks_count,
+        status="processed",
+    )
+
+
+def _job_response(job: IngestionJob) -> IngestionJobResponse:
+    return IngestionJobResponse(
+        job_id=job.id,
+        file_id=job.file_id,
+        status=job.status,
+        attempts=job.attempts,
+        pages_extracted=job.progress.pages_extracted,
+        chunks_total=job.progress.chunks_total,
+        chunks_embedded=job.progress.chunks_embedded,
+        chunks_reused=job.progress.chunks_reused,
+        rows_written=job.progress.rows_written,
+        rows_deleted=job.progress.rows_deleted,
+        chunks_count=job.chunks_count,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
 
-    if not chunks:
+async def _get_job_or_404(job_id: str) -> IngestionJob:
+    job = await ingestion_jobs.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="No text content could be extracted from the file",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found",
         )
+    return job
 
-    texts = [chunk.content for chunk in chunks]
-    embeddings = embedding_service.embed_texts(texts)
-
-    chunks_with_embeddings = [
-        (chunk.content, chunk.chunk_index, chunk.token_count, embedding)
-        for chunk, embedding in zip(chunks, embeddings)
-    ]
 
-    await retrieval_service.delete_chunks_by_file(request.file_id)
-    await retrieval_service.store_chunks(
+@router.post(
+    "/process/jobs",
+    response_model=IngestionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Process"],
+)
+async def submit_process_job(request: ProcessFileRequest) -> IngestionJobResponse:
+    job = await ingestion_jobs.submit(
         file_id=request.file_id,
         user_id=request.user_id,
-        chunks_with_embeddings=chunks_with_embeddings,
+        file_path=request.file_path,
+        mime_type=request.mime_type,
     )
+    return _job_response(job)
 
-    return ProcessFileResponse(
-        file_id=request.file_id,
-        chunks_count=len(chunks),
-        status="processed",
-    )
+
+@router.get(
+    "/process/jobs/{job_id}",
+    response_model=IngestionJobResponse,
+    tags=["Process"],
+)
+async def get_process_job(job_id: str) -> IngestionJobResponse:
+    return _job_response(await _get_job_or_404(job_id))
+
+
+@router.delete(
+    "/process/jobs/{job_id}",
+    response_model=IngestionJobResponse,
+    tags=["Process"],
+)
+async def cancel_process_job(job_id: str) -> IngestionJobResponse:
+    await _get_job_or_404(job_id)
+    job = await ingestion_jobs.cancel(job_id)
+    assert job is not None
+    return _job_response(job)
+
+
+@router.post(
+    "/process/jobs/{job_id}/retry",
+    response_model=IngestionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Process"],
+)
+async def retry_process_job(job_id: str) -> IngestionJobResponse:
+    job = await _get_job_or_404(job_id)
+    if job.status not in ("failed", "cancelled"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job {job_id} is {job.status}, only failed or cancelled jobs can be retried",
+        )
+    job = await ingestion_jobs.retry(job_id)
+    assert job is not None
+    return _job_response(job)
 
 
 @router.delete(
@@ -94,4 +178,6 @@ async def delete_file_chunks(
     session: AsyncSession = Depends(get_session),
 ) -> None:
     retrieval_service = RetrievalService(session)
-    await retrieval_service.delete_chunks_by_file(file_id)
+    owners = await retrieval_service.delete_chunks_by_file(file_id)
+    for owner in owners:
+        response_cache.invalidate(owner)
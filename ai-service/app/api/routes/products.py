@@ -1,13 +1,18 @@
 import logging
+from datetime import datetime
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_session
+from app.models.reembed_checkpoint import ReembedCheckpoint
 from app.services.clip_service import CLIPService
 from app.services.local_embedding import LocalEmbeddingService
-from app.services.product_retrieval import ProductRetrievalService
+from app.services.product_import import ProductImportItem, ProductImportService
+from app.services.product_retrieval import ProductRetrievalService, product_embedding_text
+from app.services.reembed_jobs import reembed_jobs
+from app.services.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -32,35 +37,56 @@ class EmbedResponse(BaseModel):
 class TextSearchRequest(BaseModel):
     query: str
     top_k: int = 3
+    user_id: str | None = None
+    ef_search: int | None = None
 
 
 async def _embed_and_store(
     product_id: str,
     name: str,
     description: str,
-    image: UploadFile | None,
+    images: list[UploadFile],
     session: AsyncSession,
+    user_id: str | None = None,
+    replace_images: bool = False,
 ) -> EmbedResponse:
-    """Shared logic for creating/updating product embeddings."""
+    """
+    Shared logic for creating/updating product embeddings. All photos are
+    embedded in one CLIP batch and replace the product's stored photos.
+    With `replace_images` the photos sent are the whole gallery, so
+    sending none removes the stored ones; otherwise they are kept.
+    """
     retrieval = ProductRetrievalService(session)
 
-    image_embedding = None
-    if image and image.filename:
-        image_bytes = await image.read()
-        if image_bytes:
-            image_embedding = clip_service.embed_image(image_bytes)
-
-    # Repeat name to give it more weight in the embedding vs the long description
-    text_for_embedding = f"{name}. {name}. {description}".strip()
-    text_embedding = local_embedding_service.embed_text(text_for_embedding)
+    photos: list[tuple[str | None, bytes]] = []
+    for upload in images:
+        if upload and upload.filename:
+            image_bytes = await upload.read()
+            if image_bytes:
+                photos.append((upload.filename, image_bytes))
+
+    image_embeddings: list[tuple[str | None, list[float]]] | None = [] if replace_images else None
+    if len(photos) == 1:
+        image_embeddings = [(photos[0][0], await clip_service.aembed_image(photos[0][1]))]
+    elif photos:
+        vectors = await clip_service.aembed_images([image_bytes for _, image_bytes in photos])
+        image_embeddings = [(filename, v) for (filename, _), v in zip(photos, vectors)]
+
+    text_embedding = await local_embedding_service.aembed_text(
+        product_embedding_text(name, description)
+    )
 
     await retrieval.store_embeddings(
         product_id=product_id,
         name=name,
         description=description or None,
-        image_embedding=image_embedding,
+        image_embedding=None,
         text_embedding=text_embedding,
+        user_id=user_id,
+        images=image_embeddings,
     )
+    # Unscoped (legacy) products may appear in any tenant's answers
+    response_cache.invalidate(user_id)
 
     return EmbedResponse(status="ok", product_id=product_id)
 
@@ -76,9 +102,14 @@ async def embed_product(
     name: str = Form(...),
     description: str = Form(""),
     image: UploadFile | None = File(None),
+    images: list[UploadFile] = File([]),
+    user_id: str | None = Form(None),
+    replace_images: bool = Form(False),
     session: AsyncSession = Depends(get_session),
 ) -> EmbedResponse:
-    return await _embed_and_store(product_id, name, description, image, session)
+    return await _embed_and_store(
+        product_id, name, description, [image, *images], session, user_id, replace_images
+    )
 
 
 @router.put(
@@ -92,9 +123,14 @@ async def update_product_embedding(
     name: str = Form(...),
     description: str = Form(""),
     image: UploadFile | None = File(None),
+    images: list[UploadFile] = File([]),
+    user_id: str | None = Form(None),
+    replace_images: bool = Form(False),
     session: AsyncSession = Depends(get_session),
 ) -> EmbedResponse:
-    return await _embed_and_store(product_id, name, description, image, session)
+    return await _embed_and_store(
+        product_id, name, description, [image, *images], session, user_id, replace_images
+    )
 
 
 @router.delete(
@@ -107,7 +143,8 @@ async def delete_product_embedding(
     session: AsyncSession = Depends(get_session),
 ) -> None:
     retrieval = ProductRetrievalService(session)
-    await retrieval.delete_embeddings(product_id)
+    owner = await retrieval.delete_embeddings(product_id)
+    response_cache.invalidate(owner)
 
 
 @router.post(
@@ -119,6 +156,8 @@ async def delete_product_embedding(
 async def search_by_image(
     image: UploadFile = File(...),
     top_k: int = Form(3),
+    ef_search: int | None = Form(None),
+    user_id: str | None = Form(None),
     session: AsyncSession = Depends(get_session),
 ) -> list[ProductSearchResponse]:
     image_bytes = await image.read()
@@ -128,9 +167,11 @@ async def search_by_image(
             detail="Empty image file",
         )
 
-    image_embedding = clip_service.embed_image(image_bytes)
+    image_embedding = await clip_service.aembed_image(image_bytes)
     retrieval = ProductRetrievalService(session)
-    results = await retrieval.search_by_image(image_embedding, top_k=top_k)
+    results = await retrieval.search_by_image(
+        image_embedding, top_k=top_k, ef_search=ef_search, user_id=user_id
+    )
 
     return [
         ProductSearchResponse(
@@ -153,9 +194,14 @@ async def search_by_text(
     request: TextSearchRequest,
     session: AsyncSession = Depends(get_session),
 ) -> list[ProductSearchResponse]:
-    text_embedding = local_embedding_service.embed_text(request.query)
+    text_embedding = await local_embedding_service.aembed_text(request.query)
     retrieval = ProductRetrievalService(session)
-    results = await retrieval.search_by_text(text_embedding, top_k=request.top_k)
+    results = await retrieval.search_by_text(
+        text_embedding,
+        top_k=request.top_k,
+        ef_search=request.ef_search,
+        user_id=request.user_id,
+    )
 
     return [
         ProductSearchResponse(
@@ -168,31 +214,243 @@ async def search_by_text(
     ]
 
 
+class ProductImportEntry(BaseModel):
+    product_id: str
+    name: str
+    description: str = ""
+    user_id: str | None = None
+    # File names on the shared uploads volume (JSON import) or of files
+    # uploaded in the same request (bundle import), in gallery order
+    images: list[str] = []
+
+
+class ProductImportRequest(BaseModel):
+    products: list[ProductImportEntry]
+    # Owner for entries that do not name one
+    user_id: str | None = None
+
+
+class ProductImportResponse(BaseModel):
+    imported: int
+    images_embedded: int
+    image_errors: dict[str, str]
+
+
+async def _import(
+    entries: list[ProductImportEntry],
+    default_user_id: str | None,
+    session: AsyncSession,
+    uploads: dict[str, bytes] | None = None,
+) -> ProductImportResponse:
+    missing: dict[str, str] = {}
+    items: list[ProductImportItem] = []
+    for entry in entries:
+        images: list[tuple[str, bytes | None]] = []
+        for filename in entry.images:
+            if uploads is None:
+                images.append((filename, None))
+            elif filename in uploads:
+                images.append((filename, uploads[filename]))
+            else:
+                missing[entry.product_id] = f"{filename}: not in bundle"
+        items.append(
+            ProductImportItem(
+                product_id=entry.product_id,
+                name=entry.name,
+                description=entry.description,
+                user_id=entry.user_id or default_user_id,
+                images=images,
+            )
+        )
+
+    try:
+        result = await ProductImportService(session).import_products(items)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
+
+    result.image_errors.update(missing)
+    return ProductImportResponse(
+        imported=result.imported,
+        images_embedded=result.images_embedded,
+        image_errors=result.image_errors,
+    )
+
+
+@router.post(
+    "/products/import",
+    response_model=ProductImportResponse,
+    status_code=status.HTTP_200_OK,
+    tags=["Products"],
+)
+async def import_products(
+    request: ProductImportRequest,
+    session: AsyncSession = Depends(get_session),
+) -> ProductImportResponse:
+    """Embed and store many products whose images are on the uploads volume."""
+    return await _import(request.products, request.user_id, session)
+
+
+@router.post(
+    "/products/import/bundle",
+    response_model=ProductImportResponse,
+    status_code=status.HTTP_200_OK,
+    tags=["Products"],
+)
+async def import_products_bundle(
+    manifest: str = Form(...),
+    images: list[UploadFile] = File([]),
+    user_id: str | None = Form(None),
+    session: AsyncSession = Depends(get_session),
+) -> ProductImportResponse:
+    """
+    Embed and store many products sent as one multipart request: a JSON
+    `manifest` (list of products, `images` naming uploaded files) plus
+    the image files.
+    """
+    try:
+        entries = TypeAdapter(list[ProductImportEntry]).validate_json(manifest)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False),
+        )
+
+    uploads = {image.filename: await image.read() for image in images if image.filename}
+    return await _import(entries, user_id, session, uploads)
+
+
 class ReembedResponse(BaseModel):
     updated: int
 
 
+class ReembedJobRequest(BaseModel):
+    kind: str = "text"  # text | image | all
+
+
+class ReembedJobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    total: int
+    processed: int
+    text_updated: int
+    images_updated: int
+    images_skipped: int
+    last_product_id: str | None
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: datetime | None
+
+
+def _reembed_job_response(checkpoint: ReembedCheckpoint) -> ReembedJobResponse:
+    return ReembedJobResponse(
+        job_id=checkpoint.id,
+        kind=checkpoint.kind,
+        status=checkpoint.status,
+        total=checkpoint.total,
+        processed=checkpoint.processed,
+        text_updated=checkpoint.text_updated,
+        images_updated=checkpoint.images_updated,
+        images_skipped=checkpoint.images_skipped,
+        last_product_id=checkpoint.last_product_id,
+        error=checkpoint.error,
+        created_at=checkpoint.created_at,
+        updated_at=checkpoint.updated_at,
+        finished_at=checkpoint.finished_at,
+    )
+
+
+async def _submit_reembed(kind: str) -> ReembedCheckpoint:
+    try:
+        return await reembed_jobs.submit(kind)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e),
+        )
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+        )
+
+
 @router.post(
     "/products/reembed-text",
     response_model=ReembedResponse,
     status_code=status.HTTP_200_OK,
     tags=["Products"],
 )
-async def reembed_all_text(
-    session: AsyncSession = Depends(get_session),
-) -> ReembedResponse:
-    """Re-compute text embeddings for all products using the current model."""
-    retrieval = ProductRetrievalService(session)
-    all_products = await retrieval.get_all()
-    count = 0
-    for product in all_products:
-        text = f"{product.product_name}. {product.product_name}. {product.product_description or ''}".strip()
-        new_embedding = local_embedding_service.embed_text(text)
-        await retrieval.update_text_embedding(
-            product_id=product.product_id,
-            name=product.product_name,
-            description=product.product_description,
-            text_embedding=new_embedding,
+async def reembed_all_text() -> ReembedResponse:
+    """
+    Re-compute text embeddings for all products using the current model.
+    Runs a text re-embedding job and waits for it; use /products/reembed/jobs
+    to run it in the background instead.
+    """
+    checkpoint = await _submit_reembed("text")
+    await reembed_jobs.wait(checkpoint.id)
+    checkpoint = await reembed_jobs.get(checkpoint.id)
+    if checkpoint is None or checkpoint.status != "succeeded":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=(checkpoint.error if checkpoint else None) or "Re-embedding failed",
+        )
+    return ReembedResponse(updated=checkpoint.text_updated)
+
+
+@router.post(
+    "/products/reembed/jobs",
+    response_model=ReembedJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Products"],
+)
+async def create_reembed_job(request: ReembedJobRequest) -> ReembedJobResponse:
+    return _reembed_job_response(await _submit_reembed(request.kind))
+
+
+@router.get(
+    "/products/reembed/jobs/{job_id}",
+    response_model=ReembedJobResponse,
+    tags=["Products"],
+)
+async def get_reembed_job(job_id: str) -> ReembedJobResponse:
+    checkpoint = await reembed_jobs.get(job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return _reembed_job_response(checkpoint)
+
+
+@router.delete(
+    "/products/reembed/jobs/{job_id}",
+    response_model=ReembedJobResponse,
+    tags=["Products"],
+)
+async def cancel_reembed_job(job_id: str) -> ReembedJobResponse:
+    checkpoint = await reembed_jobs.cancel(job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return _reembed_job_response(checkpoint)
+
+
+@router.post(
+    "/products/reembed/jobs/{job_id}/resume",
+    response_model=ReembedJobResponse,
+    tags=["Products"],
+)
+async def resume_reembed_job(job_id: str) -> ReembedJobResponse:
+    try:
+        checkpoint = await reembed_jobs.resume(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if checkpoint is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if checkpoint.status not in ("queued", "running"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {checkpoint.status}; only failed or cancelled jobs can be resumed",
         )
-        count += 1
-    return ReembedResponse(updated=count)
+    return _reembed_job_response(checkpoint)
@@ -13,6 +13,9 @@ class Settings(BaseSettings):
     app_name: str = "TelegramLLM AI Service"
     debug: bool = False
     port: int = 8000
+    # gunicorn worker processes (0 = one per CPU core). Models are loaded
+    # once in the master and shared with the workers copy-on-write
+    web_workers: int = 1
 
     # PostgreSQL
     postgres_host: str = "localhost"
@@ -29,18 +32,161 @@ class Settings(BaseSettings):
     openai_embedding_model: str = "text-embedding-3-small"
     openai_chat_model: str = "qwen/Qwen3-80B-A3B-Instruct"
     openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    # Alternative endpoint for the openai provider, e.g. the local stub
+    # (python -m app.tools.llm_stub)
+    openai_base_url: str = ""
+    # Characters held back while streaming so a character break can be
+    # caught before the client sees it
+    stream_holdback_chars: int = 48
+
+    # Shared LLM HTTP client (one per provider, created at startup)
+    llm_http2: bool = True
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 60.0
+    llm_timeout_seconds: float = 60.0
+    llm_connect_timeout_seconds: float = 5.0
+
+    # Chat model routes: llm_provider / openai_chat_model plus any
+    # comma-separated "provider:model" entries in llm_routes. Routes are
+    # tried in order of their rolling median latency once they have
+    # llm_latency_min_samples samples. With hedging, a call that has no
+    # first token (streaming) or no response after the hedge delay is
+    # raced against the next route and the slower one is cancelled; a
+    # failed route falls over to the next one
+    llm_routes: str = ""
+    llm_hedge_enabled: bool = True
+    llm_hedge_first_token_seconds: float = 2.0
+    llm_hedge_response_seconds: float = 8.0
+    llm_latency_window: int = 100
+    llm_latency_min_samples: int = 5
 
     # RAG
     chunk_size: int = 512
     chunk_overlap: int = 64
+    # "content_defined" cuts where the text itself says so, so an edit only
+    # changes the chunks around it; "fixed" is the plain sliding window
+    chunking_mode: str = "content_defined"
     top_k_results: int = 5
+
+    # Prompt token budget per section (cl100k tokens, 0 = unlimited).
+    # Document chunks are dropped lowest similarity first, history oldest
+    # turn first; product and cart text is truncated. Budget the product
+    # and cart sections leave unused goes to documents, and what documents
+    # leave goes to history
+    prompt_budget_documents: int = 1500
+    prompt_budget_products: int = 1000
+    prompt_budget_cart: int = 300
+    prompt_budget_history: int = 1500
+    prompt_history_max_turns: int = 10
+    # "cache_friendly" keeps the static system prompt, client facts and
+    # history as a prefix that repeats between turns and puts this turn's
+    # documents, products and cart after it, so provider prompt caching
+    # can hit; "legacy" is the original context-first order
+    prompt_layout: str = "cache_friendly"
+
+    # Server-side conversation state (chat requests with a conversation_id):
+    # how many conversations, and recent turns of each, stay in memory
+    conversation_cache_size: int = 2000
+    conversation_cache_turns: int = 50
+    # Rolling summary: turns older than the last conversation_summary_window
+    # reach the prompt as one running summary, refreshed in the background
+    # once conversation_summary_batch more turns have aged out of the
+    # window. An empty model uses openai_chat_model
+    conversation_summary_enabled: bool = True
+    conversation_summary_window: int = 6
+    conversation_summary_batch: int = 6
+    conversation_summary_max_tokens: int = 300
+    conversation_summary_model: str = ""
+    conversation_summary_concurrency: int = 2
+    # Summaries of client-sent histories, per worker
+    conversation_summary_cache_size: int = 5000
+
+    # Semantic response cache (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 5000
+    response_cache_ttl_seconds: float = 3600.0
+    response_cache_similarity_threshold: float = 0.95
     embedding_dimensions: int = 384
 
+    # Background ingestion jobs
+    ingestion_workers: int = 2
+    ingestion_batch_size: int = 64
+    ingestion_max_attempts: int = 3
+    ingestion_job_history: int = 1000
+    # Job state is mirrored to Postgres so any worker can answer for it;
+    # a job whose owner stopped heartbeating counts as failed
+    ingestion_job_sync_seconds: float = 1.0
+    ingestion_job_stale_seconds: float = 30.0
+    ingestion_job_retention_hours: int = 24
+    # Rows per COPY / multi-row upsert statement
+    vector_write_batch_size: int = 1000
+
+    # Catalog re-embedding jobs
+    reembed_batch_size: int = 256
+    # Shared uploads volume; the backend stores product images here
+    product_uploads_dir: str = "/app/uploads/products"
+    # "per_image" matches a photo against every product photo (max per
+    # product); "pooled" uses the single mean vector per product
+    image_search_mode: str = "per_image"
+    # Per-photo candidates fetched per requested result, before grouping
+    image_search_oversample: int = 4
+
+    # Bulk product import
+    product_import_max_items: int = 5000
+    product_import_batch_size: int = 64
+
+    # PDF extraction: pymupdf, pypdfium2, pypdf2 or auto (fastest installed).
+    # 0 workers means one per CPU core
+    pdf_backend: str = "auto"
+    pdf_extract_workers: int = 0
+    pdf_pages_per_shard: int = 16
+
     # CLIP
     clip_model_name: str = "clip-ViT-B-32"
     clip_embedding_dimensions: int = 512
+    text_embedding_model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     text_embedding_dimensions: int = 384
 
+    # Inference backend: torch, onnx or openvino. onnx/openvino run MiniLM
+    # from the int8 export in inference_model_dir (python -m
+    # app.tools.export_models, run at image build for EXPORT_MODELS);
+    # CLIP stays on torch, int8-quantized unless clip_quantize is off.
+    # onnx_quantization: arm64, avx2, avx512 or avx512_vnni
+    inference_backend: str = "torch"
+    inference_model_dir: str = "/app/models"
+    onnx_quantization: str = "avx512_vnni"
+    clip_quantize: bool = True
+
+    # Inference executor (0 torch threads keeps torch's default)
+    inference_workers: int = 2
+    inference_torch_threads: int = 0
+    inference_torch_interop_threads: int = 0
+
+    # Startup warm-up gating /api/ready: background, blocking or off
+    warmup_mode: str = "background"
+    warmup_clip: bool = True
+    warmup_db_connections: int = 5
+
+    # Micro-batching of concurrent single-item embedding requests
+    embedding_batch_max_size: int = 32
+    embedding_batch_max_wait_ms: float = 5.0
+
+    # Query embedding LRU; the optional SQLite file is shared by all workers
+    embedding_cache_max_entries: int = 10000
+    embedding_cache_path: str = ""
+
+    # Vector ANN indexes: hnsw, ivfflat or none
+    vector_index_type: str = "hnsw"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40
+    ivfflat_lists: int = 100
+    ivfflat_probes: int = 10
+    # pgvector >= 0.8 iterative index scans for tenant-filtered queries:
+    # strict_order, relaxed_order or off
+    vector_iterative_scan: str = "strict_order"
+
     @property
     def database_url(self) -> str:
         return (
@@ -0,0 +1,51 @@
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+logger = logging.getLogger(__name__)
+
+# Idempotent DDL for columns added after tables were first created.
+# `create_all` only creates missing tables, so existing deployments need these.
+SCHEMA_UPGRADES: list[str] = [
+    "ALTER TABLE product_embeddings ADD COLUMN IF NOT EXISTS user_id UUID",
+    "CREATE INDEX IF NOT EXISTS ix_product_embeddings_user_id ON product_embeddings (user_id)",
+    # Backfill the owner from the backend's products table (same database)
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('public.products') IS NOT NULL THEN
+            UPDATE product_embeddings pe
+            SET user_id = p."userId"
+            FROM products p
+            WHERE pe.user_id IS NULL AND p.id = pe.product_id;
+        END IF;
+    END $$
+    """,
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    # Same digest as chunking.hash_content, so legacy rows can be reused too
+    """
+    UPDATE document_chunks
+    SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+    WHERE content_hash IS NULL
+    """,
+    # Products embedded before per-photo vectors existed: their one photo
+    # becomes the first per-photo row
+    """
+    INSERT INTO product_image_embeddings (id, product_id, user_id, position, embedding)
+    SELECT gen_random_uuid(), pe.product_id, pe.user_id, 0, pe.image_embedding
+    FROM product_embeddings pe
+    WHERE pe.image_embedding IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM product_image_embeddings pie WHERE pie.product_id = pe.product_id
+      )
+    """,
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_through INTEGER NOT NULL DEFAULT 0",
+]
+
+
+async def upgrade_schema(conn: AsyncConnection) -> None:
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
+    logger.info("Schema upgrades applied (%d statements)", len(SCHEMA_UPGRADES))
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+
+_LOCK_KEY = "hashtext('ai-service:vector-indexes')"
+
+# (table, vector column) pairs that get a cosine ANN index
+VECTOR_COLUMNS: list[tuple[str, str]] = [
+    ("document_chunks", "embedding"),
+    ("product_embeddings", "text_embedding"),
+    ("product_embeddings", "image_embedding"),
+    ("product_image_embeddings", "embedding"),
+]
+
+
+def _index_name(table: str, column: str, index_type: str) -> str:
+    return f"ix_{table}_{column}_{index_type}"
+
+
+def _index_options(index_type: str) -> str:
+    if index_type == "hnsw":
+        return f"m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)}"
+    return f"lists = {int(settings.ivfflat_lists)}"
+
+
+async def ensure_vector_indexes(engine: AsyncEngine) -> None:
+    """
+    Create (or switch) the cosine ANN indexes on every vector column.
+
+    Indexes are built CONCURRENTLY so a restart against a large table does
+    not block writes. A build that was interrupted leaves an invalid index
+    behind; those are dropped and rebuilt. Indexes of the type that is not
+    configured are dropped, so changing `vector_index_type` is a restart.
+    An advisory lock keeps web workers that start together from building
+    the same index twice.
+    """
+    index_type = settings.vector_index_type
+    if index_type not in INDEX_TYPES and index_type != "none":
+        raise ValueError(f"Unsupported vector index type: {index_type}")
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Polled rather than blocking: a waiting statement holds a snapshot,
+        # which CREATE INDEX CONCURRENTLY in the lock holder would wait for
+        while not await conn.scalar(text(f"SELECT pg_try_advisory_lock({_LOCK_KEY})")):
+            await asyncio.sleep(1.0)
+        try:
+            await _ensure_indexes(conn, index_type)
+        finally:
+            await conn.execute(text(f"SELECT pg_advisory_unlock({_LOCK_KEY})"))
+
+
+async def _ensure_indexes(conn: AsyncConnection, index_type: str) -> None:
+    for table, column in VECTOR_COLUMNS:
+        for other in INDEX_TYPES:
+            if other != index_type:
+                await conn.execute(text(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS {_index_name(table, column, other)}"
+                ))
+
+        if index_type == "none":
+            continue
+
+        name = _index_name(table, column, index_type)
+        valid = await conn.scalar(
+            text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ),
+            {"name": name},
+        )
+        if valid:
+            continue
+        if valid is False:
+            logger.warning("Rebuilding invalid vector index %s", name)
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+        logger.info("Building %s index %s on %s.%s", index_type, name, table, column)
+        await conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} "
+            f"USING {index_type} ({column} vector_cosine_ops) "
+            f"WITH ({_index_options(index_type)})"
+        ))
+
+
+async def apply_search_params(session: AsyncSession, top_k: int, ef_search: int | None = None) -> None:
+    """
+    Set the ANN recall knobs for the current transaction.
+
+    HNSW can return at most `ef_search` rows, so it is never set below `top_k`.
+    Searches are filtered by tenant after the index scan; with iterative
+    scans enabled the index keeps producing candidates until `top_k` rows
+    pass the filter, so small tenants still get full result lists.
+    """
+    iterative = settings.vector_iterative_scan
+    if settings.vector_index_type == "hnsw":
+        ef = max(ef_search or settings.hnsw_ef_search, top_k)
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef)}"))
+        if iterative in ("strict_order", "relaxed_order"):
+            await session.execute(text(f"SET LOCAL hnsw.iterative_scan = {iterative}"))
+    elif settings.vector_index_type == "ivfflat":
+        await session.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.ivfflat_probes)}"))
+        if iterative != "off":
+            # IVFFlat only supports relaxed ordering
+            await session.execute(text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
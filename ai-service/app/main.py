@@ -1,17 +1,40 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from collections.abc import AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 
 from app.api.routes.health import router as health_router
+from app.api.routes.metrics import router as metrics_router
 from app.api.routes.process import router as process_router
 from app.api.routes.chat import router as chat_router
 from app.api.routes.products import router as products_router
 from app.core.config import settings
 from app.core.database import engine
-from app.models import DocumentChunk, ProductEmbedding  # noqa: F401 — registers models with Base
+from app.core.schema import upgrade_schema
+from app.core.vector_index import ensure_vector_indexes
+from app.models import (  # noqa: F401 — registers models with Base
+    Conversation,
+    ConversationTurn,
+    DocumentChunk,
+    HistorySummary,
+    IngestionJobRecord,
+    ProductEmbedding,
+    ProductImageEmbedding,
+    ReembedCheckpoint,
+)
+from app.services.batching import stop_batchers
+from app.services.cache_events import cache_events
+from app.services.inference import inference_executor
+from app.services.ingestion_jobs import ingestion_jobs
+from app.services.llm_client import llm_clients
+from app.services.pdf_extraction import pdf_extractor
+from app.services.reembed_jobs import reembed_jobs
+from app.services.summarizer import summarizer
+from app.services.warmup import warmup
 
 logging.basicConfig(
     level=logging.DEBUG if settings.debug else logging.INFO,
@@ -20,15 +43,63 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    # Startup - create tables
+# Set once the gunicorn master has prepared the database before forking
+_database_prepared = False
+
+
+async def prepare_database() -> None:
+    """Create tables, apply schema upgrades and build the vector indexes."""
     async with engine.begin() as conn:
+        # Several instances may start together; one migrates while the others wait
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('ai-service:schema'))"))
         await conn.run_sync(DocumentChunk.metadata.create_all)
+        await upgrade_schema(conn)
     logger.info("Database tables initialized")
+    await ensure_vector_indexes(engine)
+    logger.info("Vector indexes ready (%s)", settings.vector_index_type)
+
+
+def prepare_database_before_fork() -> None:
+    """
+    Run `prepare_database` in the gunicorn master, so a long first index
+    build happens before any worker has to heartbeat. The pool's
+    connections belong to this short-lived loop and must not reach the
+    workers, so it is emptied afterwards.
+    """
+    global _database_prepared
+
+    async def prepare() -> None:
+        try:
+            await prepare_database()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(prepare())
+    _database_prepared = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    # Startup - create tables (done by the gunicorn master when there is one)
+    if not _database_prepared:
+        await prepare_database()
+    llm_clients.startup()
+    await cache_events.start()
+    await warmup.start()
+    await ingestion_jobs.start()
+    await reembed_jobs.start()
 
     yield
     # Shutdown
+    await warmup.stop()
+    await reembed_jobs.stop()
+    await ingestion_jobs.stop()
+    await cache_events.stop()
+    await summarizer.stop()
+    pdf_extractor.shutdown()
+    await llm_clients.aclose()
+    await stop_batchers()
+    inference_executor.shutdown()
     await engine.dispose()
     logger.info("Database engine disposed")
 
@@ -51,6 +122,7 @@ app.add_middleware(
 )
 
 app.include_router(health_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
 app.include_router(process_router, prefix="/api")
 app.include_router(chat_router, prefix="/api")
 app.include_router(products_router, prefix="/api")
@@ -1,4 +1,17 @@
 from app.models.chunk import DocumentChunk
+from app.models.conversation import Conversation, ConversationTurn, HistorySummary
+from app.models.ingestion_job import IngestionJobRecord
 from app.models.product_embedding import ProductEmbedding
+from app.models.product_image_embedding import ProductImageEmbedding
+from app.models.reembed_checkpoint import ReembedCheckpoint
 
-__all__ = ["DocumentChunk", "ProductEmbedding"]
+__all__ = [
+    "Conversation",
+    "ConversationTurn",
+    "DocumentChunk",
+    "HistorySummary",
+    "IngestionJobRecord",
+    "ProductEmbedding",
+    "ProductImageEmbedding",
+    "ReembedCheckpoint",
+]
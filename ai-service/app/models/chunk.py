@@ -1,5 +1,5 @@
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Integer, Text
+from sqlalchemy import Integer, String, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 import uuid
@@ -35,6 +35,9 @@ class DocumentChunk(Base):
 
     token_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
+    # sha256 of content; lets re-ingestion keep unchanged chunks and their embeddings
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
     embedding: Mapped[list[float]] = mapped_column(
         Vector(settings.embedding_dimensions),
         nullable=True,
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKeyConstraint, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class Conversation(Base):
+    """Server-side chat state: one row per (tenant, caller-chosen conversation id)."""
+
+    __tablename__ = "conversations"
+
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
+
+    id: Mapped[str] = mapped_column(String(255), primary_key=True)
+
+    # Facts the client stated about themselves, from every user turn so far
+    facts: Mapped[dict[str, str]] = mapped_column(JSONB, nullable=False, default=dict)
+
+    # Turns stored so far; the next turn gets this position
+    turn_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # Rolling summary of turns [0, summary_through), written in the background
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    summary_through: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(
+        nullable=False, default=lambda: datetime.utcnow()
+    )
+
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=False,
+        default=lambda: datetime.utcnow(),
+        onupdate=lambda: datetime.utcnow(),
+    )
+
+
+class ConversationTurn(Base):
+    __tablename__ = "conversation_turns"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["user_id", "conversation_id"],
+            ["conversations.user_id", "conversations.id"],
+            ondelete="CASCADE",
+        ),
+    )
+
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
+
+    conversation_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    # user | assistant | system
+    role: Mapped[str] = mapped_column(String(16), nullable=False)
+
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(
+        nullable=False, default=lambda: datetime.utcnow()
+    )
+
+
+class HistorySummary(Base):
+    """
+    Rolling summary of history a caller sends with each request, one row
+    per (tenant, customer); server-side conversations keep theirs above.
+    """
+
+    __tablename__ = "history_summaries"
+
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True)
+
+    peer_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+
+    # Key of the last turns the summary covers (ConversationSummarizer._anchors)
+    anchor: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=False,
+        default=lambda: datetime.utcnow(),
+        onupdate=lambda: datetime.utcnow(),
+    )
@@ -26,6 +26,13 @@ class ProductEmbedding(Base):
         index=True,
     )
 
+    # Owning shop; nullable for rows embedded before products were scoped
+    user_id: Mapped[str | None] = mapped_column(
+        UUID(as_uuid=False),
+        nullable=True,
+        index=True,
+    )
+
     image_embedding: Mapped[list[float] | None] = mapped_column(
         Vector(settings.clip_embedding_dimensions),
         nullable=True,
@@ -0,0 +1,45 @@
+import uuid
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import ForeignKey, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.config import settings
+from app.core.database import Base
+
+
+class ProductImageEmbedding(Base):
+    """One CLIP vector per product photo; searched with max similarity per product."""
+
+    __tablename__ = "product_image_embeddings"
+
+    id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False),
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+    )
+
+    product_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False),
+        ForeignKey("product_embeddings.product_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    # Copied from the product so owner-scoped searches filter without a join
+    user_id: Mapped[str | None] = mapped_column(
+        UUID(as_uuid=False),
+        nullable=True,
+        index=True,
+    )
+
+    # Gallery order of the photo
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    filename: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    embedding: Mapped[list[float]] = mapped_column(
+        Vector(settings.clip_embedding_dimensions),
+        nullable=False,
+    )
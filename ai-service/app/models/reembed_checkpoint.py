@@ -0,0 +1,49 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Integer, String, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class ReembedCheckpoint(Base):
+    """Progress of a catalog re-embedding job, committed with each batch."""
+
+    __tablename__ = "reembed_checkpoints"
+
+    id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False),
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+    )
+
+    # text | image | all
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+
+    # queued | running | succeeded | failed | cancelled
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")
+
+    # Keyset cursor: every product_id up to and including this one is done
+    last_product_id: Mapped[str | None] = mapped_column(UUID(as_uuid=False), nullable=True)
+
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    text_updated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    images_updated: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    images_skipped: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        nullable=False, default=lambda: datetime.utcnow()
+    )
+
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=False,
+        default=lambda: datetime.utcnow(),
+        onupdate=lambda: datetime.utcnow(),
+    )
+
+    finished_at: Mapped[datetime | None] = mapped_column(nullable=True)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+from app.services.inference import inference_executor
+
+logger = logging.getLogger(__name__)
+
+I = TypeVar("I")
+O = TypeVar("O")
+
+_batchers: list["MicroBatcher"] = []
+
+
+class MicroBatcher(Generic[I, O]):
+    """
+    Coalesces concurrent single-item requests into one batched model call.
+
+    Callers `await submit(item)`; a background task collects items until
+    `max_batch_size` is reached or `max_wait_ms` has passed since the first
+    one arrived, runs `batch_fn` on the inference executor and resolves each
+    caller's future with its own row. At most `max_in_flight` batches run at
+    once, so while the executor is busy new requests pile up into the next,
+    larger batch instead of queueing as single forward passes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[list[I]], list[O]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_in_flight: int = 1,
+    ) -> None:
+        self.name = name
+        self._batch_fn = batch_fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._max_in_flight = max(1, max_in_flight)
+
+        self._queue: asyncio.Queue[tuple[I, asyncio.Future[O]]] | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._worker: asyncio.Task | None = None
+        self._in_flight: set[asyncio.Task] = set()
+
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+
+        _batchers.append(self)
+
+    def _ensure_started(self) -> asyncio.Queue[tuple[I, asyncio.Future[O]]]:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self._max_in_flight)
+            self._worker = asyncio.create_task(self._run(), name=f"batcher-{self.name}")
+        assert self._queue is not None
+        return self._queue
+
+    async def submit(self, item: I) -> O:
+        queue = self._ensure_started()
+        future: asyncio.Future[O] = asyncio.get_running_loop().create_future()
+        await queue.put((item, future))
+        return await future
+
+    async def _run(self) -> None:
+        assert self._queue is not None and self._slots is not None
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+
+            while len(batch) < self._max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: list[tuple[I, asyncio.Future[O]]]) -> None:
+        assert self._slots is not None
+        try:
+            # Callers that gave up (client disconnect, timeout) are dropped
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                return
+
+            self._batches += 1
+            self._items += len(batch)
+            self._max_seen = max(self._max_seen, len(batch))
+
+            try:
+                results = await inference_executor.run(
+                    self._batch_fn, [item for item, _ in batch]
+                )
+            except Exception as e:
+                logger.error("Batch %s of %d items failed: %s", self.name, len(batch), e)
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    return
+                # Retry one by one so a single bad input only fails its own caller
+                for item, fut in batch:
+                    try:
+                        result = await inference_executor.run(self._batch_fn, [item])
+                    except Exception as item_error:
+                        if not fut.done():
+                            fut.set_exception(item_error)
+                    else:
+                        if not fut.done():
+                            fut.set_result(result[0])
+                return
+
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+            "max_batch_size": self._max_seen,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+def batcher_stats() -> dict[str, dict[str, float]]:
+    return {b.name: b.stats() for b in _batchers}
+
+
+async def stop_batchers() -> None:
+    for b in _batchers:
+        await b.stop()
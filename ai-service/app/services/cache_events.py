@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import uuid
+
+import asyncpg
+
+from app.core.config import settings
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "response_cache_invalidate"
+_RECONNECT_SECONDS = 5.0
+
+
+class CacheInvalidationBus:
+    """
+    Carries response-cache invalidations between web workers.
+
+    Each worker holds one dedicated asyncpg connection that LISTENs on
+    `CHANNEL`; an invalidation in any worker is NOTIFYed there as
+    {"origin", "tenant"} and every other worker drops the same entries, so
+    a document or product change never leaves a stale reply cached in a
+    worker that did not handle it. Only runs when the response cache is
+    enabled. A lost connection is re-established in the background;
+    invalidations published while it is down only apply locally.
+    """
+
+    def __init__(self) -> None:
+        self._origin = ""
+        self._conn: asyncpg.Connection | None = None
+        self._send_lock = asyncio.Lock()
+        self._pending: set[asyncio.Task] = set()
+        self._reconnect_task: asyncio.Task | None = None
+        self._published = 0
+        self._received = 0
+
+    async def start(self) -> None:
+        if not settings.response_cache_enabled:
+            return
+        # Generated after fork, so every worker gets its own
+        self._origin = uuid.uuid4().hex
+        await self._connect()
+        response_cache.set_publisher(self.publish)
+
+    async def stop(self) -> None:
+        response_cache.set_publisher(None)
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+            self._reconnect_task = None
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await conn.close()
+
+    def publish(self, tenant: str | None) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._notify(tenant))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _connect(self) -> None:
+        conn = await asyncpg.connect(
+            host=settings.postgres_host,
+            port=settings.postgres_port,
+            user=settings.postgres_user,
+            password=settings.postgres_password,
+            database=settings.postgres_db,
+        )
+        try:
+            await conn.add_listener(CHANNEL, self._on_notify)
+        except Exception:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    async def _notify(self, tenant: str | None) -> None:
+        if self._conn is None or self._conn.is_closed():
+            return
+        payload = json.dumps({"origin": self._origin, "tenant": tenant})
+        try:
+            async with self._send_lock:
+                await self._conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+            self._published += 1
+        except Exception as e:
+            logger.warning("Could not publish response cache invalidation: %s", e)
+
+    def _on_notify(self, conn: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if event.get("origin") == self._origin:
+            return
+        self._received += 1
+        response_cache.invalidate(event.get("tenant"), broadcast=False)
+
+    def _on_terminated(self, conn: asyncpg.Connection) -> None:
+        if conn is not self._conn:
+            return
+        logger.warning("Response cache invalidation channel lost, reconnecting")
+        self._conn = None
+        # Whatever was announced meanwhile is lost, so start from a clean cache
+        response_cache.invalidate(broadcast=False)
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while self._conn is None:
+            await asyncio.sleep(_RECONNECT_SECONDS)
+            try:
+                await self._connect()
+                logger.info("Response cache invalidation channel restored")
+            except Exception as e:
+                logger.warning("Response cache invalidation channel still down: %s", e)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "connected": float(self._conn is not None and not self._conn.is_closed()),
+            "published": self._published,
+            "received": self._received,
+        }
+
+
+cache_events = CacheInvalidationBus()
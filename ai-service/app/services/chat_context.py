@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from app.core.database import async_session_factory
+from app.services.clip_service import CLIPService
+from app.services.local_embedding import LocalEmbeddingService
+from app.services.product_retrieval import ProductRetrievalService, ProductSearchResult
+from app.services.retrieval import RetrievalService, RetrievedChunk
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatContext:
+    query_embedding: list[float]
+    chunks: list[RetrievedChunk]
+    products: list[ProductSearchResult] = field(default_factory=list)
+    product_context: str | None = None
+
+
+class ChatContextService:
+    """
+    Gathers everything a chat reply needs in one pass.
+
+    The message is embedded once (MiniLM serves both document and product
+    text search) and the document, product-text and product-image searches
+    run concurrently, each on its own pooled session.
+    """
+
+    def __init__(self) -> None:
+        self._clip_service = CLIPService()
+        self._embedding_service = LocalEmbeddingService()
+
+    async def gather(
+        self,
+        message: str,
+        user_id: str,
+        top_k: int | None = None,
+        ef_search: int | None = None,
+        search_products: bool = False,
+        product_top_k: int = 3,
+        product_min_similarity: float = 0.15,
+        images: list[bytes] | None = None,
+    ) -> ChatContext:
+        query_embedding = await self._embedding_service.aembed_text(message)
+
+        text_search = (
+            self._search_products_by_text(query_embedding, user_id, product_top_k)
+            if search_products
+            else _no_products()
+        )
+        chunks, text_matches, *image_results = await asyncio.gather(
+            self._search_chunks(message, user_id, top_k, ef_search, query_embedding),
+            text_search,
+            *(self._search_products_by_image(image, user_id, product_top_k) for image in images or []),
+        )
+        context = ChatContext(query_embedding=query_embedding, chunks=chunks)
+
+        # Deduplicate by product, keeping the highest similarity
+        image_matches = [p for results in image_results for p in results]
+        best: dict[str, ProductSearchResult] = {}
+        for p in image_matches + text_matches:
+            if p.similarity < product_min_similarity:
+                continue
+            existing = best.get(p.product_id)
+            if existing is None or p.similarity > existing.similarity:
+                best[p.product_id] = p
+        context.products = sorted(best.values(), key=lambda p: p.similarity, reverse=True)[:product_top_k]
+
+        if context.products:
+            image_ids = {p.product_id for p in image_matches}
+            source = "photo" if any(p.product_id in image_ids for p in context.products) else "text"
+            async with async_session_factory() as session:
+                details = await ProductRetrievalService(session).get_catalog_details(
+                    [p.product_id for p in context.products]
+                )
+            context.product_context = format_product_context(context.products, details, source)
+
+        return context
+
+    async def _search_chunks(
+        self,
+        message: str,
+        user_id: str,
+        top_k: int | None,
+        ef_search: int | None,
+        query_embedding: list[float],
+    ) -> list[RetrievedChunk]:
+        async with async_session_factory() as session:
+            return await RetrievalService(session).similarity_search(
+                query=message,
+                user_id=user_id,
+                top_k=top_k,
+                ef_search=ef_search,
+                query_embedding=query_embedding,
+            )
+
+    async def _search_products_by_text(
+        self, query_embedding: list[float], user_id: str, top_k: int
+    ) -> list[ProductSearchResult]:
+        async with async_session_factory() as session:
+            return await ProductRetrievalService(session).search_by_text(
+                query_embedding, top_k=top_k, user_id=user_id
+            )
+
+    async def _search_products_by_image(
+        self, image: bytes, user_id: str, top_k: int
+    ) -> list[ProductSearchResult]:
+        image_embedding = await self._clip_service.aembed_image(image)
+        async with async_session_factory() as session:
+            return await ProductRetrievalService(session).search_by_image(
+                image_embedding, top_k=top_k, user_id=user_id
+            )
+
+
+async def _no_products() -> list[ProductSearchResult]:
+    return []
+
+
+def format_product_context(
+    products: list[ProductSearchResult],
+    details: dict[str, dict],
+    source: str,
+) -> str:
+    """Same layout as the backend's TelegramService.formatProductContext."""
+    lines: list[str] = []
+    for i, p in enumerate(products, start=1):
+        full = details.get(p.product_id)
+        parts = [f"{i}. {p.product_name}"]
+        description = (full or {}).get("description") or p.product_description
+        if description:
+            parts.append(f"   Описание: {description}")
+        if full:
+            dims = [full[k] for k in ("width", "height", "depth") if full.get(k)]
+            if dims:
+                parts.append(f"   Размеры: {' x '.join(dims)}")
+            if full.get("weight"):
+                parts.append(f"   Вес: {full['weight']}")
+            parts.append(f"   Цена: {float(full['price']):.2f} ₽")
+            parts.append(f"   В наличии: {full['quantity']} шт.")
+        parts.append(f"   Совпадение: {p.similarity * 100:.0f}%")
+        lines.append("\n".join(parts))
+
+    header = (
+        "Система распознала товар по фотографии клиента. Вот найденные совпадения из каталога:"
+        if source == "photo"
+        else "Система нашла товары по запросу клиента:"
+    )
+    return f"{header}\n\n" + "\n\n".join(lines)
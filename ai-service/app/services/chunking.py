@@ -1,4 +1,8 @@
+import codecs
+import functools
+import hashlib
 import re
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -6,6 +10,24 @@ import chardet
 import tiktoken
 
 from app.core.config import settings
+from app.services.pdf_extraction import pdf_extractor
+
+# Plain text is read and yielded in blocks of about this size
+_TXT_READ_BYTES = 1 << 20
+_TXT_DETECT_BYTES = 64 * 1024
+
+# Content-defined boundaries look at the last few tokens only
+_BOUNDARY_WINDOW = 4
+
+
+@functools.cache
+def token_encoder() -> tiktoken.Encoding:
+    """The cl100k encoder, loaded once and shared by chunking and prompt budgeting."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def hash_content(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
 @dataclass
@@ -14,46 +36,135 @@ class TextChunk:
     chunk_index: int
     token_count: int
 
+    @property
+    def content_hash(self) -> str:
+        return hash_content(self.content)
+
 
 class ChunkingService:
     def __init__(self) -> None:
-        self._encoder = tiktoken.get_encoding("cl100k_base")
+        self._encoder = token_encoder()
 
     def chunk_text(self, text: str) -> list[TextChunk]:
-        text = self._clean_text(text)
-        tokens = self._encoder.encode(text)
+        return list(self.iter_chunks([text]))
+
+    def iter_chunks(self, pages: Iterable[str]) -> Iterator[TextChunk]:
+        if settings.chunking_mode == "fixed":
+            return self._iter_fixed_chunks(pages)
+        return self._iter_content_defined_chunks(pages)
+
+    def _iter_tokens(self, pages: Iterable[str]) -> Iterator[list[int]]:
+        first = True
+        for page in pages:
+            page = self._clean_text(page)
+            if not page:
+                continue
+            yield self._encoder.encode(page if first else "\n" + page)
+            first = False
+
+    def _iter_content_defined_chunks(self, pages: Iterable[str]) -> Iterator[TextChunk]:
+        """
+        Chunk a stream of pages at content-defined token boundaries.
+
+        A chunk ends where a hash of its last few tokens hits a fixed
+        pattern (once it has at least half the body size) or at
+        `chunk_size`. Because boundaries depend only on nearby tokens, an
+        edit shifts at most the chunks around it and later boundaries fall
+        back into the same places, so unchanged chunks keep their content
+        hashes. Each chunk starts with the last `chunk_overlap` tokens of
+        the previous one.
+        """
+        overlap = min(settings.chunk_overlap, settings.chunk_size - 1)
+        max_body = settings.chunk_size - overlap
+        min_body = max(1, max_body // 2)
+        divisor = max(1, max_body // 4)
+
+        chunk: list[int] = []
+        body = 0
+        index = 0
+
+        def _emit() -> TextChunk:
+            return TextChunk(
+                content=self._encoder.decode(chunk).strip(),
+                chunk_index=index,
+                token_count=len(chunk),
+            )
 
-        chunks: list[TextChunk] = []
-        start = 0
+        for tokens in self._iter_tokens(pages):
+            for token in tokens:
+                chunk.append(token)
+                body += 1
+                if body < min_body:
+                    continue
+                if body < max_body and _boundary_hash(chunk[-_BOUNDARY_WINDOW:]) % divisor:
+                    continue
+
+                emitted = _emit()
+                if emitted.content:
+                    yield emitted
+                    index += 1
+                chunk = chunk[len(chunk) - overlap:] if overlap else []
+                body = 0
+
+        if body:
+            emitted = _emit()
+            if emitted.content:
+                yield emitted
+
+    def _iter_fixed_chunks(self, pages: Iterable[str]) -> Iterator[TextChunk]:
+        """
+        Chunk a stream of pages with a sliding token window.
+
+        Only the current window plus one page worth of tokens is held in
+        memory; the overlap is carried across page boundaries, so the result
+        matches chunking the joined text.
+        """
+        size = settings.chunk_size
+        step = settings.chunk_size - settings.chunk_overlap
+        buffer: list[int] = []
         index = 0
 
-        while start < len(tokens):
-            end = start + settings.chunk_size
-            chunk_tokens = tokens[start:end]
-            chunk_text = self._encoder.decode(chunk_tokens)
-
-            chunks.append(
-                TextChunk(
-                    content=chunk_text.strip(),
-                    chunk_index=index,
-                    token_count=len(chunk_tokens),
-                )
+        def _window() -> TextChunk:
+            chunk_tokens = buffer[:size]
+            return TextChunk(
+                content=self._encoder.decode(chunk_tokens).strip(),
+                chunk_index=index,
+                token_count=len(chunk_tokens),
             )
 
-            start += settings.chunk_size - settings.chunk_overlap
+        for tokens in self._iter_tokens(pages):
+            buffer.extend(tokens)
+
+            while len(buffer) >= size:
+                chunk = _window()
+                if chunk.content:
+                    yield chunk
+                del buffer[:step]
+                index += 1
+
+        while buffer:
+            chunk = _window()
+            if chunk.content:
+                yield chunk
+            del buffer[:step]
             index += 1
 
-        return [c for c in chunks if c.content]
-
     def extract_text(self, file_path: str, mime_type: str) -> str:
+        return "\n".join(self.iter_pages(file_path, mime_type))
+
+    def iter_pages(self, file_path: str, mime_type: str) -> Iterator[str]:
+        """
+        Yield a document's text page by page (paragraph blocks for plain
+        text and DOCX). Raises ValueError right away for unsupported types.
+        """
         path = Path(file_path)
 
         extractors = {
-            "text/plain": self._extract_txt,
-            "text/markdown": self._extract_txt,
-            "text/x-markdown": self._extract_txt,
-            "application/pdf": self._extract_pdf,
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": self._extract_docx,
+            "text/plain": self._iter_txt,
+            "text/markdown": self._iter_txt,
+            "text/x-markdown": self._iter_txt,
+            "application/pdf": self._iter_pdf,
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": self._iter_docx,
         }
 
         extractor = extractors.get(mime_type)
@@ -62,38 +173,50 @@ class ChunkingService:
 
         return extractor(path)
 
-    def _extract_txt(self, path: Path) -> str:
-        raw = path.read_bytes()
-        detected = chardet.detect(raw)
-        encoding = detected.get("encoding") or "utf-8"
-        return raw.decode(encoding, errors="replace")
-
-    def _extract_pdf(self, path: Path) -> str:
-        import PyPDF2
-
-        text_parts: list[str] = []
-
+    def _iter_txt(self, path: Path) -> Iterator[str]:
         with open(path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-
-        return "\n".join(text_parts)
-
-    def _extract_docx(self, path: Path) -> str:
+            detected = chardet.detect(f.read(_TXT_DETECT_BYTES))
+            encoding = detected.get("encoding") or "utf-8"
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            f.seek(0)
+
+            pending = ""
+            for block in iter(lambda: f.read(_TXT_READ_BYTES), b""):
+                pending += decoder.decode(block)
+                # Cut at a paragraph (or at least line) break so no word is split
+                cut = pending.rfind("\n\n")
+                if cut <= 0 and len(pending) > 4 * _TXT_READ_BYTES:
+                    cut = pending.rfind("\n")
+                    if cut <= 0:
+                        cut = len(pending)
+                if cut > 0:
+                    yield pending[:cut]
+                    pending = pending[cut:]
+
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                yield pending
+
+    def _iter_pdf(self, path: Path) -> Iterator[str]:
+        yield from pdf_extractor.iter_pages(str(path))
+
+    def _iter_docx(self, path: Path) -> Iterator[str]:
         from docx import Document
 
         doc = Document(str(path))
-        return "\n".join(
-            paragraph.text
-            for paragraph in doc.paragraphs
-            if paragraph.text.strip()
-        )
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                yield paragraph.text
 
     def _clean_text(self, text: str) -> str:
         text = re.sub(r"\r\n|\r", "\n", text)
         text = re.sub(r"\n{3,}", "\n\n", text)
         text = re.sub(r"[ \t]{2,}", " ", text)
         return text.strip()
+
+
+def _boundary_hash(tokens: list[int]) -> int:
+    h = 0
+    for token in tokens:
+        h = (h * 1_000_003 + token) & 0xFFFFFFFF
+    return (h * 0x9E3779B1) & 0xFFFFFFFF
@@ -5,6 +5,9 @@ from PIL import Image
 from sentence_transformers import SentenceTransformer
 
 from app.core.config import settings
+from app.services.batching import MicroBatcher
+from app.services.inference import inference_executor
+from app.services.model_loading import load_clip_model
 
 logger = logging.getLogger(__name__)
 
@@ -14,16 +17,61 @@ class CLIPService:
 
     def _get_model(self) -> SentenceTransformer:
         if self._model is None:
-            CLIPService._model = SentenceTransformer(settings.clip_model_name)
+            CLIPService._model = load_clip_model(settings.clip_model_name)
         return self._model
 
+    @staticmethod
+    def decode_image(image_bytes: bytes) -> Image.Image:
+        return Image.open(BytesIO(image_bytes)).convert("RGB")
+
     def embed_image(self, image_bytes: bytes) -> list[float]:
         model = self._get_model()
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        embedding = model.encode(image)
+        embedding = model.encode(self.decode_image(image_bytes))
         return embedding.tolist()
 
+    def embed_images(self, images_bytes: list[bytes]) -> list[list[float]]:
+        return self.embed_decoded_images([self.decode_image(b) for b in images_bytes])
+
+    def embed_decoded_images(self, images: list[Image.Image]) -> list[list[float]]:
+        model = self._get_model()
+        embeddings = model.encode(images)
+        return [e.tolist() for e in embeddings]
+
     def embed_text(self, text: str) -> list[float]:
         model = self._get_model()
         embedding = model.encode(text)
         return embedding.tolist()
+
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        model = self._get_model()
+        embeddings = model.encode(texts)
+        return [e.tolist() for e in embeddings]
+
+    async def aembed_image(self, image_bytes: bytes) -> list[float]:
+        return await image_batcher.submit(image_bytes)
+
+    async def aembed_text(self, text: str) -> list[float]:
+        return await clip_text_batcher.submit(text)
+
+    async def aembed_images(self, images_bytes: list[bytes]) -> list[list[float]]:
+        return await inference_executor.run(self.embed_images, images_bytes)
+
+    async def aembed_decoded_images(self, images: list[Image.Image]) -> list[list[float]]:
+        return await inference_executor.run(self.embed_decoded_images, images)
+
+
+image_batcher: MicroBatcher[bytes, list[float]] = MicroBatcher(
+    name="clip_image",
+    batch_fn=CLIPService().embed_images,
+    max_batch_size=settings.embedding_batch_max_size,
+    max_wait_ms=settings.embedding_batch_max_wait_ms,
+    max_in_flight=settings.inference_workers,
+)
+
+clip_text_batcher: MicroBatcher[str, list[float]] = MicroBatcher(
+    name="clip_text",
+    batch_fn=CLIPService().embed_texts,
+    max_batch_size=settings.embedding_batch_max_size,
+    max_wait_ms=settings.embedding_batch_max_wait_ms,
+    max_in_flight=settings.inference_workers,
+)
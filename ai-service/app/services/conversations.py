@@ -0,0 +1,296 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.conversation import Conversation, ConversationTurn, HistorySummary
+from app.services.llm import extract_interlocutor_facts
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConversationState:
+    user_id: str
+    conversation_id: str
+    # Most recent turns, oldest first
+    turns: deque[dict[str, str]] = field(default_factory=deque)
+    facts: dict[str, str] = field(default_factory=dict)
+    # Turns stored in total; `turns` holds the tail of them
+    turn_count: int = 0
+    # Rolling summary of turns [0, summary_through)
+    summary: str | None = None
+    summary_through: int = 0
+
+    def history(self) -> list[dict[str, str]]:
+        return list(self.turns)
+
+    def unsummarized(self) -> list[dict[str, str]]:
+        """Cached turns the summary does not cover yet."""
+        first = self.turn_count - len(self.turns)
+        return list(self.turns)[max(0, self.summary_through - first):]
+
+    def facts_with(self, message: str) -> dict[str, str]:
+        """Known facts plus whatever the new message states, without rescanning history."""
+        return extract_interlocutor_facts([message], dict(self.facts))
+
+
+class ConversationStore:
+    """
+    Chat history and client facts kept in the AI service, so callers only
+    send the new message.
+
+    Conversations live in Postgres (`conversations`, append-only
+    `conversation_turns`) and the most recently used ones are held in a
+    bounded in-memory LRU with their last `max_turns` turns. Every load
+    checks the stored turn count (one primary-key read); if another worker
+    has added turns since, only those are fetched. Facts are updated from
+    each new user turn as it is appended, so per-turn work does not grow
+    with the length of the dialogue.
+    """
+
+    def __init__(self, max_conversations: int, max_turns: int) -> None:
+        self._max_conversations = max(1, max_conversations)
+        self._max_turns = max(1, max_turns)
+        self._states: OrderedDict[tuple[str, str], ConversationState] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._refreshes = 0
+        self._loads = 0
+
+    async def load(self, user_id: str, conversation_id: str) -> ConversationState:
+        key = (user_id, conversation_id)
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+
+        async with async_session_factory() as session:
+            row = (await session.execute(
+                select(
+                    Conversation.turn_count,
+                    Conversation.facts,
+                    Conversation.summary,
+                    Conversation.summary_through,
+                ).where(
+                    Conversation.user_id == user_id,
+                    Conversation.id == conversation_id,
+                )
+            )).first()
+            if row is None:
+                state = self._new_state(user_id, conversation_id)
+                self._remember(key, state)
+                return state
+
+            if state is not None and state.turn_count == row.turn_count:
+                self._hits += 1
+                # The summary may have been refreshed by another worker
+                state.summary, state.summary_through = row.summary, row.summary_through
+                return state
+
+            if state is not None and state.turn_count < row.turn_count:
+                self._refreshes += 1
+                since = state.turn_count
+                # Refreshed on a copy: requests holding the cached state (or
+                # refreshing it concurrently) never see turns added twice
+                state = ConversationState(
+                    user_id=user_id,
+                    conversation_id=conversation_id,
+                    turns=deque(state.turns, maxlen=self._max_turns),
+                )
+            else:
+                self._loads += 1
+                state = self._new_state(user_id, conversation_id)
+                since = max(0, row.turn_count - self._max_turns)
+
+            result = await session.execute(
+                select(ConversationTurn.role, ConversationTurn.content)
+                .where(
+                    ConversationTurn.user_id == user_id,
+                    ConversationTurn.conversation_id == conversation_id,
+                    ConversationTurn.position >= since,
+                    # Turns appended after the count was read belong to the next load
+                    ConversationTurn.position < row.turn_count,
+                )
+                .order_by(ConversationTurn.position)
+            )
+            state.turns.extend({"role": r.role, "content": r.content} for r in result.fetchall())
+            state.facts = dict(row.facts or {})
+            state.turn_count = row.turn_count
+            state.summary, state.summary_through = row.summary, row.summary_through
+
+        self._remember(key, state)
+        return state
+
+    async def append(self, state: ConversationState, turns: list[dict[str, str]]) -> None:
+        """Store `turns` after the conversation's last one and fold their facts in."""
+        if not turns:
+            return
+        user_texts = [t["content"] for t in turns if t["role"] == "user" and t["content"]]
+        facts = extract_interlocutor_facts(user_texts, dict(state.facts))
+
+        async with async_session_factory() as session:
+            await session.execute(
+                insert(Conversation)
+                .values(user_id=state.user_id, id=state.conversation_id, facts={}, turn_count=0)
+                .on_conflict_do_nothing()
+            )
+            # Row lock: concurrent appends to one conversation get consecutive positions
+            row = (await session.execute(
+                select(Conversation.turn_count, Conversation.facts)
+                .where(
+                    Conversation.user_id == state.user_id,
+                    Conversation.id == state.conversation_id,
+                )
+                .with_for_update()
+            )).one()
+            start = row.turn_count
+            if start != state.turn_count:
+                # Turns were added elsewhere since this state was loaded; keep their facts too
+                facts = extract_interlocutor_facts(user_texts, dict(row.facts or {}))
+            await session.execute(
+                insert(ConversationTurn).values([
+                    {
+                        "user_id": state.user_id,
+                        "conversation_id": state.conversation_id,
+                        "position": start + i,
+                        "role": turn["role"],
+                        "content": turn["content"],
+                    }
+                    for i, turn in enumerate(turns)
+                ])
+            )
+            await session.execute(
+                update(Conversation)
+                .where(
+                    Conversation.user_id == state.user_id,
+                    Conversation.id == state.conversation_id,
+                )
+                .values(turn_count=start + len(turns), facts=facts, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+
+        if start == state.turn_count:
+            state.turns.extend(turns)
+            state.facts = facts
+            state.turn_count = start + len(turns)
+        else:
+            # The next load fetches the missing turns
+            self._forget((state.user_id, state.conversation_id))
+
+    async def turns(
+        self, user_id: str, conversation_id: str, start: int, end: int
+    ) -> list[dict[str, str]]:
+        """Stored turns at positions [start, end), oldest first."""
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(ConversationTurn.role, ConversationTurn.content)
+                .where(
+                    ConversationTurn.user_id == user_id,
+                    ConversationTurn.conversation_id == conversation_id,
+                    ConversationTurn.position >= start,
+                    ConversationTurn.position < end,
+                )
+                .order_by(ConversationTurn.position)
+            )
+            return [{"role": r.role, "content": r.content} for r in result.fetchall()]
+
+    async def save_summary(
+        self,
+        user_id: str,
+        conversation_id: str,
+        summary: str,
+        previous_through: int,
+        through: int,
+    ) -> bool:
+        """
+        Store a summary of turns [0, through) that extends the one covering
+        [0, previous_through); returns False if that one was replaced meanwhile.
+        """
+        async with async_session_factory() as session:
+            result = await session.execute(
+                update(Conversation)
+                .where(
+                    Conversation.user_id == user_id,
+                    Conversation.id == conversation_id,
+                    Conversation.summary_through == previous_through,
+                )
+                .values(summary=summary, summary_through=through)
+            )
+            await session.commit()
+        if not result.rowcount:
+            return False
+
+        with self._lock:
+            state = self._states.get((user_id, conversation_id))
+        if state is not None and state.summary_through == previous_through:
+            state.summary, state.summary_through = summary, through
+        return True
+
+    async def delete(self, user_id: str, conversation_id: str) -> bool:
+        self._forget((user_id, conversation_id))
+        async with async_session_factory() as session:
+            result = await session.execute(
+                delete(Conversation).where(
+                    Conversation.user_id == user_id,
+                    Conversation.id == conversation_id,
+                )
+            )
+            await session.commit()
+        return result.rowcount > 0
+
+    async def delete_all(self, user_id: str) -> int:
+        with self._lock:
+            for key in [key for key in self._states if key[0] == user_id]:
+                del self._states[key]
+        async with async_session_factory() as session:
+            result = await session.execute(
+                delete(Conversation).where(Conversation.user_id == user_id)
+            )
+            # And the summaries of history the user's callers sent themselves
+            await session.execute(delete(HistorySummary).where(HistorySummary.user_id == user_id))
+            await session.commit()
+        return result.rowcount
+
+    def _new_state(self, user_id: str, conversation_id: str) -> ConversationState:
+        return ConversationState(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            turns=deque(maxlen=self._max_turns),
+        )
+
+    def _remember(self, key: tuple[str, str], state: ConversationState) -> None:
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self._max_conversations:
+                self._states.popitem(last=False)
+
+    def _forget(self, key: tuple[str, str]) -> None:
+        with self._lock:
+            self._states.pop(key, None)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            cached = len(self._states)
+        lookups = self._hits + self._refreshes + self._loads
+        return {
+            "cached": cached,
+            "hits": self._hits,
+            "refreshes": self._refreshes,
+            "loads": self._loads,
+            "hit_rate": (self._hits / lookups) if lookups else 0.0,
+        }
+
+
+conversations = ConversationStore(
+    max_conversations=settings.conversation_cache_size,
+    max_turns=settings.conversation_cache_turns,
+)
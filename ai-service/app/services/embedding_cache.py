@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    # Case is kept: the multilingual MiniLM tokenizer is cased
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class _SqliteStore:
+    """
+    Small on-disk vector store shared by all workers on the same host.
+
+    The connection is opened on first use in each process: SQLite handles
+    must not cross a fork, and the app module is imported by the gunicorn
+    master before workers are forked.
+
+    Reads refresh `used_at` so pruning keeps the most recently used
+    entries; the refreshes are written in batches rather than one UPDATE
+    per hit.
+    """
+
+    _PRUNE_EVERY = 500
+    _TOUCH_BATCH = 100
+
+    def __init__(self, path: str, namespace: str, max_entries: int) -> None:
+        self._path = path
+        self._namespace = namespace
+        self._max_entries = max_entries
+        self._writes = 0
+        self._touched: set[str] = set()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=0.05, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+                "used_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> list[float] | None:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT vector FROM embeddings WHERE namespace = ? AND key = ?",
+                (self._namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched.add(key)
+            if len(self._touched) >= self._TOUCH_BATCH:
+                self._flush_touched(conn)
+        return array("f", row[0]).tolist()
+
+    def touch(self, key: str) -> bool:
+        """
+        Marks an entry as used (e.g. on an in-memory hit) without touching
+        the file; True once enough are pending that `flush` should run.
+        """
+        with self._lock:
+            self._touched.add(key)
+            return len(self._touched) >= self._TOUCH_BATCH
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_touched(self._connection())
+
+    def put(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (namespace, key, vector, used_at) VALUES (?, ?, ?, ?)",
+                (self._namespace, key, array("f", vector).tobytes(), time.time()),
+            )
+            self._touched.discard(key)
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                self._flush_touched(conn)
+                conn.execute(
+                    "DELETE FROM embeddings WHERE namespace = ? AND key NOT IN ("
+                    "SELECT key FROM embeddings WHERE namespace = ? ORDER BY used_at DESC LIMIT ?)",
+                    (self._namespace, self._namespace, self._max_entries),
+                )
+
+    def _flush_touched(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        keys, self._touched = self._touched, set()
+        conn.executemany(
+            "UPDATE embeddings SET used_at = ? WHERE namespace = ? AND key = ?",
+            [(now, self._namespace, key) for key in keys],
+        )
+
+
+class EmbeddingCache:
+    """
+    Bounded, thread-safe LRU of normalized text -> embedding vector.
+
+    An optional SQLite file (`embedding_cache_path`) acts as a second level
+    shared by every uvicorn worker on the host; errors there (locked
+    database, full disk) are treated as misses and never fail the request.
+    Its reads and writes run in a thread so the event loop never waits on
+    the file.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, store_path: str = "") -> None:
+        self._max_entries = max(1, max_entries)
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = _SqliteStore(store_path, namespace, self._max_entries) if store_path else None
+
+        self._hits = 0
+        self._store_hits = 0
+        self._misses = 0
+
+    async def get(self, text: str) -> list[float] | None:
+        key = normalize_text(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+        if vector is not None:
+            if self._store is not None and self._store.touch(key):
+                try:
+                    await asyncio.to_thread(self._store.flush)
+                except sqlite3.Error as e:
+                    logger.debug("Embedding cache store write failed: %s", e)
+            return vector
+
+        if self._store is not None:
+            try:
+                vector = await asyncio.to_thread(self._store.get, key)
+            except sqlite3.Error as e:
+                logger.debug("Embedding cache store read failed: %s", e)
+                vector = None
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self._store_hits += 1
+                return vector
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    async def put(self, text: str, vector: list[float]) -> None:
+        key = normalize_text(text)
+        self._remember(key, vector)
+        if self._store is not None:
+            try:
+                await asyncio.to_thread(self._store.put, key, vector)
+            except sqlite3.Error as e:
+                logger.debug("Embedding cache store write failed: %s", e)
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._store_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "store_hits": self._store_hits,
+                "misses": self._misses,
+                "hit_rate": ((self._hits + self._store_hits) / lookups) if lookups else 0.0,
+            }
+
+
+query_embedding_cache = EmbeddingCache(
+    # Quantized backends give slightly different vectors, so they get their own entries
+    namespace=f"{settings.text_embedding_model_name}:{settings.inference_backend}",
+    max_entries=settings.embedding_cache_max_entries,
+    store_path=settings.embedding_cache_path,
+)
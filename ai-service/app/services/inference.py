@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class InferenceExecutor:
+    """
+    Shared thread pool for CPU-bound model work (SentenceTransformer / CLIP).
+
+    Routes await `run()` instead of calling `model.encode` directly, so a long
+    embedding job never blocks the event loop. Threads (not processes) are
+    used because torch releases the GIL inside its kernels and the loaded
+    models can be shared between workers without copying.
+    """
+
+    def __init__(self, max_workers: int, torch_threads: int = 0, torch_interop_threads: int = 0) -> None:
+        self._max_workers = max(1, max_workers)
+        self._torch_threads = torch_threads
+        self._torch_interop_threads = torch_interop_threads
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._configure_torch()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers,
+                thread_name_prefix="inference",
+            )
+            logger.info("Inference executor started with %d workers", self._max_workers)
+        return self._executor
+
+    def set_torch_threads(self, threads: int) -> None:
+        """Intra-op thread count for this process; applied when the pool starts."""
+        if self._executor is not None:
+            raise RuntimeError("Inference executor already started")
+        self._torch_threads = threads
+
+    def _configure_torch(self) -> None:
+        if self._torch_threads <= 0 and self._torch_interop_threads <= 0:
+            return
+        import torch
+
+        if self._torch_threads > 0:
+            torch.set_num_threads(self._torch_threads)
+            logger.info("Torch intra-op threads set to %d", self._torch_threads)
+        if self._torch_interop_threads > 0:
+            # Only allowed before torch runs any inter-op parallel work
+            try:
+                torch.set_num_interop_threads(self._torch_interop_threads)
+                logger.info("Torch inter-op threads set to %d", self._torch_interop_threads)
+            except RuntimeError as e:
+                logger.warning("Could not set torch inter-op threads: %s", e)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+
+        with self._lock:
+            self._queued += 1
+
+        def _task() -> T:
+            started_at = time.perf_counter()
+            wait = started_at - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._started += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                result = fn(*args)
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_run += time.perf_counter() - started_at
+            return result
+
+        return await loop.run_in_executor(self._get_executor(), _task)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            started = self._started
+            completed = self._completed
+            return {
+                "workers": self._max_workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_ms": (self._total_wait / started * 1000) if started else 0.0,
+                "max_wait_ms": self._max_wait * 1000,
+                "avg_run_ms": (self._total_run / completed * 1000) if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+inference_executor = InferenceExecutor(
+    max_workers=settings.inference_workers,
+    torch_threads=settings.inference_torch_threads,
+    torch_interop_threads=settings.inference_torch_interop_threads,
+)
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from collections import defaultdict
+from collections.abc import Iterator
+from dataclasses import dataclass
+from itertools import islice
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.services.chunking import ChunkingService, TextChunk
+from app.services.local_embedding import LocalEmbeddingService
+from app.services.response_cache import response_cache
+from app.services.retrieval import RetrievalService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestionProgress:
+    # Pages for PDF, paragraph blocks for plain text and DOCX
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    rows_written: int = 0
+    rows_deleted: int = 0
+
+
+async def ingest_file(
+    session: AsyncSession,
+    file_id: str,
+    user_id: str,
+    file_path: str,
+    mime_type: str,
+    progress: IngestionProgress | None = None,
+) -> int:
+    """
+    Extract, chunk, embed and store one file; returns the number of chunks.
+
+    Pages are pulled through the chunker in batches of
+    `ingestion_batch_size` chunks on a worker thread while the previous
+    batch is embedded and written, so peak memory is bounded by two
+    batches regardless of file size.
+
+    Re-ingesting a file is a diff against the rows already stored for it:
+    chunks whose content hash is already there keep their row and
+    embedding (only the position is updated), new chunks are embedded and
+    inserted, and rows no longer produced are deleted at the end. The cost
+    of a re-upload is therefore proportional to what changed.
+
+    Raises ValueError when the file cannot be ingested at all (unsupported
+    type, no text) and RuntimeError when extraction fails.
+    """
+    progress = progress or IngestionProgress()
+    chunking_service = ChunkingService()
+    embedding_service = LocalEmbeddingService()
+    retrieval_service = RetrievalService(session)
+    batch_size = max(1, settings.ingestion_batch_size)
+
+    def _count_pages(pages: Iterator[str]) -> Iterator[str]:
+        for page in pages:
+            progress.pages_extracted += 1
+            yield page
+
+    chunks = chunking_service.iter_chunks(
+        _count_pages(chunking_service.iter_pages(file_path, mime_type))
+    )
+
+    def _next_batch() -> list[TextChunk]:
+        try:
+            return list(islice(chunks, batch_size))
+        except ValueError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to extract text: {str(e)}") from e
+
+    # content_hash -> [(chunk_id, chunk_index)] of rows that can be kept
+    reusable: dict[str, list[tuple[str, int]]] = defaultdict(list)
+    stale: list[str] = []
+    changed = False
+
+    async def _load_existing() -> None:
+        for row in await retrieval_service.get_file_chunks(file_id):
+            if row.content_hash is None or row.user_id != user_id:
+                stale.append(row.id)
+            else:
+                reusable[row.content_hash].append((row.id, row.chunk_index))
+
+    total = 0
+    pending = asyncio.create_task(asyncio.to_thread(_next_batch))
+    try:
+        while True:
+            batch = await pending
+            if not batch:
+                break
+            pending = asyncio.create_task(asyncio.to_thread(_next_batch))
+
+            if total == 0:
+                await _load_existing()
+            total += len(batch)
+            progress.chunks_total = total
+
+            fresh: list[TextChunk] = []
+            moved: list[tuple[str, int]] = []
+            for chunk in batch:
+                rows = reusable.get(chunk.content_hash)
+                if not rows:
+                    fresh.append(chunk)
+                    continue
+                chunk_id, chunk_index = rows.pop()
+                if chunk_index != chunk.chunk_index:
+                    moved.append((chunk_id, chunk.chunk_index))
+            progress.chunks_reused += len(batch) - len(fresh)
+
+            if moved:
+                await retrieval_service.update_chunk_indexes(moved)
+
+            if fresh:
+                embeddings = await embedding_service.aembed_texts([c.content for c in fresh])
+                progress.chunks_embedded += len(fresh)
+
+                await retrieval_service.store_chunks(
+                    file_id=file_id,
+                    user_id=user_id,
+                    chunks_with_embeddings=[
+                        (chunk.content, chunk.chunk_index, chunk.token_count, embedding)
+                        for chunk, embedding in zip(fresh, embeddings)
+                    ],
+                )
+                progress.rows_written += len(fresh)
+                changed = True
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+    if total == 0:
+        raise ValueError("No text content could be extracted from the file")
+
+    stale.extend(chunk_id for rows in reusable.values() for chunk_id, _ in rows)
+    if stale:
+        await retrieval_service.delete_chunks(stale)
+        progress.rows_deleted = len(stale)
+        changed = True
+
+    if changed:
+        response_cache.invalidate(user_id)
+    logger.info(
+        "Ingested file %s: %d chunks from %d pages (%d reused, %d embedded, %d deleted)",
+        file_id,
+        total,
+        progress.pages_extracted,
+        progress.chunks_reused,
+        progress.chunks_embedded,
+        progress.rows_deleted,
+    )
+    return total
@@ -0,0 +1,385 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.ingestion_job import IngestionJobRecord
+from app.services.ingestion import IngestionProgress, ingest_file
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    file_id: str
+    user_id: str
+    file_path: str
+    mime_type: str
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    attempts: int = 0
+    chunks_count: int | None = None
+    error: str | None = None
+    progress: IngestionProgress = field(default_factory=IngestionProgress)
+    created_at: datetime = field(default_factory=lambda: datetime.utcnow())
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+
+def _record_values(job: IngestionJob) -> dict:
+    return {
+        "id": job.id,
+        "file_id": job.file_id,
+        "user_id": job.user_id,
+        "file_path": job.file_path,
+        "mime_type": job.mime_type,
+        "status": job.status,
+        "attempts": job.attempts,
+        "chunks_count": job.chunks_count,
+        "error": job.error,
+        "pages_extracted": job.progress.pages_extracted,
+        "chunks_total": job.progress.chunks_total,
+        "chunks_embedded": job.progress.chunks_embedded,
+        "chunks_reused": job.progress.chunks_reused,
+        "rows_written": job.progress.rows_written,
+        "rows_deleted": job.progress.rows_deleted,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def _job_from_record(record: IngestionJobRecord) -> IngestionJob:
+    return IngestionJob(
+        id=record.id,
+        file_id=record.file_id,
+        user_id=record.user_id,
+        file_path=record.file_path,
+        mime_type=record.mime_type,
+        status=record.status,
+        attempts=record.attempts,
+        chunks_count=record.chunks_count,
+        error=record.error,
+        progress=IngestionProgress(
+            pages_extracted=record.pages_extracted,
+            chunks_total=record.chunks_total,
+            chunks_embedded=record.chunks_embedded,
+            chunks_reused=record.chunks_reused,
+            rows_written=record.rows_written,
+            rows_deleted=record.rows_deleted,
+        ),
+        created_at=record.created_at,
+        started_at=record.started_at,
+        finished_at=record.finished_at,
+    )
+
+
+class IngestionJobQueue:
+    """
+    In-process queue of file ingestion jobs.
+
+    `ingestion_workers` background tasks take jobs off the queue and run
+    the same pipeline as the synchronous /process endpoint, each on its own
+    session. Failures other than "file cannot be ingested" are retried with
+    exponential backoff up to `ingestion_max_attempts`. Finished jobs are
+    kept for status queries, oldest first out.
+
+    Every job is also mirrored to the `ingestion_jobs` table: on each state
+    change, and every `ingestion_job_sync_seconds` for progress. With
+    several web workers a status poll can land on a worker that does not
+    run the job; it is then answered from the table, and cancel/retry are
+    passed through it. The owner picks up a cancellation on its next sync.
+    A queued or running job nobody has updated for
+    `ingestion_job_stale_seconds` belonged to a worker that stopped, and is
+    reported as failed.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, history: int) -> None:
+        self._workers_count = max(1, workers)
+        self._max_attempts = max(1, max_attempts)
+        self._history = max(1, history)
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._queue: asyncio.Queue[str] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._sync_task: asyncio.Task | None = None
+        # Jobs whose last state change could not be written yet
+        self._unsaved: set[str] = set()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ingestion-worker-{i}")
+            for i in range(self._workers_count)
+        ]
+        self._sync_task = asyncio.create_task(self._sync_loop(), name="ingestion-sync")
+        logger.info("Ingestion queue started with %d workers", self._workers_count)
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *([self._sync_task] if self._sync_task else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sync_task = None
+
+    async def submit(self, file_id: str, user_id: str, file_path: str, mime_type: str) -> IngestionJob:
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not running")
+
+        # A re-upload supersedes any job still working on the same file,
+        # here or (through the table) on another worker
+        for job in list(self._jobs.values()):
+            if job.file_id == file_id and job.status in ACTIVE_STATUSES:
+                self._cancel_local(job)
+        async with async_session_factory() as session:
+            await session.execute(
+                update(IngestionJobRecord)
+                .where(
+                    IngestionJobRecord.file_id == file_id,
+                    IngestionJobRecord.status.in_(ACTIVE_STATUSES),
+                )
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            await session.commit()
+
+        job = IngestionJob(
+            id=str(uuid.uuid4()),
+            file_id=file_id,
+            user_id=user_id,
+            file_path=file_path,
+            mime_type=mime_type,
+        )
+        await self._save([job])
+        self._jobs[job.id] = job
+        self._trim_history()
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str) -> IngestionJob | None:
+        job = self._jobs.get(job_id)
+        if job is not None and (job.status in ACTIVE_STATUSES or job_id in self._unsaved):
+            return job
+
+        # A finished local copy may be out of date: the job can have been
+        # retried on (and adopted by) another worker since
+        async with async_session_factory() as session:
+            record = await session.get(IngestionJobRecord, job_id)
+            if record is None:
+                return job
+            if job is not None and record.status in ACTIVE_STATUSES:
+                del self._jobs[job_id]
+            stale_before = datetime.utcnow() - timedelta(seconds=settings.ingestion_job_stale_seconds)
+            if record.status in ACTIVE_STATUSES and record.updated_at < stale_before:
+                record.status = "failed"
+                record.error = "The worker running this job stopped"
+                record.finished_at = datetime.utcnow()
+                await session.commit()
+            return _job_from_record(record)
+
+    async def cancel(self, job_id: str) -> IngestionJob | None:
+        job = self._jobs.get(job_id)
+        if job is not None and self._cancel_local(job):
+            await self._save([job], only_active=True)
+            return job
+
+        async with async_session_factory() as session:
+            await session.execute(
+                update(IngestionJobRecord)
+                .where(
+                    IngestionJobRecord.id == job_id,
+                    IngestionJobRecord.status.in_(ACTIVE_STATUSES),
+                )
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            await session.commit()
+        return await self.get(job_id)
+
+    async def retry(self, job_id: str) -> IngestionJob | None:
+        job = await self.get(job_id)
+        if job is None or job.status not in ("failed", "cancelled"):
+            return job
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not running")
+        # A job from another worker's history is adopted by this one
+        self._jobs[job.id] = job
+        job.status = "queued"
+        job.attempts = 0
+        job.error = None
+        job.progress = IngestionProgress()
+        job.started_at = job.finished_at = None
+        await self._save([job])
+        self._queue.put_nowait(job.id)
+        return job
+
+    def _cancel_local(self, job: IngestionJob) -> bool:
+        if job.status not in ACTIVE_STATUSES:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+        return True
+
+    async def _save(self, jobs: list[IngestionJob], only_active: bool = False) -> None:
+        """
+        Upsert the jobs' rows. With `only_active` (heartbeats and the owner's
+        own state changes) only rows that are still active are updated, so
+        a cancellation made elsewhere is never undone.
+        """
+        if not jobs:
+            return
+        stmt = insert(IngestionJobRecord).values([_record_values(job) for job in jobs])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IngestionJobRecord.id],
+            set_={
+                column: stmt.excluded[column]
+                for column in _record_values(jobs[0])
+                if column not in ("id", "created_at")
+            },
+            where=IngestionJobRecord.status.in_(ACTIVE_STATUSES) if only_active else None,
+        )
+        async with async_session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def _sync_loop(self) -> None:
+        interval = max(0.1, settings.ingestion_job_sync_seconds)
+        retention = timedelta(hours=settings.ingestion_job_retention_hours)
+        ticks = 0
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._sync()
+                ticks += 1
+                if ticks % 600 == 0:
+                    async with async_session_factory() as session:
+                        await session.execute(
+                            delete(IngestionJobRecord).where(
+                                IngestionJobRecord.finished_at < datetime.utcnow() - retention
+                            )
+                        )
+                        await session.commit()
+            except Exception as e:
+                logger.warning("Ingestion job sync failed: %s", e)
+
+    async def _record(self, job: IngestionJob) -> None:
+        try:
+            await self._save([job], only_active=True)
+        except Exception as e:
+            logger.warning("Could not record ingestion job %s as %s: %s", job.id, job.status, e)
+            self._unsaved.add(job.id)
+        else:
+            self._unsaved.discard(job.id)
+
+    async def _sync(self) -> None:
+        unsaved = [self._jobs[job_id] for job_id in self._unsaved if job_id in self._jobs]
+        if unsaved:
+            await self._save(unsaved, only_active=True)
+        self._unsaved.clear()
+
+        active = [job for job in self._jobs.values() if job.status in ACTIVE_STATUSES]
+        if not active:
+            return
+
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(IngestionJobRecord.id).where(
+                    IngestionJobRecord.id.in_([job.id for job in active]),
+                    IngestionJobRecord.status == "cancelled",
+                )
+            )
+            cancelled = {row.id for row in result.fetchall()}
+        for job in active:
+            if job.id in cancelled:
+                logger.info("Ingestion job %s was cancelled through another worker", job.id)
+                self._cancel_local(job)
+
+        await self._save([job for job in active if job.id not in cancelled], only_active=True)
+
+    def _trim_history(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status not in ACTIVE_STATUSES]
+        for job_id in finished[: max(0, len(self._jobs) - self._history)]:
+            del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                # Either this job was cancelled, or the worker itself is stopping
+                current = asyncio.current_task()
+                if current is not None and current.cancelling():
+                    job.task.cancel()
+                    raise
+            finally:
+                job.task = None
+
+    async def _run(self, job: IngestionJob) -> None:
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await self._record(job)
+
+        while True:
+            job.attempts += 1
+            job.progress = IngestionProgress()
+            try:
+                async with async_session_factory() as session:
+                    job.chunks_count = await ingest_file(
+                        session,
+                        file_id=job.file_id,
+                        user_id=job.user_id,
+                        file_path=job.file_path,
+                        mime_type=job.mime_type,
+                        progress=job.progress,
+                    )
+            except ValueError as e:
+                await self._finish(job, "failed", str(e))
+                return
+            except Exception as e:
+                logger.error("Ingestion job %s attempt %d failed: %s", job.id, job.attempts, e)
+                if job.attempts >= self._max_attempts:
+                    await self._finish(job, "failed", str(e))
+                    return
+                await asyncio.sleep(2 ** job.attempts)
+                continue
+
+            await self._finish(job, "succeeded")
+            return
+
+    async def _finish(self, job: IngestionJob, status: str, error: str | None = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        await self._record(job)
+
+    def stats(self) -> dict[str, float]:
+        counts: dict[str, float] = {s: 0 for s in ("queued", "running", "succeeded", "failed", "cancelled")}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        counts["workers"] = self._workers_count
+        return counts
+
+
+ingestion_jobs = IngestionJobQueue(
+    workers=settings.ingestion_workers,
+    max_attempts=settings.ingestion_max_attempts,
+    history=settings.ingestion_job_history,
+)
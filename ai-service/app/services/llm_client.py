@@ -0,0 +1,121 @@
+import logging
+from typing import Any
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionStats:
+    """Counts requests vs. freshly opened connections via httpcore trace events."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    async def trace(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+        elif event_name in (
+            "http11.send_request_headers.started",
+            "http2.send_request_headers.started",
+        ):
+            self.requests += 1
+
+    def as_dict(self) -> dict[str, float]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reuse_ratio": (reused / self.requests) if self.requests else 0.0,
+        }
+
+
+class LLMClientPool:
+    """
+    One long-lived AsyncOpenAI client per provider.
+
+    Each client owns a keep-alive httpx pool, so consecutive chat requests
+    reuse the TLS connection to the provider instead of handshaking on
+    every message. Clients are created in the app lifespan and closed on
+    shutdown; `get()` creates one lazily if used outside the app.
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[str, AsyncOpenAI] = {}
+        self._http_clients: dict[str, httpx.AsyncClient] = {}
+        self._stats: dict[str, _ConnectionStats] = {}
+
+    def _provider_config(self, provider: str) -> tuple[str, str | None]:
+        if provider == "openrouter":
+            return settings.openrouter_api_key, settings.openrouter_base_url
+        if provider == "openai":
+            return settings.openai_api_key, settings.openai_base_url or None
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    def _http2_enabled(self) -> bool:
+        if not settings.llm_http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            return False
+        return True
+
+    def _create(self, provider: str) -> AsyncOpenAI:
+        api_key, base_url = self._provider_config(provider)
+        stats = _ConnectionStats()
+
+        async def _attach_trace(request: httpx.Request) -> None:
+            request.extensions["trace"] = stats.trace
+
+        http_client = httpx.AsyncClient(
+            http2=self._http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                settings.llm_timeout_seconds,
+                connect=settings.llm_connect_timeout_seconds,
+            ),
+            event_hooks={"request": [_attach_trace]},
+        )
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+        self._clients[provider] = client
+        self._http_clients[provider] = http_client
+        self._stats[provider] = stats
+        logger.info("LLM client for %s created", provider)
+        return client
+
+    def get(self, provider: str | None = None) -> AsyncOpenAI:
+        provider = provider or settings.llm_provider
+        client = self._clients.get(provider)
+        if client is None:
+            client = self._create(provider)
+        return client
+
+    def startup(self) -> None:
+        self.get(settings.llm_provider)
+
+    async def aclose(self) -> None:
+        for http_client in self._http_clients.values():
+            await http_client.aclose()
+        self._clients.clear()
+        self._http_clients.clear()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {provider: s.as_dict() for provider, s in self._stats.items()}
+
+
+llm_clients = LLMClientPool()
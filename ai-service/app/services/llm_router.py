@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from statistics import median
+from typing import Any, TypeVar
+
+from app.core.config import settings
+from app.services.llm_client import llm_clients
+
+logger = logging.getLogger(__name__)
+
+# Latency kinds: time to the first streamed chunk, time to a full response
+FIRST_TOKEN = "first_token"
+RESPONSE = "response"
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class LLMRoute:
+    provider: str
+    model: str
+
+    def __str__(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_routes(spec: str) -> list[LLMRoute]:
+    """Comma-separated "provider:model" entries; the model may contain ":"."""
+    routes = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        provider, sep, model = entry.partition(":")
+        if not sep or not model:
+            raise ValueError(f"LLM route must be provider:model, got {entry!r}")
+        routes.append(LLMRoute(provider.strip(), model.strip()))
+    return routes
+
+
+class LatencyTracker:
+    """
+    Rolling window of the last `window` latencies per route and kind.
+
+    A call that lost a race is recorded with the time it had taken when it
+    was cancelled (a lower bound), so a slow route keeps looking slow
+    even though it never finishes; a failed call counts as at least the
+    hedge delay.
+    """
+
+    def __init__(self, window: int, min_samples: int) -> None:
+        self._window = max(1, window)
+        self._min_samples = max(1, min_samples)
+        self._samples: dict[tuple[LLMRoute, str], deque[float]] = {}
+        self._failures: dict[LLMRoute, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: LLMRoute, kind: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get((route, kind))
+            if samples is None:
+                samples = self._samples[(route, kind)] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def failure(self, route: LLMRoute) -> None:
+        with self._lock:
+            self._failures[route] = self._failures.get(route, 0) + 1
+
+    def median(self, route: LLMRoute, kind: str) -> float | None:
+        """Median latency, or None until the route has enough samples."""
+        with self._lock:
+            samples = self._samples.get((route, kind))
+            if samples is None or len(samples) < self._min_samples:
+                return None
+            return median(samples)
+
+    def order(self, routes: list[LLMRoute], kind: str) -> list[LLMRoute]:
+        """
+        Fastest first. Until it is measured the configured primary stays in
+        front and the other routes go last, in configured order.
+        """
+        def key(item: tuple[int, LLMRoute]) -> tuple[float, int]:
+            position, route = item
+            latency = self.median(route, kind)
+            if latency is None:
+                latency = 0.0 if position == 0 else float("inf")
+            return latency, position
+
+        return [route for _, route in sorted(enumerate(routes), key=key)]
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            keys = list(self._samples)
+            failures = dict(self._failures)
+        result: dict[str, dict[str, float]] = {}
+        for route, kind in keys:
+            with self._lock:
+                samples = sorted(self._samples[(route, kind)])
+            entry = result.setdefault(str(route), {"failures": failures.get(route, 0)})
+            entry[f"{kind}_samples"] = len(samples)
+            entry[f"{kind}_p50"] = samples[len(samples) // 2]
+            entry[f"{kind}_p95"] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        for route, count in failures.items():
+            result.setdefault(str(route), {"failures": count})
+        return result
+
+
+class _PrimedStream:
+    """A chat completion stream whose first chunk has already been read."""
+
+    def __init__(self, stream: Any, first: Any | None) -> None:
+        self._stream = stream
+        self._first = first
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        if self._first is not None:
+            first, self._first = self._first, None
+            yield first
+        async for chunk in self._stream:
+            yield chunk
+
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class LLMRouter:
+    """
+    Sends chat completions to the fastest configured route, hedged.
+
+    If the chosen route has not produced a response (or, when streaming,
+    its first chunk) within the hedge delay, the same request goes to the
+    next route as well; whichever answers first is used and the other
+    request is cancelled, so one slow upstream no longer sets the tail
+    latency. A route that fails hands over to the next one straight away.
+    At most two routes are raced per call.
+    """
+
+    def __init__(self, routes: list[LLMRoute], tracker: LatencyTracker) -> None:
+        self._routes = routes
+        self._tracker = tracker
+        self._calls = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._failovers = 0
+
+    def routes(self, kind: str) -> list[LLMRoute]:
+        return self._tracker.order(self._routes, kind)
+
+    async def complete(self, kwargs: dict) -> Any:
+        """Non-streaming chat completion; `kwargs["model"]` is set per route."""
+        async def start(route: LLMRoute) -> Any:
+            client = llm_clients.get(route.provider)
+            return await client.chat.completions.create(**{**kwargs, "model": route.model})
+
+        return await self._race(RESPONSE, settings.llm_hedge_response_seconds, start)
+
+    async def stream(self, kwargs: dict) -> _PrimedStream:
+        """Streaming chat completion; the race is decided by the first chunk."""
+        async def start(route: LLMRoute) -> _PrimedStream:
+            client = llm_clients.get(route.provider)
+            stream = await client.chat.completions.create(**{**kwargs, "model": route.model})
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await stream.close()
+                raise
+            return _PrimedStream(stream, first)
+
+        async def discard(stream: _PrimedStream) -> None:
+            await stream.close()
+
+        return await self._race(
+            FIRST_TOKEN, settings.llm_hedge_first_token_seconds, start, discard
+        )
+
+    async def _race(
+        self,
+        kind: str,
+        hedge_after: float,
+        start: Callable[[LLMRoute], Awaitable[T]],
+        discard: Callable[[T], Awaitable[None]] | None = None,
+    ) -> T:
+        routes = self.routes(kind)
+        loop = asyncio.get_running_loop()
+        pending: dict[asyncio.Task, tuple[LLMRoute, float]] = {}
+        remaining = deque(routes)
+        can_hedge = settings.llm_hedge_enabled and len(routes) > 1
+        hedged = False
+        error: BaseException | None = None
+
+        def launch() -> None:
+            route = remaining.popleft()
+            pending[loop.create_task(start(route))] = (route, loop.time())
+
+        self._calls += 1
+        launch()
+        try:
+            while pending:
+                timeout = hedge_after if can_hedge and remaining else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    can_hedge, hedged = False, True
+                    self._hedged += 1
+                    logger.info(
+                        "No %s from %s after %.1fs, hedging with %s",
+                        kind, ", ".join(str(r) for r, _ in pending.values()), hedge_after, remaining[0],
+                    )
+                    launch()
+                    continue
+
+                finished = [(task, *pending.pop(task)) for task in done]
+                for task, route, started in finished:
+                    if task.exception() is None:
+                        self._tracker.record(route, kind, loop.time() - started)
+                        if hedged and route != routes[0]:
+                            self._hedge_wins += 1
+                        await self._cancel(pending, kind, loop.time(), discard)
+                        winner = task.result()
+                        # Another task may have finished in the same tick
+                        for other in done - {task}:
+                            if discard is not None and other.exception() is None:
+                                await discard(other.result())
+                        return winner
+
+                    error = task.exception()
+                    self._tracker.failure(route)
+                    # A failing route must not keep its place because it fails fast
+                    self._tracker.record(route, kind, max(loop.time() - started, hedge_after))
+                    logger.warning("LLM route %s failed: %s", route, error)
+
+                if not pending and remaining:
+                    self._failovers += 1
+                    launch()
+        finally:
+            await self._cancel(pending, kind, loop.time(), discard)
+
+        assert error is not None
+        raise error
+
+    async def _cancel(
+        self,
+        pending: dict[asyncio.Task, tuple[LLMRoute, float]],
+        kind: str,
+        now: float,
+        discard: Callable[[Any], Awaitable[None]] | None,
+    ) -> None:
+        tasks = list(pending)
+        for task, (route, started) in pending.items():
+            task.cancel()
+            self._tracker.record(route, kind, now - started)
+        pending.clear()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if discard is None:
+            return
+        for result in results:
+            # Finished before the cancellation reached it
+            if not isinstance(result, BaseException):
+                await discard(result)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "routes": [str(r) for r in self.routes(RESPONSE)],
+            "calls": self._calls,
+            "hedged": self._hedged,
+            "hedge_wins": self._hedge_wins,
+            "failovers": self._failovers,
+            "latency": self._tracker.stats(),
+        }
+
+
+llm_router = LLMRouter(
+    routes=[
+        LLMRoute(settings.llm_provider, settings.openai_chat_model),
+        *parse_routes(settings.llm_routes),
+    ],
+    tracker=LatencyTracker(
+        window=settings.llm_latency_window,
+        min_samples=settings.llm_latency_min_samples,
+    ),
+)
@@ -2,6 +2,12 @@ import logging
 
 from sentence_transformers import SentenceTransformer
 
+from app.core.config import settings
+from app.services.batching import MicroBatcher
+from app.services.embedding_cache import query_embedding_cache
+from app.services.inference import inference_executor
+from app.services.model_loading import load_text_model
+
 logger = logging.getLogger(__name__)
 
 
@@ -10,9 +16,7 @@ class LocalEmbeddingService:
 
     def _get_model(self) -> SentenceTransformer:
         if self._model is None:
-            LocalEmbeddingService._model = SentenceTransformer(
-                "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-            )
+            LocalEmbeddingService._model = load_text_model(settings.text_embedding_model_name)
         return self._model
 
     def embed_text(self, text: str) -> list[float]:
@@ -24,3 +28,23 @@ class LocalEmbeddingService:
         model = self._get_model()
         embeddings = model.encode(texts)
         return [e.tolist() for e in embeddings]
+
+    async def aembed_text(self, text: str) -> list[float]:
+        cached = await query_embedding_cache.get(text)
+        if cached is not None:
+            return cached
+        embedding = await text_batcher.submit(text)
+        await query_embedding_cache.put(text, embedding)
+        return embedding
+
+    async def aembed_texts(self, texts: list[str]) -> list[list[float]]:
+        return await inference_executor.run(self.embed_texts, texts)
+
+
+text_batcher: MicroBatcher[str, list[float]] = MicroBatcher(
+    name="minilm_text",
+    batch_fn=LocalEmbeddingService().embed_texts,
+    max_batch_size=settings.embedding_batch_max_size,
+    max_wait_ms=settings.embedding_batch_max_wait_ms,
+    max_in_flight=settings.inference_workers,
+)
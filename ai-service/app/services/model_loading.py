@@ -0,0 +1,71 @@
+import logging
+from pathlib import Path
+
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def export_dir(model_name: str) -> Path:
+    """Where app.tools.export_models writes (and the loaders look for) a model's export."""
+    return Path(settings.inference_model_dir) / model_name.replace("/", "__")
+
+
+def quantized_file_name(backend: str) -> str:
+    if backend == "onnx":
+        return f"onnx/model_qint8_{settings.onnx_quantization}.onnx"
+    return "openvino/openvino_model_qint8_quantized.xml"
+
+
+def load_text_model(model_name: str) -> SentenceTransformer:
+    """
+    MiniLM on the configured `inference_backend`.
+
+    For onnx/openvino the int8 export produced by app.tools.export_models
+    is used when present. Without it, sentence-transformers exports an
+    unquantized model on the fly, which works but is slower to start and
+    to run.
+    """
+    backend = settings.inference_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported inference backend: {backend}")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    local = export_dir(model_name)
+    file_name = quantized_file_name(backend)
+    if (local / file_name).exists():
+        logger.info("Loading %s (%s, %s)", model_name, backend, file_name)
+        return SentenceTransformer(str(local), backend=backend, model_kwargs={"file_name": file_name})
+
+    logger.warning(
+        "No quantized %s export of %s in %s; exporting unquantized on the fly "
+        "(run `python -m app.tools.export_models`)",
+        backend,
+        model_name,
+        local,
+    )
+    return SentenceTransformer(model_name, backend=backend)
+
+
+def load_clip_model(model_name: str) -> SentenceTransformer:
+    """
+    CLIP on the configured backend. sentence-transformers cannot run its
+    CLIP module on ONNX Runtime or OpenVINO, so outside the torch backend
+    the Linear layers are int8 dynamically quantized with torch instead.
+    """
+    model = SentenceTransformer(model_name)
+    if settings.inference_backend == "torch" or not settings.clip_quantize:
+        return model
+    return quantize_dynamic(model)
+
+
+def quantize_dynamic(model: SentenceTransformer) -> SentenceTransformer:
+    import torch
+
+    logger.info("Applying int8 dynamic quantization to CLIP")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,159 @@
+import importlib
+import logging
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Fastest first; "auto" picks the first one that is installed
+BACKENDS = ("pymupdf", "pypdfium2", "pypdf2")
+_BACKEND_MODULES = {"pymupdf": "fitz", "pypdfium2": "pypdfium2", "pypdf2": "PyPDF2"}
+
+
+def resolve_backend(name: str) -> str:
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unsupported PDF backend: {name}")
+        return name
+    for candidate in BACKENDS:
+        try:
+            importlib.import_module(_BACKEND_MODULES[candidate])
+        except ImportError:
+            continue
+        return candidate
+    raise RuntimeError("No PDF backend installed")
+
+
+def count_pages(path: str, backend: str) -> int:
+    if backend == "pymupdf":
+        import fitz
+
+        with fitz.open(path) as doc:
+            return doc.page_count
+    if backend == "pypdfium2":
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    import PyPDF2
+
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pages(path: str, backend: str, start: int, end: int) -> list[str]:
+    """Text of pages [start, end). Module-level so process pool workers can pickle it."""
+    if backend == "pymupdf":
+        import fitz
+
+        with fitz.open(path) as doc:
+            return [doc[i].get_text() for i in range(start, end)]
+
+    if backend == "pypdfium2":
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            texts = []
+            for i in range(start, end):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return texts
+        finally:
+            pdf.close()
+
+    import PyPDF2
+
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+class PdfExtractor:
+    """
+    Page-range sharded PDF text extraction.
+
+    Documents longer than one shard are split into `pages_per_shard` page
+    ranges that a process pool extracts in parallel; pages are yielded in
+    document order and at most two shards per worker are in flight, so
+    memory stays bounded for large files. The pool uses the spawn start
+    method so workers never inherit the loaded models or torch threads.
+    """
+
+    def __init__(self, backend: str, workers: int, pages_per_shard: int) -> None:
+        self._backend_name = backend
+        self._backend: str | None = None
+        self._workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self._pages_per_shard = max(1, pages_per_shard)
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def backend(self) -> str:
+        if self._backend is None:
+            self._backend = resolve_backend(self._backend_name)
+            logger.info("PDF extraction backend: %s", self._backend)
+        return self._backend
+
+    def set_workers(self, workers: int) -> None:
+        if self._pool is not None:
+            raise RuntimeError("PDF extraction pool already started")
+        self._workers = max(1, workers)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def iter_pages(self, path: str) -> Iterator[str]:
+        backend = self.backend
+        total = count_pages(path, backend)
+        shard = self._pages_per_shard
+        ranges = ((start, min(start + shard, total)) for start in range(0, total, shard))
+
+        if self._workers <= 1 or total <= shard:
+            for start, end in ranges:
+                yield from (text for text in extract_pages(path, backend, start, end) if text)
+            return
+
+        pool = self._get_pool()
+        in_flight: deque[Future[list[str]]] = deque(
+            pool.submit(extract_pages, path, backend, start, end)
+            for start, end in islice(ranges, self._workers * 2)
+        )
+        try:
+            while in_flight:
+                texts = in_flight.popleft().result()
+                for start, end in islice(ranges, 1):
+                    in_flight.append(pool.submit(extract_pages, path, backend, start, end))
+                yield from (text for text in texts if text)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+pdf_extractor = PdfExtractor(
+    backend=settings.pdf_backend,
+    workers=settings.pdf_extract_workers,
+    pages_per_shard=settings.pdf_pages_per_shard,
+)
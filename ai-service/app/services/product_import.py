@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.services.clip_service import CLIPService
+from app.services.local_embedding import LocalEmbeddingService
+from app.services.product_retrieval import (
+    ProductEmbeddingRecord,
+    ProductRetrievalService,
+    product_embedding_text,
+)
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProductImportItem:
+    product_id: str
+    name: str
+    description: str | None = None
+    user_id: str | None = None
+    # Photos in gallery order as (file name, content); content None means
+    # the file is read from the shared uploads volume
+    images: list[tuple[str, bytes | None]] = field(default_factory=list)
+
+
+@dataclass
+class ProductImportResult:
+    imported: int = 0
+    images_embedded: int = 0
+    # product_id -> why (one of) its photos was left out
+    image_errors: dict[str, str] = field(default_factory=dict)
+
+
+class ProductImportService:
+    """
+    Embeds and stores a whole catalog at batch throughput.
+
+    Photos are read and decoded on worker threads in parallel, one batch of
+    `product_import_batch_size` ahead of the CLIP pass over the previous
+    one, so only two batches of decoded images are in memory at a time.
+    CLIP and MiniLM each run once per batch instead of once per product.
+    All rows are upserted in a single transaction, so an import either lands
+    completely or not at all. A photo that cannot be read or decoded is
+    left out (the product is still imported) and the reason is reported.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self._session = session
+        self._clip_service = CLIPService()
+        self._embedding_service = LocalEmbeddingService()
+
+    async def import_products(self, items: list[ProductImportItem]) -> ProductImportResult:
+        if len(items) > settings.product_import_max_items:
+            raise ValueError(
+                f"At most {settings.product_import_max_items} products can be imported at once"
+            )
+
+        result = ProductImportResult()
+        batch_size = max(1, settings.product_import_batch_size)
+        text_embeddings = await self._embed_texts(
+            [product_embedding_text(item.name, item.description) for item in items],
+            batch_size,
+        )
+        photos = await self._embed_images(items, batch_size, result)
+
+        await ProductRetrievalService(self._session).store_embeddings_bulk(
+            [
+                ProductEmbeddingRecord(
+                    product_id=item.product_id,
+                    name=item.name,
+                    description=item.description or None,
+                    text_embedding=text_embeddings[i],
+                    user_id=item.user_id,
+                    images=photos.get(i),
+                )
+                for i, item in enumerate(items)
+            ]
+        )
+
+        for owner in {item.user_id for item in items}:
+            response_cache.invalidate(owner)
+
+        result.imported = len(items)
+        result.images_embedded = sum(len(p) for p in photos.values())
+        logger.info(
+            "Imported %d products (%d images, %d image errors)",
+            result.imported,
+            result.images_embedded,
+            len(result.image_errors),
+        )
+        return result
+
+    async def _embed_texts(self, texts: list[str], batch_size: int) -> list[list[float]]:
+        embeddings: list[list[float]] = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(
+                await self._embedding_service.aembed_texts(texts[start:start + batch_size])
+            )
+        return embeddings
+
+    async def _decode_batch(
+        self, sources: list[tuple[int, str, bytes | None]]
+    ) -> list[Image.Image | str]:
+        """Decoded images, or an error message in place of each one that failed."""
+
+        async def _load(filename: str, content: bytes | None) -> Image.Image | str:
+            try:
+                return await asyncio.to_thread(_read_and_decode, filename, content)
+            except Exception as e:
+                return f"{filename}: {str(e) or type(e).__name__}"
+
+        return await asyncio.gather(*(_load(filename, content) for _, filename, content in sources))
+
+    async def _embed_images(
+        self,
+        items: list[ProductImportItem],
+        batch_size: int,
+        result: ProductImportResult,
+    ) -> dict[int, list[tuple[str | None, list[float]]]]:
+        """Per-photo vectors by item index; failures go to `result.image_errors`."""
+        sources = [
+            (i, filename, content)
+            for i, item in enumerate(items)
+            for filename, content in item.images
+        ]
+        photos: dict[int, list[tuple[str | None, list[float]]]] = {}
+        pending = asyncio.create_task(self._decode_batch(sources[:batch_size]))
+        try:
+            for start in range(0, len(sources), batch_size):
+                batch = sources[start:start + batch_size]
+                decoded = await pending
+                # Decode the next batch while CLIP runs on this one
+                following = start + batch_size
+                pending = asyncio.create_task(
+                    self._decode_batch(sources[following:following + batch_size])
+                )
+
+                ok: list[tuple[int, str, Image.Image]] = []
+                for (i, filename, _), outcome in zip(batch, decoded):
+                    if isinstance(outcome, Image.Image):
+                        ok.append((i, filename, outcome))
+                    else:
+                        result.image_errors[items[i].product_id] = outcome
+                if not ok:
+                    continue
+
+                vectors = await self._clip_service.aembed_decoded_images([image for _, _, image in ok])
+                for (i, filename, _), vector in zip(ok, vectors):
+                    photos.setdefault(i, []).append((filename, vector))
+        finally:
+            if not pending.done():
+                pending.cancel()
+        return photos
+
+
+def _read_and_decode(filename: str, content: bytes | None) -> Image.Image:
+    if content is None:
+        # Only files directly inside the uploads dir can be referenced
+        content = (Path(settings.product_uploads_dir) / Path(filename).name).read_bytes()
+    return CLIPService.decode_image(content)
@@ -1,15 +1,25 @@
 import logging
+import math
+import uuid
 from dataclasses import dataclass
+from datetime import datetime
 
-from sqlalchemy import delete, select
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute
 
+from app.core.config import settings
+from app.core.vector_index import apply_search_params
 from app.models.product_embedding import ProductEmbedding
+from app.models.product_image_embedding import ProductImageEmbedding
 
 
 logger = logging.getLogger(__name__)
 
+# asyncpg (the Postgres protocol) binds at most this many parameters per statement
+_MAX_BIND_PARAMS = 32767
+
 
 @dataclass
 class ProductSearchResult:
@@ -19,6 +29,50 @@ class ProductSearchResult:
     similarity: float
 
 
+@dataclass
+class ProductEmbeddingRecord:
+    product_id: str
+    name: str
+    description: str | None
+    image_embedding: list[float] | None = None
+    text_embedding: list[float] | None = None
+    user_id: str | None = None
+    # One vector per photo, in gallery order, with the photo's file name if
+    # known. When given they replace the stored photos, and
+    # `image_embedding` defaults to their pooled vector; an empty list
+    # removes the stored photos and the pooled vector.
+    images: list[tuple[str | None, list[float]]] | None = None
+
+
+@dataclass
+class ProductPageRow:
+    id: str
+    product_id: str
+    name: str
+    description: str | None
+
+
+def pool_embeddings(embeddings: list[list[float]]) -> list[float]:
+    """Mean of the L2-normalized vectors, normalized again."""
+    pooled = [0.0] * len(embeddings[0])
+    for embedding in embeddings:
+        norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+        for i, x in enumerate(embedding):
+            pooled[i] += x / norm
+    norm = math.sqrt(sum(x * x for x in pooled)) or 1.0
+    return [x / norm for x in pooled]
+
+
+def product_embedding_text(name: str, description: str | None) -> str:
+    # Repeat name to give it more weight in the embedding vs the long description
+    return f"{name}. {name}. {description or ''}".strip()
+
+
+def _write_batch_size(params_per_row: int) -> int:
+    """Rows per multi-row INSERT: `vector_write_batch_size`, within the bind limit."""
+    return max(1, min(settings.vector_write_batch_size, _MAX_BIND_PARAMS // params_per_row))
+
+
 class ProductRetrievalService:
     def __init__(self, session: AsyncSession) -> None:
         self._session = session
@@ -28,8 +82,11 @@ class ProductRetrievalService:
         embedding_column: InstrumentedAttribute,
         query_embedding: list[float],
         top_k: int = 3,
+        ef_search: int | None = None,
+        user_id: str | None = None,
     ) -> list[ProductSearchResult]:
-        result = await self._session.execute(
+        await apply_search_params(self._session, top_k, ef_search)
+        stmt = (
             select(
                 ProductEmbedding.product_id,
                 ProductEmbedding.product_name,
@@ -39,11 +96,15 @@ class ProductRetrievalService:
                 ).label("similarity"),
             )
             .where(embedding_column.is_not(None))
-            .order_by(embedding_column.cosine_distance(query_embedding))
-            .limit(top_k)
+        )
+        if user_id is not None:
+            stmt = stmt.where(ProductEmbedding.user_id == user_id)
+
+        result = await self._session.execute(
+            stmt.order_by(embedding_column.cosine_distance(query_embedding)).limit(top_k)
         )
         rows = result.fetchall()
-        return [
+        results = [
             ProductSearchResult(
                 product_id=row.product_id,
                 product_name=row.product_name,
@@ -52,19 +113,184 @@ class ProductRetrievalService:
             )
             for row in rows
         ]
+        # Relaxed iterative scans may return rows slightly out of order
+        results.sort(key=lambda r: r.similarity, reverse=True)
+        return results
 
     async def search_by_image(
-        self, image_embedding: list[float], top_k: int = 3
+        self,
+        image_embedding: list[float],
+        top_k: int = 3,
+        ef_search: int | None = None,
+        user_id: str | None = None,
     ) -> list[ProductSearchResult]:
-        return await self._search_by_embedding(
-            ProductEmbedding.image_embedding, image_embedding, top_k
+        if settings.image_search_mode == "pooled":
+            return await self._search_by_embedding(
+                ProductEmbedding.image_embedding, image_embedding, top_k, ef_search, user_id
+            )
+        return await self._search_by_photos(image_embedding, top_k, ef_search, user_id)
+
+    async def _search_by_photos(
+        self,
+        query_embedding: list[float],
+        top_k: int,
+        ef_search: int | None,
+        user_id: str | None,
+    ) -> list[ProductSearchResult]:
+        """
+        One ANN scan over the per-photo index for `top_k * oversample`
+        nearest photos, then the best photo's similarity per product.
+        """
+        candidates = top_k * max(1, settings.image_search_oversample)
+        await apply_search_params(self._session, candidates, ef_search)
+
+        distance = ProductImageEmbedding.embedding.cosine_distance(query_embedding)
+        nearest = select(
+            ProductImageEmbedding.product_id,
+            (1 - distance).label("similarity"),
         )
+        if user_id is not None:
+            nearest = nearest.where(ProductImageEmbedding.user_id == user_id)
+        nearest = nearest.order_by(distance).limit(candidates).subquery()
+
+        best = func.max(nearest.c.similarity).label("similarity")
+        result = await self._session.execute(
+            select(
+                ProductEmbedding.product_id,
+                ProductEmbedding.product_name,
+                ProductEmbedding.product_description,
+                best,
+            )
+            .join(nearest, nearest.c.product_id == ProductEmbedding.product_id)
+            .group_by(
+                ProductEmbedding.product_id,
+                ProductEmbedding.product_name,
+                ProductEmbedding.product_description,
+            )
+            .order_by(best.desc())
+            .limit(top_k)
+        )
+        return [
+            ProductSearchResult(
+                product_id=row.product_id,
+                product_name=row.product_name,
+                product_description=row.product_description,
+                similarity=float(row.similarity),
+            )
+            for row in result.fetchall()
+        ]
 
     async def search_by_text(
-        self, text_embedding: list[float], top_k: int = 3
+        self,
+        text_embedding: list[float],
+        top_k: int = 3,
+        ef_search: int | None = None,
+        user_id: str | None = None,
     ) -> list[ProductSearchResult]:
         return await self._search_by_embedding(
-            ProductEmbedding.text_embedding, text_embedding, top_k
+            ProductEmbedding.text_embedding, text_embedding, top_k, ef_search, user_id
+        )
+
+    async def get_catalog_details(self, product_ids: list[str]) -> dict[str, dict]:
+        """
+        Price, stock and dimensions from the backend's `products` table,
+        which lives in the same database. Returns {} if it is unavailable.
+        """
+        if not product_ids:
+            return {}
+        try:
+            result = await self._session.execute(
+                text(
+                    "SELECT id, description, width, height, depth, weight, price, quantity "
+                    "FROM products WHERE id = ANY(:ids)"
+                ).bindparams(bindparam("ids", type_=ARRAY(UUID(as_uuid=False)))),
+                {"ids": product_ids},
+            )
+        except Exception as e:
+            logger.warning("Could not load catalog details: %s", e)
+            await self._session.rollback()
+            return {}
+        return {str(row.id): dict(row._mapping) for row in result.fetchall()}
+
+    async def get_image_filenames(self, product_ids: list[str]) -> dict[str, list[str]]:
+        """
+        Photos of each product from the backend's tables in gallery order,
+        falling back to the legacy `imagePath`. Returns {} if they are
+        unavailable.
+        """
+        if not product_ids:
+            return {}
+        try:
+            result = await self._session.execute(
+                text(
+                    "SELECT pi.\"productId\" AS id, pi.filename, pi.\"sortOrder\" AS position, "
+                    "  pi.\"createdAt\" AS created_at "
+                    "FROM product_images pi WHERE pi.\"productId\" = ANY(:ids) "
+                    "UNION ALL "
+                    "SELECT p.id, p.\"imagePath\", 0, p.\"createdAt\" "
+                    "FROM products p WHERE p.id = ANY(:ids) AND p.\"imagePath\" IS NOT NULL "
+                    "  AND NOT EXISTS (SELECT 1 FROM product_images pi WHERE pi.\"productId\" = p.id) "
+                    "ORDER BY id, position, created_at"
+                ).bindparams(bindparam("ids", type_=ARRAY(UUID(as_uuid=False)))),
+                {"ids": product_ids},
+            )
+        except Exception as e:
+            logger.warning("Could not load product images: %s", e)
+            await self._session.rollback()
+            return {}
+        filenames: dict[str, list[str]] = {}
+        for row in result.fetchall():
+            if row.filename:
+                filenames.setdefault(str(row.id), []).append(row.filename)
+        return filenames
+
+    async def get_page(self, after: str | None, limit: int) -> list[ProductPageRow]:
+        """
+        Keyset page of products ordered by product_id, starting after
+        `after`. Embeddings are not loaded.
+        """
+        stmt = (
+            select(
+                ProductEmbedding.id,
+                ProductEmbedding.product_id,
+                ProductEmbedding.product_name,
+                ProductEmbedding.product_description,
+            )
+            .order_by(ProductEmbedding.product_id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.where(ProductEmbedding.product_id > after)
+        result = await self._session.execute(stmt)
+        return [
+            ProductPageRow(
+                id=row.id,
+                product_id=row.product_id,
+                name=row.product_name,
+                description=row.product_description,
+            )
+            for row in result.fetchall()
+        ]
+
+    async def count(self) -> int:
+        result = await self._session.execute(select(func.count()).select_from(ProductEmbedding))
+        return int(result.scalar_one())
+
+    async def update_embeddings_bulk(
+        self,
+        column: str,
+        embeddings: list[tuple[str, list[float]]],
+    ) -> None:
+        """
+        embeddings: list of (row id, embedding) for `column`, written as one
+        executemany UPDATE by primary key. Does not commit.
+        """
+        if not embeddings:
+            return
+        now = datetime.utcnow()
+        await self._session.execute(
+            update(ProductEmbedding),
+            [{"id": row_id, column: embedding, "updated_at": now} for row_id, embedding in embeddings],
         )
 
     async def get_all(self) -> list[ProductEmbedding]:
@@ -78,41 +304,153 @@ class ProductRetrievalService:
         description: str | None,
         image_embedding: list[float] | None,
         text_embedding: list[float] | None,
+        user_id: str | None = None,
+        images: list[tuple[str | None, list[float]]] | None = None,
     ) -> None:
-        existing = await self._session.execute(
-            select(ProductEmbedding).where(
-                ProductEmbedding.product_id == product_id
-            )
-        )
-        row = existing.scalar_one_or_none()
-
-        if row:
-            row.product_name = name
-            row.product_description = description
-            if image_embedding is not None:
-                row.image_embedding = image_embedding
-            if text_embedding is not None:
-                row.text_embedding = text_embedding
-        else:
-            self._session.add(
-                ProductEmbedding(
+        await self.store_embeddings_bulk(
+            [
+                ProductEmbeddingRecord(
                     product_id=product_id,
-                    product_name=name,
-                    product_description=description,
+                    name=name,
+                    description=description,
                     image_embedding=image_embedding,
                     text_embedding=text_embedding,
+                    user_id=user_id,
+                    images=images,
+                )
+            ]
+        )
+
+    async def store_embeddings_bulk(
+        self,
+        records: list[ProductEmbeddingRecord],
+        commit: bool = True,
+    ) -> None:
+        """
+        Upsert many products with one INSERT ... ON CONFLICT (product_id)
+        DO UPDATE per `vector_write_batch_size` rows (fewer if the batch
+        would bind too many parameters). As with the single upsert, a
+        missing embedding or owner keeps the stored one. Records with
+        per-photo vectors replace the product's stored photos.
+        """
+        if not records:
+            return
+
+        # Later records for the same product win, as sequential upserts would
+        latest = {r.product_id: r for r in records}
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "product_id": r.product_id,
+                "user_id": r.user_id,
+                "product_name": r.name,
+                "product_description": r.description,
+                "image_embedding": (
+                    r.image_embedding
+                    if r.image_embedding is not None or not r.images
+                    else pool_embeddings([embedding for _, embedding in r.images])
+                ),
+                "text_embedding": r.text_embedding,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for r in latest.values()
+        ]
+
+        batch_size = _write_batch_size(len(rows[0]))
+        for start in range(0, len(rows), batch_size):
+            stmt = insert(ProductEmbedding).values(rows[start:start + batch_size])
+            excluded = stmt.excluded
+            await self._session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[ProductEmbedding.product_id],
+                    set_={
+                        "product_name": excluded.product_name,
+                        "product_description": excluded.product_description,
+                        "user_id": func.coalesce(excluded.user_id, ProductEmbedding.user_id),
+                        "image_embedding": func.coalesce(
+                            excluded.image_embedding, ProductEmbedding.image_embedding
+                        ),
+                        "text_embedding": func.coalesce(
+                            excluded.text_embedding, ProductEmbedding.text_embedding
+                        ),
+                        "updated_at": excluded.updated_at,
+                    },
                 )
             )
 
-        await self._session.commit()
+        await self.replace_image_embeddings(
+            {r.product_id: r.images for r in latest.values() if r.images is not None}
+        )
+        cleared = [pid for pid, r in latest.items() if r.images == []]
+        if cleared:
+            await self._session.execute(
+                update(ProductEmbedding)
+                .where(ProductEmbedding.product_id.in_(cleared))
+                .values(image_embedding=None)
+            )
+        await self._sync_image_owners([pid for pid, r in latest.items() if r.images is None])
+
+        if commit:
+            await self._session.commit()
 
-    async def delete_embeddings(self, product_id: str) -> None:
+    async def replace_image_embeddings(
+        self, images: dict[str, list[tuple[str | None, list[float]]]]
+    ) -> None:
+        """
+        images: product_id -> list of (filename, embedding) in gallery order.
+        Replaces each product's per-photo rows (an empty list deletes them).
+        Does not commit.
+        """
+        if not images:
+            return
+        product_ids = list(images)
         await self._session.execute(
-            delete(ProductEmbedding).where(
-                ProductEmbedding.product_id == product_id
+            delete(ProductImageEmbedding).where(ProductImageEmbedding.product_id.in_(product_ids))
+        )
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "product_id": product_id,
+                "position": position,
+                "filename": filename,
+                "embedding": embedding,
+            }
+            for product_id, photos in images.items()
+            for position, (filename, embedding) in enumerate(photos)
+        ]
+        batch_size = _write_batch_size(len(rows[0])) if rows else 1
+        for start in range(0, len(rows), batch_size):
+            await self._session.execute(
+                insert(ProductImageEmbedding).values(rows[start:start + batch_size])
             )
+        await self._sync_image_owners(product_ids)
+
+    async def _sync_image_owners(self, product_ids: list[str]) -> None:
+        if not product_ids:
+            return
+        # The owner may come from the stored product row, so copy it from there
+        await self._session.execute(
+            update(ProductImageEmbedding)
+            .where(ProductImageEmbedding.product_id.in_(product_ids))
+            .values(
+                user_id=select(ProductEmbedding.user_id)
+                .where(ProductEmbedding.product_id == ProductImageEmbedding.product_id)
+                .scalar_subquery()
+            )
+        )
+
+    async def delete_embeddings(self, product_id: str) -> str | None:
+        """Delete a product's embeddings and return its owner, if known."""
+        result = await self._session.execute(
+            delete(ProductEmbedding)
+            .where(ProductEmbedding.product_id == product_id)
+            .returning(ProductEmbedding.user_id)
         )
+        row = result.first()
         await self._session.commit()
+        return row.user_id if row else None
 
     async def update_text_embedding(
         self,
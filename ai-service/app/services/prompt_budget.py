@@ -0,0 +1,195 @@
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+from app.services.chunking import token_encoder
+from app.services.retrieval import RetrievedChunk
+
+# Role and separator tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# A chunk that would have to be cut below this is dropped instead
+_MIN_CHUNK_TOKENS = 32
+
+_ELLIPSIS = "…"
+
+
+@dataclass
+class PromptUsage:
+    """Token breakdown of one prompt; `system` covers instructions and section headers."""
+
+    system: int = 0
+    documents: int = 0
+    products: int = 0
+    cart: int = 0
+    summary: int = 0
+    history: int = 0
+    message: int = 0
+    total: int = 0
+    # Reported by the provider after the call: prompt tokens served from its cache
+    cached: int = 0
+    chunks_dropped: int = 0
+    turns_dropped: int = 0
+    truncated: list[str] = field(default_factory=list)
+
+
+@dataclass
+class PackedContext:
+    chunks: list[RetrievedChunk]
+    product_context: str | None
+    cart_context: str | None
+    history: list[dict[str, str]]
+    usage: PromptUsage
+
+
+def count_tokens(text: str) -> int:
+    return len(token_encoder().encode(text)) if text else 0
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    return sum(
+        count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages
+    )
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoder = token_encoder()
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - 1)
+    while True:
+        # A cut inside a multi-byte (e.g. Cyrillic) character leaves part of
+        # it behind; drop that rather than decode it to U+FFFD
+        cut = encoder.decode_bytes(tokens[:keep]).decode("utf-8", "ignore").rstrip() + _ELLIPSIS
+        # Re-encoded, the cut text may take more tokens than it was cut to
+        if keep == 0 or len(encoder.encode(cut)) <= max_tokens:
+            return cut
+        keep -= 1
+
+
+def _limit(budget: int) -> float:
+    return budget if budget > 0 else float("inf")
+
+
+def _spare(budget: float, used: int) -> float:
+    # An unlimited section has nothing to hand on
+    return budget - used if budget != float("inf") else 0
+
+
+class PromptBudgetPlanner:
+    """
+    Fits the variable parts of a prompt into per-section token budgets.
+
+    Product and cart text is packed first and cut at its budget. Document
+    chunks are then added best match first until the document budget
+    (plus whatever products and cart left over) is used up; the chunk that
+    crosses the line is cut if a useful part of it still fits, and the
+    rest are dropped. History keeps the newest turns that fit into its
+    budget plus what documents left, at most `max_turns` of them.
+    """
+
+    def __init__(
+        self,
+        documents: int,
+        products: int,
+        cart: int,
+        history: int,
+        max_turns: int,
+    ) -> None:
+        self._documents = _limit(documents)
+        self._products = _limit(products)
+        self._cart = _limit(cart)
+        self._history = _limit(history)
+        self._max_turns = max(0, max_turns)
+
+    def pack(
+        self,
+        chunks: list[RetrievedChunk],
+        product_context: str | None,
+        cart_context: str | None,
+        history: list[dict[str, str]] | None,
+    ) -> PackedContext:
+        usage = PromptUsage()
+
+        product_context, usage.products = self._pack_text(
+            product_context, self._products, "products", usage
+        )
+        cart_context, usage.cart = self._pack_text(cart_context, self._cart, "cart", usage)
+
+        documents = self._documents + _spare(self._products, usage.products) + _spare(self._cart, usage.cart)
+        kept_chunks, usage.documents = self._pack_chunks(chunks, documents, usage)
+
+        history_budget = self._history + _spare(documents, usage.documents)
+        kept_history, usage.history = self._pack_history(history or [], history_budget, usage)
+
+        return PackedContext(
+            chunks=kept_chunks,
+            product_context=product_context,
+            cart_context=cart_context,
+            history=kept_history,
+            usage=usage,
+        )
+
+    def _pack_text(
+        self, text: str | None, budget: float, section: str, usage: PromptUsage
+    ) -> tuple[str | None, int]:
+        if not text:
+            return text, 0
+        tokens = count_tokens(text)
+        if tokens <= budget:
+            return text, tokens
+        usage.truncated.append(section)
+        text = truncate_tokens(text, int(budget))
+        return text, count_tokens(text)
+
+    def _pack_chunks(
+        self, chunks: list[RetrievedChunk], budget: float, usage: PromptUsage
+    ) -> tuple[list[RetrievedChunk], int]:
+        kept: list[RetrievedChunk] = []
+        used = 0
+        for chunk in sorted(chunks, key=lambda c: c.similarity, reverse=True):
+            # Chunks are joined with a blank line
+            tokens = count_tokens(chunk.content) + (2 if kept else 0)
+            if used + tokens <= budget:
+                kept.append(chunk)
+                used += tokens
+                continue
+
+            room = int(budget - used) - (2 if kept else 0)
+            if room >= _MIN_CHUNK_TOKENS:
+                content = truncate_tokens(chunk.content, room)
+                kept.append(RetrievedChunk(
+                    content=content,
+                    file_id=chunk.file_id,
+                    chunk_index=chunk.chunk_index,
+                    similarity=chunk.similarity,
+                ))
+                used += count_tokens(content) + (2 if len(kept) > 1 else 0)
+                usage.truncated.append("documents")
+            else:
+                usage.chunks_dropped += 1
+        return kept, used
+
+    def _pack_history(
+        self, history: list[dict[str, str]], budget: float, usage: PromptUsage
+    ) -> tuple[list[dict[str, str]], int]:
+        kept: list[dict[str, str]] = []
+        used = 0
+        for turn in reversed(history[-self._max_turns:] if self._max_turns else []):
+            tokens = count_message_tokens([turn])
+            if used + tokens > budget:
+                break
+            kept.append(turn)
+            used += tokens
+        usage.turns_dropped = len(history) - len(kept)
+        kept.reverse()
+        return kept, used
+
+
+prompt_budget = PromptBudgetPlanner(
+    documents=settings.prompt_budget_documents,
+    products=settings.prompt_budget_products,
+    cart=settings.prompt_budget_cart,
+    history=settings.prompt_budget_history,
+    max_turns=settings.prompt_history_max_turns,
+)
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_factory, engine
+from app.models.reembed_checkpoint import ReembedCheckpoint
+from app.services.clip_service import CLIPService
+from app.services.local_embedding import LocalEmbeddingService
+from app.services.product_retrieval import (
+    ProductPageRow,
+    ProductRetrievalService,
+    pool_embeddings,
+    product_embedding_text,
+)
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("text", "image", "all")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class ReembedJobManager:
+    """
+    Catalog re-embedding jobs that survive failures and restarts.
+
+    A job walks `product_embeddings` in product_id order one keyset page of
+    `reembed_batch_size` rows at a time, embeds the page in one batch per
+    model and writes it with a single executemany UPDATE. The batch and
+    the job's checkpoint commit together, so a failed or interrupted job
+    resumes exactly after the last written page; jobs still marked running
+    at startup are resumed automatically. Rows are updated in place and
+    searches keep working throughout, with `processed`/`total` showing how
+    far a model upgrade has rolled out.
+
+    With several web workers every one of them tries to resume at startup;
+    a Postgres advisory lock held for the run makes sure only one does, and
+    a job cancelled through another worker stops after its current page.
+    """
+
+    def __init__(self, batch_size: int) -> None:
+        self._batch_size = max(1, batch_size)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._clip_service = CLIPService()
+        self._embedding_service = LocalEmbeddingService()
+        self._batches = 0
+        self._products = 0
+
+    async def start(self) -> None:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(ReembedCheckpoint.id).where(ReembedCheckpoint.status.in_(ACTIVE_STATUSES))
+            )
+            interrupted = [row.id for row in result.fetchall()]
+        for job_id in interrupted:
+            logger.info("Resuming re-embedding job %s", job_id)
+            self._launch(job_id)
+
+    async def stop(self) -> None:
+        # Checkpoints stay "running", so the next start picks the jobs up again
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def submit(self, kind: str) -> ReembedCheckpoint:
+        if kind not in KINDS:
+            raise ValueError(f"Unsupported re-embedding kind: {kind}")
+
+        async with async_session_factory() as session:
+            if self._tasks or await _count_active(session):
+                raise RuntimeError("A re-embedding job is already running")
+            checkpoint = ReembedCheckpoint(kind=kind)
+            session.add(checkpoint)
+            await session.commit()
+        self._launch(checkpoint.id)
+        return checkpoint
+
+    async def get(self, job_id: str) -> ReembedCheckpoint | None:
+        async with async_session_factory() as session:
+            return await session.get(ReembedCheckpoint, job_id)
+
+    async def cancel(self, job_id: str) -> ReembedCheckpoint | None:
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        async with async_session_factory() as session:
+            checkpoint = await session.get(ReembedCheckpoint, job_id)
+            if checkpoint is not None and checkpoint.status in ACTIVE_STATUSES:
+                checkpoint.status = "cancelled"
+                checkpoint.finished_at = datetime.utcnow()
+                await session.commit()
+            return checkpoint
+
+    async def resume(self, job_id: str) -> ReembedCheckpoint | None:
+        async with async_session_factory() as session:
+            checkpoint = await session.get(ReembedCheckpoint, job_id)
+            if checkpoint is None or checkpoint.status not in ("failed", "cancelled"):
+                return checkpoint
+            if self._tasks or await _count_active(session):
+                raise RuntimeError("A re-embedding job is already running")
+            checkpoint.status = "queued"
+            checkpoint.error = None
+            checkpoint.finished_at = None
+            await session.commit()
+        self._launch(job_id)
+        return checkpoint
+
+    async def wait(self, job_id: str) -> None:
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+
+    def _launch(self, job_id: str) -> None:
+        task = asyncio.create_task(self._run(job_id), name=f"reembed-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda t: self._forget(job_id, t))
+
+    def _forget(self, job_id: str, task: asyncio.Task) -> None:
+        # A resumed job reuses its id; only drop the entry if it is still this task
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+
+    async def _run(self, job_id: str) -> None:
+        key = f"reembed:{job_id}"
+        async with engine.connect() as lock_conn:
+            lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+            locked = await lock_conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": key}
+            )
+            if not locked:
+                logger.info("Re-embedding job %s is run by another worker", job_id)
+                return
+            try:
+                await self._process(job_id)
+            finally:
+                await asyncio.shield(
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
+                )
+
+    async def _process(self, job_id: str) -> None:
+        async with async_session_factory() as session:
+            checkpoint = await session.get(ReembedCheckpoint, job_id)
+            if checkpoint is None or checkpoint.status not in ACTIVE_STATUSES:
+                return
+            checkpoint.status = "running"
+            checkpoint.total = await ProductRetrievalService(session).count()
+            kind = checkpoint.kind
+            cursor = checkpoint.last_product_id
+            await session.commit()
+
+        try:
+            while True:
+                async with async_session_factory() as session:
+                    page = await ProductRetrievalService(session).get_page(cursor, self._batch_size)
+                if not page:
+                    break
+
+                # Embed outside any session so no connection is held while the models run
+                text_embeddings = (
+                    await self._embed_texts(page) if kind in ("text", "all") else []
+                )
+                image_embeddings, photos, skipped = (
+                    await self._embed_images(page) if kind in ("image", "all") else ([], {}, 0)
+                )
+
+                async with async_session_factory() as session:
+                    checkpoint = await session.get(ReembedCheckpoint, job_id)
+                    if checkpoint is None or checkpoint.status != "running":
+                        logger.info("Re-embedding job %s was cancelled through another worker", job_id)
+                        return
+                    retrieval = ProductRetrievalService(session)
+                    await retrieval.update_embeddings_bulk("text_embedding", text_embeddings)
+                    await retrieval.update_embeddings_bulk("image_embedding", image_embeddings)
+                    await retrieval.replace_image_embeddings(photos)
+                    checkpoint.last_product_id = cursor = page[-1].product_id
+                    checkpoint.processed += len(page)
+                    checkpoint.text_updated += len(text_embeddings)
+                    checkpoint.images_updated += len(image_embeddings)
+                    checkpoint.images_skipped += skipped
+                    await session.commit()
+
+                self._batches += 1
+                self._products += len(page)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Re-embedding job %s failed: %s", job_id, e)
+            await self._finish(job_id, "failed", str(e))
+        else:
+            await self._finish(job_id, "succeeded")
+        finally:
+            response_cache.invalidate()
+
+    async def _finish(self, job_id: str, status: str, error: str | None = None) -> None:
+        async with async_session_factory() as session:
+            checkpoint = await session.get(ReembedCheckpoint, job_id)
+            if checkpoint is None:
+                return
+            checkpoint.status = status
+            checkpoint.error = error
+            checkpoint.finished_at = datetime.utcnow()
+            await session.commit()
+
+    async def _embed_texts(self, page: list[ProductPageRow]) -> list[tuple[str, list[float]]]:
+        embeddings = await self._embedding_service.aembed_texts(
+            [product_embedding_text(p.name, p.description) for p in page]
+        )
+        return [(p.id, embedding) for p, embedding in zip(page, embeddings)]
+
+    async def _embed_images(
+        self, page: list[ProductPageRow]
+    ) -> tuple[
+        list[tuple[str, list[float]]],
+        dict[str, list[tuple[str | None, list[float]]]],
+        int,
+    ]:
+        """
+        Embeds every photo of the page in one CLIP batch. Returns pooled
+        (row id, embedding) pairs, per-photo vectors by product_id, and how
+        many products had no usable photo.
+        """
+        async with async_session_factory() as session:
+            filenames = await ProductRetrievalService(session).get_image_filenames(
+                [p.product_id for p in page]
+            )
+        images = await asyncio.to_thread(_read_images, page, filenames)
+        if not images:
+            return [], {}, len(page)
+
+        try:
+            vectors: list[list[float] | None] = list(
+                await self._clip_service.aembed_images([image for _, _, image in images])
+            )
+        except Exception as e:
+            # One undecodable image should not fail the whole page
+            logger.warning("Batch image embedding failed, retrying one by one: %s", e)
+            vectors = []
+            for _, filename, image in images:
+                try:
+                    (vector,) = await self._clip_service.aembed_images([image])
+                except Exception as e:
+                    logger.warning("Skipping image %s: %s", filename, e)
+                    vector = None
+                vectors.append(vector)
+
+        by_product = {p.product_id: p for p in page}
+        photos: dict[str, list[tuple[str | None, list[float]]]] = {}
+        for (product_id, filename, _), vector in zip(images, vectors):
+            if vector is not None:
+                photos.setdefault(product_id, []).append((filename, vector))
+
+        pooled = [
+            (by_product[product_id].id, pool_embeddings([v for _, v in product_photos]))
+            for product_id, product_photos in photos.items()
+        ]
+        return pooled, photos, len(page) - len(photos)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "running": len(self._tasks),
+            "batches": self._batches,
+            "products": self._products,
+        }
+
+
+async def _count_active(session: AsyncSession) -> int:
+    return await session.scalar(
+        select(func.count()).select_from(ReembedCheckpoint).where(
+            ReembedCheckpoint.status.in_(ACTIVE_STATUSES)
+        )
+    )
+
+
+def _read_images(
+    page: list[ProductPageRow], filenames: dict[str, list[str]]
+) -> list[tuple[str, str, bytes]]:
+    """(product_id, filename, bytes) of every readable photo, in gallery order."""
+    uploads = Path(settings.product_uploads_dir)
+    images: list[tuple[str, str, bytes]] = []
+    for p in page:
+        for filename in filenames.get(p.product_id, []):
+            # Filenames come from the backend's tables; never follow a path out of the uploads dir
+            path = uploads / Path(filename).name
+            try:
+                images.append((p.product_id, filename, path.read_bytes()))
+            except OSError:
+                continue
+    return images
+
+
+reembed_jobs = ReembedJobManager(batch_size=settings.reembed_batch_size)
@@ -0,0 +1,141 @@
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    tenant: str
+    context_hash: str
+    embedding: list[float]
+    reply: str
+    expires_at: float
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+class SemanticResponseCache:
+    """
+    LRU cache of LLM replies keyed by tenant, retrieved-context hash and
+    query embedding.
+
+    A lookup only considers entries with the same tenant and identical
+    context hash (same documents, products, cart, client facts and the
+    dialogue so far), and returns the best reply whose query embedding is
+    within `similarity_threshold` cosine similarity. Entries expire after
+    `ttl` and are dropped when the tenant's documents or products change.
+    The cache is per process; with a publisher set, invalidations are also
+    announced to the other workers.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float) -> None:
+        self._max_entries = max(1, max_entries)
+        self._ttl = ttl_seconds
+        self._threshold = similarity_threshold
+        self._entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self._by_scope: dict[tuple[str, str], set[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._publisher: Callable[[str | None], None] | None = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def lookup(self, tenant: str, context_hash: str, embedding: list[float]) -> str | None:
+        query = _normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            best_id, best_score = None, self._threshold
+            for entry_id in list(self._by_scope.get((tenant, context_hash), ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query, entry.embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id].reply
+
+    def store(self, tenant: str, context_hash: str, embedding: list[float], reply: str) -> None:
+        entry = _CacheEntry(
+            tenant=tenant,
+            context_hash=context_hash,
+            embedding=_normalize(embedding),
+            reply=reply,
+            expires_at=time.monotonic() + self._ttl,
+        )
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._by_scope.setdefault((tenant, context_hash), set()).add(entry_id)
+            while len(self._entries) > self._max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._evictions += 1
+
+    def set_publisher(self, publisher: Callable[[str | None], None] | None) -> None:
+        self._publisher = publisher
+
+    def invalidate(self, tenant: str | None = None, broadcast: bool = True) -> None:
+        """Drop every entry of `tenant`, or everything when the tenant is unknown."""
+        if broadcast and self._publisher is not None:
+            self._publisher(tenant)
+        with self._lock:
+            if tenant is None:
+                self._entries.clear()
+                self._by_scope.clear()
+            else:
+                for scope in [s for s in self._by_scope if s[0] == tenant]:
+                    for entry_id in list(self._by_scope[scope]):
+                        self._remove(entry_id)
+            self._invalidations += 1
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        scope = (entry.tenant, entry.context_hash)
+        ids = self._by_scope.get(scope)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_scope[scope]
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+response_cache = SemanticResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    similarity_threshold=settings.response_cache_similarity_threshold,
+)
@@ -1,16 +1,37 @@
+import csv
+import io
 import logging
+import uuid
 from dataclasses import dataclass
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.vector_index import apply_search_params
 from app.models.chunk import DocumentChunk
+from app.services.chunking import hash_content
 from app.services.local_embedding import LocalEmbeddingService
 
 logger = logging.getLogger(__name__)
 
 
+_COPY_COLUMNS = [
+    "id",
+    "file_id",
+    "user_id",
+    "content",
+    "chunk_index",
+    "token_count",
+    "content_hash",
+    "embedding",
+]
+
+
+def _vector_literal(embedding: list[float]) -> str:
+    return "[" + ",".join(str(float(x)) for x in embedding) + "]"
+
+
 @dataclass
 class RetrievedChunk:
     content: str
@@ -19,19 +40,35 @@ class RetrievedChunk:
     similarity: float
 
 
+@dataclass
+class StoredChunk:
+    id: str
+    user_id: str
+    content_hash: str | None
+    chunk_index: int
+
+
 class RetrievalService:
     def __init__(self, session: AsyncSession) -> None:
         self._session = session
         self._embedding_service = LocalEmbeddingService()
 
+    async def embed_query(self, query: str) -> list[float]:
+        return await self._embedding_service.aembed_text(query)
+
     async def similarity_search(
         self,
         query: str,
         user_id: str,
         top_k: int | None = None,
+        ef_search: int | None = None,
+        query_embedding: list[float] | None = None,
     ) -> list[RetrievedChunk]:
         k = top_k or settings.top_k_results
-        query_embedding = self._embedding_service.embed_text(query)
+        if query_embedding is None:
+            query_embedding = await self.embed_query(query)
+
+        await apply_search_params(self._session, k, ef_search)
 
         result = await self._session.execute(
             select(
@@ -52,7 +89,7 @@ class RetrievalService:
 
         rows = result.fetchall()
 
-        return [
+        chunks = [
             RetrievedChunk(
                 content=row.content,
                 file_id=row.file_id,
@@ -61,6 +98,9 @@ class RetrievalService:
             )
             for row in rows
         ]
+        # Relaxed iterative scans may return rows slightly out of order
+        chunks.sort(key=lambda c: c.similarity, reverse=True)
+        return chunks
 
     async def store_chunks(
         self,
@@ -70,24 +110,86 @@ class RetrievalService:
     ) -> None:
         """
         chunks_with_embeddings: list of (content, chunk_index, token_count, embedding)
+
+        Rows are streamed with COPY in batches of `vector_write_batch_size`
+        instead of one ORM INSERT each. CSV rather than binary COPY, so the
+        vector column needs no asyncpg codec on the pooled connection
+        (which would change how the ORM binds vectors on it).
         """
-        objects = [
-            DocumentChunk(
-                file_id=file_id,
-                user_id=user_id,
-                content=content,
-                chunk_index=chunk_index,
-                token_count=token_count,
-                embedding=embedding,
+        if not chunks_with_embeddings:
+            return
+
+        connection = await self._session.connection()
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        batch_size = max(1, settings.vector_write_batch_size)
+
+        for start in range(0, len(chunks_with_embeddings), batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for content, chunk_index, token_count, embedding in chunks_with_embeddings[start:start + batch_size]:
+                writer.writerow(
+                    (
+                        str(uuid.uuid4()),
+                        file_id,
+                        user_id,
+                        content,
+                        chunk_index,
+                        token_count,
+                        hash_content(content),
+                        _vector_literal(embedding),
+                    )
+                )
+            await driver.copy_to_table(
+                DocumentChunk.__tablename__,
+                source=io.BytesIO(buffer.getvalue().encode("utf-8")),
+                columns=_COPY_COLUMNS,
+                format="csv",
+            )
+
+        await self._session.commit()
+
+    async def delete_chunks_by_file(self, file_id: str) -> set[str]:
+        """Delete a file's chunks and return the owners they belonged to."""
+        result = await self._session.execute(
+            delete(DocumentChunk)
+            .where(DocumentChunk.file_id == file_id)
+            .returning(DocumentChunk.user_id)
+        )
+        owners = {row.user_id for row in result.fetchall()}
+        await self._session.commit()
+        return owners
+
+    async def get_file_chunks(self, file_id: str) -> list[StoredChunk]:
+        """Identity, hash and position of a file's chunks, without content or embeddings."""
+        result = await self._session.execute(
+            select(
+                DocumentChunk.id,
+                DocumentChunk.user_id,
+                DocumentChunk.content_hash,
+                DocumentChunk.chunk_index,
+            ).where(DocumentChunk.file_id == file_id)
+        )
+        return [
+            StoredChunk(
+                id=row.id,
+                user_id=row.user_id,
+                content_hash=row.content_hash,
+                chunk_index=row.chunk_index,
             )
-            for content, chunk_index, token_count, embedding in chunks_with_embeddings
+            for row in result.fetchall()
         ]
 
-        self._session.add_all(objects)
+    async def update_chunk_indexes(self, indexes: list[tuple[str, int]]) -> None:
+        """indexes: list of (chunk_id, chunk_index)"""
+        await self._session.execute(
+            update(DocumentChunk),
+            [{"id": chunk_id, "chunk_index": index} for chunk_id, index in indexes],
+        )
         await self._session.commit()
 
-    async def delete_chunks_by_file(self, file_id: str) -> None:
+    async def delete_chunks(self, chunk_ids: list[str]) -> None:
         await self._session.execute(
-            delete(DocumentChunk).where(DocumentChunk.file_id == file_id)
+            delete(DocumentChunk).where(DocumentChunk.id.in_(chunk_ids))
         )
         await self._session.commit()
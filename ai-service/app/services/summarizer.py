@@ -0,0 +1,307 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import async_session_factory
+from app.models.conversation import HistorySummary
+from app.services.conversations import ConversationState, conversations
+from app.services.llm import prompt_cache_stats
+from app.services.llm_client import llm_clients
+
+logger = logging.getLogger(__name__)
+
+# Turns hashed into the key of a summary of a named customer's history:
+# the last turn it covers and the ones before it
+_ANCHOR_TURNS = 3
+
+_SUMMARY_INSTRUCTIONS = (
+    "Ты ведёшь краткое резюме переписки продавца-консультанта с клиентом. "
+    "Обнови резюме с учётом новых сообщений. Сохрани то, что важно для "
+    "продолжения разговора: что клиент ищет и для чего, названные товары, "
+    "цены и количества, что добавлено в корзину или заказано, договорённости "
+    "и открытые вопросы. Пиши кратко, обычным текстом, в третьем лице, "
+    "без приветствий и без выдуманных деталей."
+)
+
+
+@dataclass
+class SummarizedHistory:
+    # Running summary of the turns before `turns`, if there is one yet
+    summary: str | None
+    turns: list[dict[str, str]]
+
+
+def _transcript(turns: list[dict[str, str]]) -> str:
+    speakers = {"user": "Клиент", "assistant": "Продавец"}
+    return "\n".join(
+        f"{speakers.get(t['role'], 'Система')}: {t['content']}"
+        for t in turns
+        if t.get("content")
+    )
+
+
+class ConversationSummarizer:
+    """
+    Replaces turns older than the last `window` with a rolling summary.
+
+    A chat request gets the latest summary there is plus the turns after
+    it, so the prompt carries a short summary and a handful of raw turns
+    however long the dialogue runs. Once `batch` turns beyond the window
+    are not covered by the summary, a background task asks the LLM to
+    fold them into it; the request that noticed does not wait, and turns
+    stay in the prompt verbatim until the new summary is ready.
+
+    Server-side conversations keep their summary in Postgres, so every
+    worker shares it. So does history sent by the caller (which may be a
+    sliding window of the dialogue) when the caller names the customer
+    (`peer_id`): one row per customer holds the summary and a key of the
+    last few turns it covers, so it is found again as long as that turn
+    is still in the history. A refresh only replaces the row it extended,
+    so when several workers summarize at once every prompt still gets the
+    same text. Without a customer, summaries are cached per worker and
+    keyed by everything they cover, so customers of one tenant never
+    share one.
+    """
+
+    def __init__(self, window: int, batch: int, max_entries: int, concurrency: int) -> None:
+        self._window = max(1, window)
+        self._batch = max(1, batch)
+        self._max_entries = max(1, max_entries)
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._semaphore: asyncio.Semaphore | None = None
+        self._concurrency = max(1, concurrency)
+        self._running: dict[str, asyncio.Task] = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._failures = 0
+
+    async def for_history(
+        self, user_id: str, peer_id: str | None, history: list[dict[str, str]]
+    ) -> SummarizedHistory:
+        """Summary and remaining turns for history sent with the request."""
+        aged = len(history) - self._window
+        if not settings.conversation_summary_enabled or aged <= 0:
+            return SummarizedHistory(None, history)
+
+        anchors = self._anchors(user_id, peer_id, history[:aged])
+        summary, start = None, 0
+        if peer_id is not None:
+            try:
+                stored = await self._load_peer_summary(user_id, peer_id)
+            except Exception as e:
+                # The turns go to the prompt verbatim instead
+                logger.warning("Conversation summary load failed: %s", e)
+                stored = None
+            stored_anchor = stored.anchor if stored is not None else None
+            if stored_anchor in anchors:
+                summary, start = stored.summary, len(anchors) - anchors[::-1].index(stored_anchor)
+        else:
+            for end in range(aged, 0, -1):
+                found = self._lookup(anchors[end - 1])
+                if found is not None:
+                    summary, start = found, end
+                    break
+        if summary is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+
+        if aged - start >= self._batch:
+            key = anchors[aged - 1]
+            turns = history[start:aged]
+
+            if peer_id is not None:
+                async def job() -> None:
+                    current = await self._load_peer_summary(user_id, peer_id)
+                    if (current.anchor if current is not None else None) != stored_anchor:
+                        return  # Another worker has refreshed it meanwhile
+                    await self._save_peer_summary(
+                        user_id, peer_id, stored_anchor, key, await self._summarize(summary, turns)
+                    )
+
+                self._schedule(f"{user_id}:{peer_id}", job)
+            else:
+                async def job() -> None:
+                    self._remember(key, await self._summarize(summary, turns))
+
+                self._schedule(key, job)
+
+        return SummarizedHistory(summary, history[start:])
+
+    def for_conversation(self, state: ConversationState) -> SummarizedHistory:
+        """Summary and remaining cached turns for a server-side conversation."""
+        if not settings.conversation_summary_enabled:
+            return SummarizedHistory(None, state.history())
+        if state.summary is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+
+        previous, through = state.summary, state.summary_through
+        aged = state.turn_count - self._window
+        if aged - through >= self._batch:
+            user_id, conversation_id = state.user_id, state.conversation_id
+
+            async def job() -> None:
+                turns = await conversations.turns(user_id, conversation_id, through, aged)
+                summary = await self._summarize(previous, turns)
+                await conversations.save_summary(user_id, conversation_id, summary, through, aged)
+
+            self._schedule(f"{user_id}:{conversation_id}", job)
+
+        return SummarizedHistory(previous, state.unsummarized())
+
+    async def stop(self) -> None:
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _anchors(
+        self, user_id: str, peer_id: str | None, history: list[dict[str, str]]
+    ) -> list[str]:
+        """Keys of summaries covering history[:1], history[:2], ..."""
+        turns = [
+            json.dumps([t["role"], t["content"]], ensure_ascii=False).encode("utf-8")
+            for t in history
+        ]
+        if peer_id is not None:
+            scope = json.dumps([user_id, peer_id], ensure_ascii=False).encode("utf-8")
+            return [
+                hashlib.sha256(b"\n".join([scope, *turns[max(0, end - _ANCHOR_TURNS):end]])).hexdigest()
+                for end in range(1, len(turns) + 1)
+            ]
+
+        # Chained over the whole prefix
+        keys = []
+        digest = hashlib.sha256(json.dumps([user_id], ensure_ascii=False).encode("utf-8")).digest()
+        for turn in turns:
+            digest = hashlib.sha256(digest + turn).digest()
+            keys.append(digest.hex())
+        return keys
+
+    async def _load_peer_summary(self, user_id: str, peer_id: str) -> HistorySummary | None:
+        async with async_session_factory() as session:
+            return (await session.execute(
+                select(HistorySummary).where(
+                    HistorySummary.user_id == user_id,
+                    HistorySummary.peer_id == peer_id,
+                )
+            )).scalar_one_or_none()
+
+    async def _save_peer_summary(
+        self,
+        user_id: str,
+        peer_id: str,
+        previous_anchor: str | None,
+        anchor: str,
+        summary: str,
+    ) -> bool:
+        """
+        Store the customer's summary unless the row read as `previous_anchor`
+        (None: no row) was replaced meanwhile; returns whether it was stored.
+        """
+        async with async_session_factory() as session:
+            if previous_anchor is None:
+                result = await session.execute(
+                    insert(HistorySummary)
+                    .values(user_id=user_id, peer_id=peer_id, anchor=anchor, summary=summary)
+                    .on_conflict_do_nothing()
+                )
+            else:
+                result = await session.execute(
+                    update(HistorySummary)
+                    .where(
+                        HistorySummary.user_id == user_id,
+                        HistorySummary.peer_id == peer_id,
+                        HistorySummary.anchor == previous_anchor,
+                    )
+                    .values(anchor=anchor, summary=summary)
+                )
+            await session.commit()
+        return bool(result.rowcount)
+
+    def _schedule(self, key: str, job: Callable[[], Awaitable[None]]) -> None:
+        if key in self._running:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+
+    async def _run(self, job: Callable[[], Awaitable[None]]) -> None:
+        async with self._semaphore:
+            try:
+                await job()
+                self._refreshes += 1
+            except Exception as e:
+                self._failures += 1
+                logger.warning("Conversation summary refresh failed: %s", e)
+
+    async def _summarize(self, previous: str | None, turns: list[dict[str, str]]) -> str:
+        content = f"Новые сообщения:\n{_transcript(turns)}"
+        if previous:
+            content = f"Текущее резюме:\n{previous}\n\n{content}"
+        response = await llm_clients.get().chat.completions.create(
+            model=settings.conversation_summary_model or settings.openai_chat_model,
+            messages=[
+                {"role": "system", "content": _SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": content},
+            ],
+            temperature=0.2,
+            max_tokens=settings.conversation_summary_max_tokens,
+        )
+        prompt_cache_stats.record(response.usage)
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            raise ValueError("empty summary")
+        return summary
+
+    def _lookup(self, key: str) -> str | None:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _remember(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self._max_entries:
+                self._summaries.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            cached = len(self._summaries)
+        lookups = self._hits + self._misses
+        return {
+            "cached": cached,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": (self._hits / lookups) if lookups else 0.0,
+            "refreshes": self._refreshes,
+            "failures": self._failures,
+            "running": len(self._running),
+        }
+
+
+summarizer = ConversationSummarizer(
+    window=settings.conversation_summary_window,
+    batch=settings.conversation_summary_batch,
+    max_entries=settings.conversation_summary_cache_size,
+    concurrency=settings.conversation_summary_concurrency,
+)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+
+from PIL import Image
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+from app.services.clip_service import CLIPService
+from app.services.inference import inference_executor
+from app.services.local_embedding import LocalEmbeddingService
+
+logger = logging.getLogger(__name__)
+
+MODES = ("background", "blocking", "off")
+
+
+class Warmup:
+    """
+    Loads the models and fills the DB pool at startup.
+
+    Each model is loaded and runs one dummy encode on the inference
+    executor (which also applies the torch thread settings), and
+    `warmup_db_connections` pooled connections are opened. In "background"
+    mode this runs as a task so /api/health answers right away while
+    /api/ready reports 503 until every step has finished; "blocking" keeps
+    the app from accepting requests until then; "off" leaves models to
+    load on first use and reports ready at once.
+    """
+
+    def __init__(self, mode: str, warm_clip: bool, db_connections: int) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unsupported warm-up mode: {mode}")
+        self._mode = mode
+        self._warm_clip = warm_clip
+        self._db_connections = max(0, db_connections)
+        self._task: asyncio.Task | None = None
+        self._done: dict[str, bool] = {}
+        self._durations: dict[str, float] = {}
+        self._error: str | None = None
+
+    async def start(self) -> None:
+        if self._mode == "off":
+            return
+        self._done = {"database": False, "text_model": False}
+        if self._warm_clip:
+            self._done["clip_model"] = False
+
+        if self._mode == "blocking":
+            await self._run()
+        else:
+            self._task = asyncio.create_task(self._run(), name="warmup")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._error is None and all(self._done.values())
+
+    def status(self) -> dict[str, bool]:
+        return dict(self._done)
+
+    @property
+    def error(self) -> str | None:
+        return self._error
+
+    async def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(
+                self._step("database", self._warm_database()),
+                self._step("text_model", inference_executor.run(_warm_text_model)),
+                *(
+                    [self._step("clip_model", inference_executor.run(_warm_clip_model))]
+                    if self._warm_clip
+                    else []
+                ),
+            )
+        except Exception as e:
+            self._error = str(e) or type(e).__name__
+            logger.error("Warm-up failed: %s", self._error)
+            return
+        logger.info("Warm-up finished in %.1fs", time.perf_counter() - started)
+
+    async def _step(self, name: str, work: Awaitable[None]) -> None:
+        started = time.perf_counter()
+        await work
+        self._durations[name] = time.perf_counter() - started
+        self._done[name] = True
+        logger.info("Warm-up: %s ready in %.1fs", name, self._durations[name])
+
+    async def _warm_database(self) -> None:
+        async def _touch() -> None:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        await asyncio.gather(*(_touch() for _ in range(max(1, self._db_connections))))
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "ready": float(self.ready),
+            **{f"{name}_seconds": duration for name, duration in self._durations.items()},
+        }
+
+
+def preload_models() -> None:
+    """
+    Load the models without running them, for a parent process that forks
+    workers afterwards (gunicorn's preload_app). The weights end up in
+    pages every worker shares copy-on-write. Torch is held to one thread
+    and nothing is encoded, so no thread pool exists yet at fork time; each
+    worker sets its own thread count after the fork. ONNX Runtime and
+    OpenVINO sessions are not fork-safe, so on those backends MiniLM is
+    left to load in each worker.
+    """
+    import torch
+
+    torch.set_num_threads(1)
+    started = time.perf_counter()
+    if settings.inference_backend == "torch":
+        LocalEmbeddingService()._get_model()
+    if settings.warmup_clip:
+        CLIPService()._get_model()
+    logger.info("Preloaded models in %.1fs", time.perf_counter() - started)
+
+
+def _warm_text_model() -> None:
+    LocalEmbeddingService().embed_texts(["warm-up"])
+
+
+def _warm_clip_model() -> None:
+    clip = CLIPService()
+    clip.embed_decoded_images([Image.new("RGB", (224, 224))])
+    clip.embed_texts(["warm-up"])
+
+
+warmup = Warmup(
+    mode=settings.warmup_mode,
+    warm_clip=settings.warmup_clip,
+    db_connections=settings.warmup_db_connections,
+)
@@ -0,0 +1,142 @@
+"""
+Compare the configured inference backend against full-precision torch.
+
+    python -m app.tools.benchmark_models --backend onnx [--texts FILE] [--images DIR]
+
+For MiniLM and CLIP it reports single-item and batched latency of both
+paths, the cosine similarity between their embeddings of the same inputs
+and how often both agree on each input's nearest neighbour. Runs on
+whatever cores the process is given, so pin it the way the service runs
+(e.g. `taskset` / container CPU limits) for comparable numbers.
+"""
+import argparse
+import math
+import statistics
+import time
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services.model_loading import load_clip_model, load_text_model
+
+SAMPLE_TEXTS = [
+    "Сколько стоит доставка по Москве?",
+    "Есть ли этот диван в сером цвете?",
+    "Какие размеры у обеденного стола?",
+    "Можно ли вернуть товар через две недели?",
+    "Do you ship to Kazakhstan?",
+    "I need a wardrobe about two meters wide.",
+    "What is the warranty on the office chair?",
+    "Подскажите, есть ли скидки для постоянных клиентов?",
+    "Материал столешницы — массив дуба или шпон?",
+    "Когда снова появится в наличии кресло-качалка?",
+    "Is assembly included in the price?",
+    "Нужна кровать с подъёмным механизмом 160 на 200.",
+    "Which colours does the bookshelf come in?",
+    "Оплата картой при получении возможна?",
+    "How heavy is the coffee table?",
+    "Пришлите, пожалуйста, фото товара с другой стороны.",
+]
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _nearest(embeddings: list[list[float]]) -> list[int]:
+    nearest = []
+    for i, a in enumerate(embeddings):
+        scores = [(_cosine(a, b), j) for j, b in enumerate(embeddings) if j != i]
+        nearest.append(max(scores)[1])
+    return nearest
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    """Median wall time of `fn` in milliseconds."""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def compare(
+    label: str,
+    reference: SentenceTransformer,
+    candidate: SentenceTransformer,
+    inputs: list[Any],
+    batch_size: int,
+    repeat: int,
+) -> None:
+    ref_vectors = [e.tolist() for e in reference.encode(inputs, batch_size=batch_size)]
+    cand_vectors = [e.tolist() for e in candidate.encode(inputs, batch_size=batch_size)]
+    cosines = [_cosine(a, b) for a, b in zip(ref_vectors, cand_vectors)]
+    agreement = sum(
+        a == b for a, b in zip(_nearest(ref_vectors), _nearest(cand_vectors))
+    ) / len(inputs)
+
+    single_ref = _time(lambda: reference.encode(inputs[0]), repeat)
+    single_cand = _time(lambda: candidate.encode(inputs[0]), repeat)
+    batch_ref = _time(lambda: reference.encode(inputs, batch_size=batch_size), repeat)
+    batch_cand = _time(lambda: candidate.encode(inputs, batch_size=batch_size), repeat)
+
+    print(f"\n{label} ({len(inputs)} inputs, batch size {batch_size})")
+    print(f"  single item   torch {single_ref:8.1f} ms   {settings.inference_backend} {single_cand:8.1f} ms   x{single_ref / single_cand:.1f}")
+    print(f"  full set      torch {batch_ref:8.1f} ms   {settings.inference_backend} {batch_cand:8.1f} ms   x{batch_ref / batch_cand:.1f}")
+    print(f"  cosine to torch: mean {statistics.mean(cosines):.4f}, min {min(cosines):.4f}")
+    print(f"  nearest-neighbour agreement: {agreement:.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("onnx", "openvino"), default=None)
+    parser.add_argument("--texts", type=Path, help="file with one text per line")
+    parser.add_argument("--images", type=Path, help="directory of product photos")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.backend:
+        settings.inference_backend = args.backend
+    if settings.inference_backend == "torch":
+        parser.error("set --backend (or INFERENCE_BACKEND) to the backend to compare")
+
+    texts = (
+        [line.strip() for line in args.texts.read_text(encoding="utf-8").splitlines() if line.strip()]
+        if args.texts
+        else SAMPLE_TEXTS
+    )
+
+    compare(
+        f"MiniLM {settings.text_embedding_model_name}",
+        SentenceTransformer(settings.text_embedding_model_name),
+        load_text_model(settings.text_embedding_model_name),
+        texts,
+        args.batch_size,
+        args.repeat,
+    )
+
+    clip_reference = SentenceTransformer(settings.clip_model_name)
+    clip_candidate = load_clip_model(settings.clip_model_name)
+    compare(f"CLIP {settings.clip_model_name} text", clip_reference, clip_candidate, texts, args.batch_size, args.repeat)
+
+    if args.images:
+        images = [
+            Image.open(path).convert("RGB")
+            for path in sorted(args.images.iterdir())
+            if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
+        ]
+        if len(images) > 1:
+            compare(f"CLIP {settings.clip_model_name} images", clip_reference, clip_candidate, images, args.batch_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
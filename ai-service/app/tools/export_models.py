@@ -0,0 +1,69 @@
+"""
+Export MiniLM for the onnx / openvino inference backends.
+
+    python -m app.tools.export_models --backend onnx
+    python -m app.tools.export_models --backend openvino
+
+The int8 model is written under `inference_model_dir`, where the service
+loads it from when `inference_backend` is set to the same backend. Run it
+once per image build (or on a volume); it needs network access to fetch
+the model (and, for OpenVINO, its calibration dataset).
+"""
+import argparse
+import logging
+from pathlib import Path
+
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services.model_loading import export_dir, quantized_file_name
+
+logger = logging.getLogger(__name__)
+
+
+def export(model_name: str, backend: str, quantization: str) -> Path:
+    out = export_dir(model_name)
+    model = SentenceTransformer(model_name, backend=backend)
+    model.save_pretrained(str(out))
+
+    if backend == "onnx":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        export_dynamic_quantized_onnx_model(
+            model,
+            quantization_config=quantization,
+            model_name_or_path=str(out),
+        )
+    else:
+        from optimum.intel import OVQuantizationConfig
+        from sentence_transformers import export_static_quantized_openvino_model
+
+        export_static_quantized_openvino_model(
+            model,
+            quantization_config=OVQuantizationConfig(),
+            model_name_or_path=str(out),
+        )
+
+    return out / quantized_file_name(backend)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("onnx", "openvino"), default="onnx")
+    parser.add_argument("--model", default=settings.text_embedding_model_name)
+    parser.add_argument(
+        "--quantization",
+        choices=("arm64", "avx2", "avx512", "avx512_vnni"),
+        default=settings.onnx_quantization,
+        help="ONNX int8 kernel target (ignored for openvino)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    settings.onnx_quantization = args.quantization
+    path = export(args.model, args.backend, args.quantization)
+    logger.info("Exported %s -> %s", args.model, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local OpenAI-compatible chat completion server for latency testing.
+
+    python -m app.tools.llm_stub --port 8089 --latency fast=0.2 --latency slow=3
+
+Point the service at it with LLM_PROVIDER=openai,
+OPENAI_BASE_URL=http://localhost:8089/v1, OPENAI_CHAT_MODEL=slow and
+LLM_ROUTES=openai:fast to watch hedging and route selection in
+/api/metrics. `--latency model=seconds` sets the delay before the first
+token per model (models not listed use `--default-latency`); a share
+`--tail-rate` of requests waits `--tail-latency` instead, to mimic a
+slow upstream tail. `POST /v1/chat/completions` supports streaming
+(including `stream_options.include_usage`) and always answers with the
+same short reply; it never calls tools.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections.abc import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+REPLY = "Здравствуйте! Подскажите, пожалуйста, какой товар Вас интересует?"
+
+
+def create_app(
+    latencies: dict[str, float],
+    default_latency: float,
+    token_delay: float,
+    tail_rate: float,
+    tail_latency: float,
+) -> FastAPI:
+    app = FastAPI(title="LLM stub")
+
+    def first_token_delay(model: str) -> float:
+        if random.random() < tail_rate:
+            return tail_latency
+        return latencies.get(model, default_latency)
+
+    def usage(messages: list[dict]) -> dict:
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+        completion_tokens = len(REPLY.split())
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        await asyncio.sleep(first_token_delay(model))
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_delay * len(REPLY.split()))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": REPLY},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body.get("messages", [])),
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason: str | None = None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False) + "\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            words = REPLY.split(" ")
+            for i, word in enumerate(words):
+                yield chunk({"content": word if i == 0 else " " + word})
+                await asyncio.sleep(token_delay)
+            yield chunk({}, "stop")
+            if include_usage:
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage(body.get("messages", [])),
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _latency(value: str) -> tuple[str, float]:
+    model, sep, seconds = value.rpartition("=")
+    if not sep or not model:
+        raise argparse.ArgumentTypeError(f"expected model=seconds, got {value!r}")
+    return model, float(seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=_latency, action="append", default=[],
+                        help="first-token delay for one model, model=seconds")
+    parser.add_argument("--default-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02,
+                        help="delay between streamed tokens")
+    parser.add_argument("--tail-rate", type=float, default=0.0,
+                        help="share of requests that get --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=10.0)
+    args = parser.parse_args()
+
+    app = create_app(
+        latencies=dict(args.latency),
+        default_latency=args.default_latency,
+        token_delay=args.token_delay,
+        tail_rate=args.tail_rate,
+        tail_latency=args.tail_latency,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
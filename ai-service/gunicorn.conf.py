@@ -0,0 +1,49 @@
+"""
+gunicorn settings for running the AI service on several worker processes:
+
+    python -m gunicorn -c gunicorn.conf.py app.main:app
+
+The app, and with it the models, is loaded once in the master before the
+workers are forked, so the weights sit in memory pages all workers share
+copy-on-write instead of one copy per worker. The master also creates the
+tables and vector indexes before forking. Each worker then runs the rest
+of the lifespan (warm-up, job queues) and gets an equal share of the CPU
+cores for torch and PDF extraction.
+"""
+import gc
+import os
+
+from app.core.config import settings
+
+bind = f"0.0.0.0:{settings.port}"
+workers = settings.web_workers if settings.web_workers > 0 else (os.cpu_count() or 1)
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Tables and vector indexes are prepared in the master (on_starting), so
+# worker startup is short and this only bounds a stuck worker
+timeout = 120
+graceful_timeout = 30
+
+
+def on_starting(server):
+    from app.main import prepare_database_before_fork
+    from app.services.warmup import preload_models
+
+    # Before any worker exists: a first index build over a large table can
+    # take longer than the worker timeout
+    prepare_database_before_fork()
+    if settings.warmup_mode != "off":
+        preload_models()
+    # Keep the collector from writing to (and so copying) the preloaded
+    # objects' pages in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.services.inference import inference_executor
+    from app.services.pdf_extraction import pdf_extractor
+
+    share = max(1, (os.cpu_count() or 1) // workers)
+    inference_executor.set_torch_threads(settings.inference_torch_threads or share)
+    if settings.pdf_extract_workers <= 0:
+        pdf_extractor.set_workers(share)
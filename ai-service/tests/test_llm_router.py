@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_router as llm_router_module
+from app.services.llm_router import RESPONSE, LatencyTracker, LLMRoute, LLMRouter
+
+PRIMARY = LLMRoute("primary", "slow-model")
+SECONDARY = LLMRoute("secondary", "fast-model")
+
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_enabled", True)
+
+
+def make_router() -> LLMRouter:
+    return LLMRouter([PRIMARY, SECONDARY], LatencyTracker(window=10, min_samples=1))
+
+
+def test_hedge_wins_when_primary_is_slow():
+    router = make_router()
+    cancelled = []
+
+    async def start(route):
+        if route == PRIMARY:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(route)
+                raise
+        return route.provider
+
+    result = asyncio.run(router._race(RESPONSE, 0.05, start))
+
+    assert result == "secondary"
+    assert cancelled == [PRIMARY]
+    stats = router.stats()
+    assert (stats["calls"], stats["hedged"], stats["hedge_wins"], stats["failovers"]) == (1, 1, 1, 0)
+    # The cancelled primary is recorded as at least as slow as the hedge delay
+    assert router.routes(RESPONSE) == [SECONDARY, PRIMARY]
+
+
+def test_no_hedge_when_primary_answers_in_time():
+    router = make_router()
+    started = []
+
+    async def start(route):
+        started.append(route)
+        return route.provider
+
+    assert asyncio.run(router._race(RESPONSE, 1.0, start)) == "primary"
+    assert started == [PRIMARY]
+    assert router.stats()["hedged"] == 0
+
+
+def test_failover_when_primary_fails():
+    router = make_router()
+
+    async def start(route):
+        if route == PRIMARY:
+            raise ConnectionError("primary down")
+        return route.provider
+
+    # Hedge delay far away: the failure alone hands over to the next route
+    assert asyncio.run(router._race(RESPONSE, 60.0, start)) == "secondary"
+    stats = router.stats()
+    assert (stats["hedged"], stats["failovers"]) == (0, 1)
+    assert stats["latency"][str(PRIMARY)]["failures"] == 1
+
+
+def test_raises_last_error_when_all_routes_fail():
+    router = make_router()
+
+    async def start(route):
+        raise ConnectionError(f"{route.provider} down")
+
+    with pytest.raises(ConnectionError, match="secondary down"):
+        asyncio.run(router._race(RESPONSE, 60.0, start))
+    stats = router.stats()
+    assert stats["failovers"] == 1
+    assert stats["latency"][str(PRIMARY)]["failures"] == 1
+    assert stats["latency"][str(SECONDARY)]["failures"] == 1
+
+
+def test_discards_loser_that_finished_in_the_same_tick():
+    router = make_router()
+    discarded = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def start(route):
+            await release.wait()
+            return route.provider
+
+        async def discard(result):
+            discarded.append(result)
+
+        race = asyncio.create_task(router._race(RESPONSE, 0.01, start, discard))
+        # Let the hedge start, then finish both calls at once
+        await asyncio.sleep(0.05)
+        release.set()
+        return await race
+
+    winner = asyncio.run(main())
+
+    assert len(discarded) == 1
+    assert {winner, discarded[0]} == {"primary", "secondary"}
+
+
+class FakeStream:
+    def __init__(self, delay: float, chunks: list[str]) -> None:
+        self._delay = delay
+        self._chunks = iter(chunks)
+        self.closed = False
+
+    async def __anext__(self) -> str:
+        await asyncio.sleep(self._delay)
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def __aiter__(self):
+        return self
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_stream_closes_losing_stream(monkeypatch):
+    streams = {
+        PRIMARY.provider: FakeStream(5.0, ["slow"]),
+        SECONDARY.provider: FakeStream(0.0, ["fast", " reply"]),
+    }
+
+    def client(provider):
+        async def create(**kwargs):
+            return streams[provider]
+
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    monkeypatch.setattr(llm_router_module.llm_clients, "get", client)
+    monkeypatch.setattr(settings, "llm_hedge_first_token_seconds", 0.05)
+    router = make_router()
+
+    async def main():
+        stream = await router.stream({"messages": []})
+        return [chunk async for chunk in stream]
+
+    assert asyncio.run(main()) == ["fast", " reply"]
+    assert streams[PRIMARY.provider].closed
+    assert not streams[SECONDARY.provider].closed
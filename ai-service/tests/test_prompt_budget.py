@@ -0,0 +1,41 @@
+import pytest
+import tiktoken
+
+from app.services import prompt_budget
+from app.services.prompt_budget import count_tokens, truncate_tokens
+
+
+@pytest.fixture(autouse=True)
+def byte_encoder(monkeypatch):
+    # One token per byte, so every Cyrillic letter spans two tokens and a
+    # cut can land inside one (cl100k is not available offline)
+    encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    monkeypatch.setattr(prompt_budget, "token_encoder", lambda: encoding)
+
+
+def test_short_text_is_unchanged():
+    assert truncate_tokens("Диван", 100) == "Диван"
+
+
+@pytest.mark.parametrize("max_tokens", range(1, 40))
+def test_cut_never_splits_a_cyrillic_character(max_tokens):
+    text = "Диван угловой, серый. Цена: 45 000 ₽"
+
+    cut = truncate_tokens(text, max_tokens)
+
+    assert "�" not in cut
+    assert cut.endswith("…")
+    assert text.startswith(cut[:-1])
+    assert count_tokens(cut) <= max(max_tokens, count_tokens("…"))
+
+
+def test_cut_keeps_whole_characters_that_fit():
+    # Two bytes per letter and three for the ellipsis
+    assert truncate_tokens("Да, есть", 4) == "…"
+    assert truncate_tokens("Да, есть", 6) == "Д…"
+    assert truncate_tokens("Да, есть", 7) == "Да…"
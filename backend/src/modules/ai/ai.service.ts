@@ -26,13 +26,46 @@ interface ProcessFileResponse {
   status: string;
 }
 
+interface ProcessJobResponse {
+  job_id: string;
+  file_id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  chunks_count: number | null;
+  error: string | null;
+}
+
 interface AiChatPayload {
   message: string;
   user_id: string;
   conversation_history?: Array<{ role: string; content: string }>;
+  peer_id?: string;
   top_k?: number;
   product_context?: string;
   cart_context?: string;
+  search_products?: boolean;
+  product_top_k?: number;
+  images?: string[];
+  fallback_product_context?: string;
+  conversation_id?: string;
+  history_message?: string;
+  store_turn?: boolean;
+}
+
+/** Work the AI service does inside the chat call instead of separate requests. */
+export interface AiChatOptions {
+  // Search the catalog by the message text
+  searchProducts?: boolean;
+  // Customer photos to search the catalog by
+  images?: Buffer[];
+  productTopK?: number;
+  // Product context to use when the search finds nothing
+  fallbackProductContext?: string;
+  // Server-side history: the AI service keeps the dialogue, so no history is sent
+  conversationId?: string;
+  // Stored as the customer's turn instead of the message (tool-result follow-ups)
+  historyMessage?: string;
+  // false when the turn is already stored
+  storeTurn?: boolean;
 }
 
 interface AiToolCall {
@@ -44,6 +77,8 @@ interface AiChatResponse {
   reply: string;
   sources_count: number;
   tool_calls?: AiToolCall[] | null;
+  products?: ProductSearchResult[] | null;
+  product_context?: string | null;
 }
 
 interface ProductSearchResult {
@@ -57,6 +92,7 @@ interface ProductSearchResult {
 export class AiService {
   private readonly logger = new Logger(AiService.name);
   private readonly aiServiceUrl: string;
+  private readonly processJobPollMs = 2000;
 
   constructor(
     private readonly configService: ConfigService,
@@ -84,13 +120,16 @@ export class AiService {
     // Also clear Telegram conversation history for this user, so the AI
     // doesn't use past Telegram chats as context after "Clear history" in UI.
     await this.telegramConversationRepo.delete({ userId });
+    await this.deleteConversations(userId);
     // And clear all carts for all Telegram peers of this user
     await this.cartItemRepo.delete({ userId });
   }
 
   async processFile(payload: ProcessFilePayload): Promise<ProcessFileResponse> {
     try {
-      const response = await fetch(`${this.aiServiceUrl}/api/process`, {
+      // Submit a background ingestion job and poll it, so large files
+      // don't hit the fetch timeout
+      const response = await fetch(`${this.aiServiceUrl}/api/process/jobs`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
@@ -101,7 +140,28 @@ export class AiService {
         throw new Error(`AI service error ${response.status}: ${error}`);
       }
 
-      return response.json() as Promise<ProcessFileResponse>;
+      let job = (await response.json()) as ProcessJobResponse;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, this.processJobPollMs));
+        const statusResponse = await fetch(
+          `${this.aiServiceUrl}/api/process/jobs/${job.job_id}`,
+        );
+        if (!statusResponse.ok) {
+          const error = await statusResponse.text();
+          throw new Error(`AI service error ${statusResponse.status}: ${error}`);
+        }
+        job = (await statusResponse.json()) as ProcessJobResponse;
+      }
+
+      if (job.status !== 'succeeded') {
+        throw new Error(`AI service job ${job.status}: ${job.error ?? ''}`);
+      }
+
+      return {
+        file_id: job.file_id,
+        chunks_count: job.chunks_count ?? 0,
+        status: 'processed',
+      };
     } catch (error) {
       this.logger.error('Failed to process file in AI service', error);
       throw new ServiceUnavailableException('AI service is unavailable');
@@ -123,16 +183,22 @@ export class AiService {
     }
   }
 
-  async chat(userId: string, dto: ChatDto): Promise<ChatResponseDto> {
-    // If caller already provides history (e.g. Telegram per-peer history) — use it as-is
-    // and do NOT touch chat_history table (Telegram service manages its own storage).
+  async chat(
+    userId: string,
+    dto: ChatDto,
+    options: AiChatOptions = {},
+  ): Promise<ChatResponseDto> {
+    // If caller already provides history (e.g. Telegram per-peer history) or the AI
+    // service keeps it (conversationId) — do NOT touch chat_history table
+    // (Telegram service manages its own storage).
     const externalHistory = dto.conversationHistory;
+    const dashboardChat = externalHistory === undefined && options.conversationId === undefined;
 
-    let conversationHistory: Array<{ role: string; content: string }>;
+    let conversationHistory: Array<{ role: string; content: string }> | undefined;
 
-    if (externalHistory !== undefined) {
-      // Telegram call — use exactly what was passed (even if empty array)
-      conversationHistory = externalHistory.map((m) => ({
+    if (!dashboardChat) {
+      // Telegram call — use exactly what was passed (even if empty array; none with conversationId)
+      conversationHistory = externalHistory?.map((m) => ({
         role: m.role,
         content: m.content,
       }));
@@ -151,8 +217,16 @@ export class AiService {
       user_id: userId,
       top_k: dto.topK,
       conversation_history: conversationHistory,
+      peer_id: dto.peerId,
       product_context: dto.productContext,
       cart_context: dto.cartContext,
+      search_products: options.searchProducts,
+      product_top_k: options.productTopK,
+      images: options.images?.map((image) => image.toString('base64')),
+      fallback_product_context: options.fallbackProductContext,
+      conversation_id: options.conversationId,
+      history_message: options.historyMessage,
+      store_turn: options.storeTurn,
     };
 
     try {
@@ -171,8 +245,8 @@ export class AiService {
 
       this.logger.log(`AI response: reply="${(data.reply || '').substring(0, 80)}", tool_calls=${JSON.stringify(data.tool_calls)}`);
 
-      // Only save to chat_history when it's a dashboard chat (externalHistory not provided)
-      if (externalHistory === undefined) {
+      // Only save to chat_history when it's a dashboard chat
+      if (dashboardChat) {
         await this.chatHistoryRepo.save([
           this.chatHistoryRepo.create({ userId, role: 'user', content: dto.message }),
           this.chatHistoryRepo.create({ userId, role: 'assistant', content: data.reply }),
@@ -183,6 +257,8 @@ export class AiService {
         reply: data.reply,
         sourcesCount: data.sources_count,
         toolCalls: data.tool_calls ?? undefined,
+        products: data.products ?? undefined,
+        productContext: data.product_context ?? undefined,
       };
     } catch (error) {
       this.logger.error('Failed to get chat response from AI service', error);
@@ -190,24 +266,55 @@ export class AiService {
     }
   }
 
+  /** Forget a dialogue the AI service keeps (see AiChatOptions.conversationId). */
+  async deleteConversation(userId: string, conversationId: string): Promise<void> {
+    try {
+      const response = await fetch(
+        `${this.aiServiceUrl}/api/chat/conversations/${encodeURIComponent(conversationId)}` +
+          `?user_id=${encodeURIComponent(userId)}`,
+        { method: 'DELETE' },
+      );
+
+      if (!response.ok && response.status !== 404) {
+        this.logger.warn(`Failed to delete conversation ${conversationId}: ${response.status}`);
+      }
+    } catch (error) {
+      this.logger.warn(`Could not delete conversation ${conversationId}`, error);
+    }
+  }
+
+  async deleteConversations(userId: string): Promise<void> {
+    try {
+      const response = await fetch(
+        `${this.aiServiceUrl}/api/chat/conversations?user_id=${encodeURIComponent(userId)}`,
+        { method: 'DELETE' },
+      );
+
+      if (!response.ok) {
+        this.logger.warn(`Failed to delete conversations of user ${userId}: ${response.status}`);
+      }
+    } catch (error) {
+      this.logger.warn(`Could not delete conversations of user ${userId}`, error);
+    }
+  }
+
   async embedProduct(
     productId: string,
     name: string,
     description: string,
-    imagePath?: string,
+    imagePaths: string[] = [],
+    userId?: string,
   ): Promise<void> {
     try {
       const formData = new FormData();
       formData.append('product_id', productId);
       formData.append('name', name);
       formData.append('description', description);
+      if (userId) formData.append('user_id', userId);
 
-      if (imagePath && fs.existsSync(imagePath)) {
-        const imageBuffer = fs.readFileSync(imagePath);
-        const ext = path.extname(imagePath).slice(1) || 'jpg';
-        const blob = new Blob([imageBuffer], { type: `image/${ext}` });
-        formData.append('image', blob, path.basename(imagePath));
-      }
+      this.appendImages(formData, imagePaths);
+      // imagePaths is the whole gallery: none left clears the stored photos
+      formData.append('replace_images', 'true');
 
       const response = await fetch(`${this.aiServiceUrl}/api/products/embed`, {
         method: 'POST',
@@ -227,19 +334,18 @@ export class AiService {
     productId: string,
     name: string,
     description: string,
-    imagePath?: string,
+    imagePaths: string[] = [],
+    userId?: string,
   ): Promise<void> {
     try {
       const formData = new FormData();
       formData.append('name', name);
       formData.append('description', description);
+      if (userId) formData.append('user_id', userId);
 
-      if (imagePath && fs.existsSync(imagePath)) {
-        const imageBuffer = fs.readFileSync(imagePath);
-        const ext = path.extname(imagePath).slice(1) || 'jpg';
-        const blob = new Blob([imageBuffer], { type: `image/${ext}` });
-        formData.append('image', blob, path.basename(imagePath));
-      }
+      this.appendImages(formData, imagePaths);
+      // imagePaths is the whole gallery: none left clears the stored photos
+      formData.append('replace_images', 'true');
 
       const response = await fetch(
         `${this.aiServiceUrl}/api/products/embed/${productId}`,
@@ -255,6 +361,17 @@ export class AiService {
     }
   }
 
+  /** Appends every existing photo as an `images` part, in gallery order. */
+  private appendImages(formData: FormData, imagePaths: string[]): void {
+    for (const imagePath of imagePaths) {
+      if (!fs.existsSync(imagePath)) continue;
+      const imageBuffer = fs.readFileSync(imagePath);
+      const ext = path.extname(imagePath).slice(1) || 'jpg';
+      const blob = new Blob([imageBuffer], { type: `image/${ext}` });
+      formData.append('images', blob, path.basename(imagePath));
+    }
+  }
+
   async deleteProductEmbedding(productId: string): Promise<void> {
     try {
       const response = await fetch(
@@ -275,12 +392,14 @@ export class AiService {
   async searchProductByImage(
     imageBuffer: Buffer,
     topK: number = 3,
+    userId?: string,
   ): Promise<ProductSearchResult[]> {
     try {
       const formData = new FormData();
       const blob = new Blob([new Uint8Array(imageBuffer)], { type: 'image/jpeg' });
       formData.append('image', blob, 'photo.jpg');
       formData.append('top_k', String(topK));
+      if (userId) formData.append('user_id', userId);
 
       const response = await fetch(
         `${this.aiServiceUrl}/api/products/search-by-image`,
@@ -299,14 +418,17 @@ export class AiService {
     }
   }
 
-  async searchProductByText(query: string): Promise<ProductSearchResult[]> {
+  async searchProductByText(
+    query: string,
+    userId?: string,
+  ): Promise<ProductSearchResult[]> {
     try {
       const response = await fetch(
         `${this.aiServiceUrl}/api/products/search-by-text`,
         {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ query, top_k: 3 }),
+          body: JSON.stringify({ query, top_k: 3, user_id: userId }),
         },
       );
 
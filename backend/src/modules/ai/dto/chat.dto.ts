@@ -33,6 +33,11 @@ export class ChatDto {
   @Type(() => ConversationMessageDto)
   readonly conversationHistory?: ConversationMessageDto[];
 
+  @ApiPropertyOptional({ description: 'Customer the conversation is with (e.g. Telegram peer id)' })
+  @IsOptional()
+  @IsString()
+  readonly peerId?: string;
+
   @ApiPropertyOptional({ example: 5, minimum: 1, maximum: 20 })
   @IsOptional()
   @IsInt()
@@ -56,6 +61,13 @@ export class ToolCallDto {
   readonly arguments: Record<string, any>;
 }
 
+export class ProductMatchDto {
+  readonly product_id: string;
+  readonly product_name: string;
+  readonly product_description: string | null;
+  readonly similarity: number;
+}
+
 export class ChatResponseDto {
   @ApiProperty({ example: 'Here is what I know...' })
   readonly reply: string;
@@ -65,4 +77,10 @@ export class ChatResponseDto {
 
   @ApiPropertyOptional({ type: [ToolCallDto] })
   readonly toolCalls?: ToolCallDto[] | null;
+
+  @ApiPropertyOptional({ type: [ProductMatchDto], description: 'Catalog matches found for the message' })
+  readonly products?: ProductMatchDto[];
+
+  @ApiPropertyOptional({ description: 'Product context the reply was based on' })
+  readonly productContext?: string;
 }
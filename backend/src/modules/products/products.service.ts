@@ -162,7 +162,14 @@ export class ProductsService {
 
     // Sync imagePath with first remaining image
     product.imagePath = product.images?.[0]?.filename ?? null;
-    return this.productRepo.save(product);
+    const saved = await this.productRepo.save(product);
+
+    // Drop the removed photo from image search
+    this.generateEmbeddings(saved).catch((err) =>
+      this.logger.error(`Failed to update embeddings for product ${saved.id}`, err),
+    );
+
+    return saved;
   }
 
   async delete(id: string): Promise<void> {
@@ -283,15 +290,20 @@ export class ProductsService {
   }
 
   private async generateEmbeddings(product: Product): Promise<void> {
-    const imagePath = product.imagePath
-      ? path.join(UPLOADS_DIR, product.imagePath)
-      : undefined;
+    const filenames = product.images?.length
+      ? [...product.images]
+          .sort((a, b) => a.sortOrder - b.sortOrder)
+          .map((img) => img.filename)
+      : product.imagePath
+        ? [product.imagePath]
+        : [];
 
     await this.aiService.embedProduct(
       product.id,
       product.name,
       product.description ?? '',
-      imagePath,
+      filenames.map((filename) => path.join(UPLOADS_DIR, filename)),
+      product.userId,
     );
   }
 }
@@ -432,17 +432,10 @@ export class TelegramService {
         return;
       }
 
-      // Load conversation history
-      const historyRows = await this.conversationRepository.find({
-        where: { userId, peerId },
-        order: { createdAt: 'ASC' },
-        take: this.maxHistoryMessages,
-      });
-      const history = historyRows.map((r) => ({ role: r.role, content: r.content }));
-
-      // Download all photos and search products for each
+      // Download all photos; the AI service searches the catalog by them (and
+      // by the caption) within the chat call
       const client = this.clients.get(userId);
-      const allProducts: Array<{ product_id: string; product_name: string; product_description: string | null; similarity: number }> = [];
+      const photos: Buffer[] = [];
 
       if (client) {
         for (const event of events) {
@@ -450,66 +443,40 @@ export class TelegramService {
           if (!msg.media) continue;
           try {
             const buffer = await client.downloadMedia(msg.media, {}) as Buffer;
-            if (buffer) {
-              const products = await this.aiService.searchProductByImage(buffer, 3);
-              allProducts.push(...products);
-            }
+            if (buffer) photos.push(buffer);
           } catch (err) {
             this.logger.warn(`Failed to download photo from album for user ${userId}`, err);
           }
         }
       }
 
-      // Deduplicate by product_id, keeping highest similarity
-      const bestByProduct = new Map<string, typeof allProducts[number]>();
-      for (const p of allProducts) {
-        const existing = bestByProduct.get(p.product_id);
-        if (!existing || p.similarity > existing.similarity) {
-          bestByProduct.set(p.product_id, p);
-        }
-      }
-      const mergedProducts = Array.from(bestByProduct.values())
-        .sort((a, b) => b.similarity - a.similarity)
-        .slice(0, 5);
-
-      let productContext: string | undefined;
-      let matchedProducts: Product[] = [];
-      if (mergedProducts.length > 0) {
-        const result = await this.formatProductContext(mergedProducts, 'photo');
-        productContext = result.context;
-        matchedProducts = result.products;
-      }
-
-      // If no photo results, try text search from caption
-      if (caption && !productContext) {
-        const products = await this.aiService.searchProductByText(caption);
-        if (products.length > 0 && products[0].similarity > 0.15) {
-          const result = await this.formatProductContext(products, 'text');
-          productContext = result.context;
-          matchedProducts = result.products;
-        }
-      }
-
-      let userMessage: string;
-      if (caption) {
-        userMessage = caption;
-      } else if (productContext) {
-        userMessage = `Клиент отправил ${events.length} фотографий товара.`;
-      } else {
-        userMessage = `Клиент отправил ${events.length} фотографий, но похожих товаров не найдено.`;
-      }
+      const userMessage = caption || `Клиент отправил ${events.length} фотографий товара.`;
 
       const cartContext = await this.buildCartContext(userId, peerId);
 
-      const aiResponse = await this.aiService.chat(userId, {
-        message: userMessage,
-        conversationHistory: history,
-        productContext,
-        cartContext,
-      });
+      const aiResponse = await this.aiService.chat(
+        userId,
+        {
+          message: userMessage,
+          peerId,
+          cartContext,
+        },
+        {
+          conversationId: this.conversationId(peerId),
+          searchProducts: !!caption,
+          images: photos,
+          productTopK: 5,
+        },
+      );
+      const productContext = aiResponse.productContext;
+      const matchedProducts = aiResponse.products?.length
+        ? await this.loadMatchedProducts(aiResponse.products)
+        : [];
 
       let reply = aiResponse.reply;
       let toolCalls = aiResponse.toolCalls;
+      // Otherwise the AI service already stored this turn with the reply
+      const calledTools = !!toolCalls?.length;
 
       // Fallback: same as handleSingleMessage.
       // Срабатывает только на утвердительные фразы без вопросительного знака,
@@ -535,12 +502,20 @@ export class TelegramService {
           userId, peerId, peerName, peerUsername, toolCalls,
         );
         const updatedCartContext = await this.buildCartContext(userId, peerId);
-        const followUp = await this.aiService.chat(userId, {
-          message: `[Результаты операций]\n${results.join('\n')}\n\n[Исходное сообщение клиента]: ${userMessage}`,
-          conversationHistory: history,
-          productContext,
-          cartContext: updatedCartContext,
-        });
+        const followUp = await this.aiService.chat(
+          userId,
+          {
+            message: `[Результаты операций]\n${results.join('\n')}\n\n[Исходное сообщение клиента]: ${userMessage}`,
+            peerId,
+            productContext,
+            cartContext: updatedCartContext,
+          },
+          {
+            conversationId: this.conversationId(peerId),
+            historyMessage: userMessage,
+            storeTurn: calledTools,
+          },
+        );
         reply = followUp.reply;
         if (order) {
           await this.sendReceiptToManager(userId, order);
@@ -574,34 +549,20 @@ export class TelegramService {
         return;
       }
 
-      // Load conversation history
-      const historyRows = await this.conversationRepository.find({
-        where: { userId, peerId },
-        order: { createdAt: 'ASC' },
-        take: this.maxHistoryMessages,
-      });
-      const history = historyRows.map((r) => ({ role: r.role, content: r.content }));
-
       let productContext: string | undefined;
       let matchedProducts: Product[] = [];
 
-      // Handle photo: search products by image
+      // Download the photo; the AI service searches the catalog by it (and
+      // by the text) within the chat call
+      let photo: Buffer | undefined;
       if (hasPhoto) {
         try {
           const client = this.clients.get(userId);
           if (client && message.media) {
-            const buffer = await client.downloadMedia(message.media, {}) as Buffer;
-            if (buffer) {
-              const products = await this.aiService.searchProductByImage(buffer, 1);
-              if (products.length > 0) {
-                const result = await this.formatProductContext(products, 'photo');
-                productContext = result.context;
-                matchedProducts = result.products;
-              }
-            }
+            photo = (await client.downloadMedia(message.media, {}) as Buffer) || undefined;
           }
         } catch (err) {
-          this.logger.warn(`Failed to download/search photo for user ${userId}`, err);
+          this.logger.warn(`Failed to download photo for user ${userId}`, err);
         }
       }
 
@@ -609,45 +570,8 @@ export class TelegramService {
       const isPhotoReq = text ? this.isPhotoRequest(text) : false;
       this.logger.log(`[MSG] text="${text}", isPhotoReq=${isPhotoReq}, hasPhoto=${hasPhoto}`);
 
-      // Handle text: search products by text if no photo results yet.
-      // Skip text search when the message is just a photo request (e.g. "можно фото")
-      // — in that case reuse the products from the previous turn.
-      if (text && !productContext && !isPhotoReq) {
-        const products = await this.aiService.searchProductByText(text);
-        this.logger.log(`[SEARCH] text="${text}" → ${products.length} results: ${products.map((p) => `${p.product_name}(${p.similarity.toFixed(2)})`).join(', ')}`);
-        if (products.length > 0 && products[0].similarity > 0.15) {
-          const result = await this.formatProductContext(products, 'text');
-          productContext = result.context;
-          matchedProducts = result.products;
-          this.logger.log(`[MATCHED] ${matchedProducts.length} products: ${matchedProducts.map((p) => p.name).join(', ')}`);
-        }
-
-        // Fallback: keyword search in product names when embedding search fails
-        if (!productContext) {
-          const keywordResults = await this.productsService.searchByKeyword(text);
-          if (keywordResults.length > 0) {
-            this.logger.log(`[KEYWORD-FALLBACK] Found ${keywordResults.length} products: ${keywordResults.map((p) => p.name).join(', ')}`);
-            const kwContext = keywordResults.map((p, i) => {
-              const parts = [`${i + 1}. ${p.name}`];
-              if (p.description) parts.push(`   Описание: ${p.description}`);
-              const dimParts: string[] = [];
-              if (p.width) dimParts.push(p.width);
-              if (p.height) dimParts.push(p.height);
-              if (p.depth) dimParts.push(p.depth);
-              if (dimParts.length > 0) parts.push(`   Размеры: ${dimParts.join(' x ')}`);
-              if (p.weight) parts.push(`   Вес: ${p.weight}`);
-              parts.push(`   Цена: ${Number(p.price).toFixed(2)} ₽`);
-              parts.push(`   В наличии: ${p.quantity} шт.`);
-              return parts.join('\n');
-            });
-            productContext = `Система нашла товары по запросу клиента:\n\n${kwContext.join('\n\n')}`;
-            matchedProducts = keywordResults;
-          }
-        }
-      }
-
       // For photo requests, use previously matched products for context and photo sending
-      if (isPhotoReq && matchedProducts.length === 0) {
+      if (isPhotoReq && !photo) {
         const previousProducts = this.lastMatchedProducts.get(peerKey);
         this.logger.log(`[PHOTO-REQ] lastMatchedProducts: ${previousProducts?.map((p) => p.name).join(', ') ?? 'none'}`);
         if (previousProducts && previousProducts.length > 0) {
@@ -665,88 +589,47 @@ export class TelegramService {
         }
       }
 
-      // If no products found but there are previous products for this peer,
-      // try to find alternatives from the same category
-      if (text && !productContext) {
-        const previousProducts = this.lastMatchedProducts.get(peerKey);
-        if (previousProducts && previousProducts.length > 0) {
-          const excludeIds = previousProducts.map((p) => p.id);
-
-          // Detect price direction from user message
-          const priceOptions: { maxPrice?: number; minPrice?: number } = {};
-          const textLower = text.toLowerCase();
-          const wantsCheaper = /дешевл|подешевл|дёшев|бюджетн|ниже.?цен|по.?дешевле|доступн/.test(textLower);
-          const wantsExpensive = /дорож|подорож|премиум|выше.?цен|по.?дороже|люкс/.test(textLower);
-
-          if (wantsCheaper) {
-            const minPrice = Math.min(...previousProducts.map((p) => Number(p.price)));
-            priceOptions.maxPrice = minPrice;
-          } else if (wantsExpensive) {
-            const maxPrice = Math.max(...previousProducts.map((p) => Number(p.price)));
-            priceOptions.minPrice = maxPrice;
-          }
+      // Used by the AI service only if its search finds nothing
+      const fallback = text && !productContext
+        ? await this.buildFallbackProductContext(text, peerKey, isPhotoReq)
+        : { products: [] as Product[] };
 
-          const alternatives = await this.productsService.findAlternatives(
-            previousProducts,
-            excludeIds,
-            priceOptions,
-          );
-          const prevNames = previousProducts.map((p) => `${p.name} (${Number(p.price).toFixed(0)} ₽)`).join(', ');
-          if (alternatives.length > 0) {
-            const altLines = alternatives.map((p, i) => {
-              const parts = [`${i + 1}. ${p.name}`];
-              if (p.description) parts.push(`   Описание: ${p.description}`);
-              const dimParts: string[] = [];
-              if (p.width) dimParts.push(p.width);
-              if (p.height) dimParts.push(p.height);
-              if (p.depth) dimParts.push(p.depth);
-              if (dimParts.length > 0) parts.push(`   Размеры: ${dimParts.join(' x ')}`);
-              if (p.weight) parts.push(`   Вес: ${p.weight}`);
-              parts.push(`   Цена: ${Number(p.price).toFixed(2)} ₽`);
-              parts.push(`   В наличии: ${p.quantity} шт.`);
-              return parts.join('\n');
-            });
-            productContext =
-              `Клиент ранее интересовался: ${prevNames}.\n` +
-              `Система нашла альтернативные товары из той же категории:\n\n${altLines.join('\n\n')}`;
-            matchedProducts = alternatives;
-          } else if (wantsCheaper) {
-            // No cheaper alternatives found — tell LLM explicitly
-            productContext =
-              `Клиент ранее интересовался: ${prevNames}.\n` +
-              `Клиент просит дешевле, но система проверила каталог и НЕ нашла товаров дешевле в этой категории. ` +
-              `Честно сообщи что дешевле вариантов нет.`;
-          } else if (wantsExpensive) {
-            productContext =
-              `Клиент ранее интересовался: ${prevNames}.\n` +
-              `Клиент просит дороже, но система проверила каталог и НЕ нашла товаров дороже в этой категории. ` +
-              `Честно сообщи что дороже вариантов нет.`;
-          }
-        }
-      }
-
-      // When photo sent: tell LLM what the system found, not "user sent a photo"
-      let userMessage: string;
-      if (text) {
-        userMessage = text;
-      } else if (productContext) {
-        userMessage = 'Клиент отправил фотографию товара.';
-      } else {
-        userMessage = 'Клиент отправил фотографию, но похожих товаров не найдено.';
-      }
+      // The server tells the LLM when the photo search found nothing
+      const userMessage = text || 'Клиент отправил фотографию товара.';
 
       // Build cart context for LLM
       const cartContext = await this.buildCartContext(userId, peerId);
 
-      const aiResponse = await this.aiService.chat(userId, {
-        message: userMessage,
-        conversationHistory: history,
-        productContext,
-        cartContext,
-      });
+      // Catalog search by text and photo, document retrieval and the reply in one call.
+      // A photo request (e.g. "можно фото") reuses the previous products instead of searching
+      const aiResponse = await this.aiService.chat(
+        userId,
+        {
+          message: userMessage,
+          peerId,
+          productContext,
+          cartContext,
+        },
+        {
+          conversationId: this.conversationId(peerId),
+          searchProducts: !!text && !productContext,
+          images: photo ? [photo] : undefined,
+          productTopK: 3,
+          fallbackProductContext: fallback.context,
+        },
+      );
+      if (!productContext) {
+        productContext = aiResponse.productContext;
+        matchedProducts = aiResponse.products?.length
+          ? await this.loadMatchedProducts(aiResponse.products)
+          : productContext ? fallback.products : [];
+        this.logger.log(`[MATCHED] ${matchedProducts.length} products: ${matchedProducts.map((p) => p.name).join(', ')}`);
+      }
 
       let reply = aiResponse.reply;
       let toolCalls = aiResponse.toolCalls;
+      // Otherwise the AI service already stored this turn with the reply
+      const calledTools = !!toolCalls?.length;
 
       // Fallback: detect when LLM writes cart actions as text without calling tools.
       // ВАЖНО: срабатывает только на утвердительные фразы (без вопросительного знака),
@@ -783,12 +666,20 @@ export class TelegramService {
         const updatedCartContext = await this.buildCartContext(userId, peerId);
 
         // Call AI again with tool results for final text reply (without tools to prevent loops)
-        const followUp = await this.aiService.chat(userId, {
-          message: `[Результаты операций]\n${results.join('\n')}\n\n[Исходное сообщение клиента]: ${userMessage}`,
-          conversationHistory: history,
-          productContext,
-          cartContext: updatedCartContext,
-        });
+        const followUp = await this.aiService.chat(
+          userId,
+          {
+            message: `[Результаты операций]\n${results.join('\n')}\n\n[Исходное сообщение клиента]: ${userMessage}`,
+            peerId,
+            productContext,
+            cartContext: updatedCartContext,
+          },
+          {
+            conversationId: this.conversationId(peerId),
+            historyMessage: userMessage,
+            storeTurn: calledTools,
+          },
+        );
         reply = followUp.reply;
 
         // Send receipt to manager if order was confirmed
@@ -803,6 +694,113 @@ export class TelegramService {
     }
   }
 
+  /**
+   * Product context from the DB alone, for when the catalog search finds nothing:
+   * products whose name matches a keyword of the message, or alternatives to the
+   * products the customer looked at before.
+   */
+  private async buildFallbackProductContext(
+    text: string,
+    peerKey: string,
+    isPhotoReq: boolean,
+  ): Promise<{ context?: string; products: Product[] }> {
+    let productContext: string | undefined;
+    let matchedProducts: Product[] = [];
+
+    // Keyword search in product names when embedding search fails
+    if (!isPhotoReq) {
+    const keywordResults = await this.productsService.searchByKeyword(text);
+    if (keywordResults.length > 0) {
+      this.logger.log(`[KEYWORD-FALLBACK] Found ${keywordResults.length} products: ${keywordResults.map((p) => p.name).join(', ')}`);
+      const kwContext = keywordResults.map((p, i) => {
+        const parts = [`${i + 1}. ${p.name}`];
+        if (p.description) parts.push(`   Описание: ${p.description}`);
+        const dimParts: string[] = [];
+        if (p.width) dimParts.push(p.width);
+        if (p.height) dimParts.push(p.height);
+        if (p.depth) dimParts.push(p.depth);
+        if (dimParts.length > 0) parts.push(`   Размеры: ${dimParts.join(' x ')}`);
+        if (p.weight) parts.push(`   Вес: ${p.weight}`);
+        parts.push(`   Цена: ${Number(p.price).toFixed(2)} ₽`);
+        parts.push(`   В наличии: ${p.quantity} шт.`);
+        return parts.join('\n');
+      });
+      productContext = `Система нашла товары по запросу клиента:\n\n${kwContext.join('\n\n')}`;
+      matchedProducts = keywordResults;
+    }
+    }
+
+    // If no products found but there are previous products for this peer,
+    // try to find alternatives from the same category
+    if (text && !productContext) {
+      const previousProducts = this.lastMatchedProducts.get(peerKey);
+      if (previousProducts && previousProducts.length > 0) {
+        const excludeIds = previousProducts.map((p) => p.id);
+
+        // Detect price direction from user message
+        const priceOptions: { maxPrice?: number; minPrice?: number } = {};
+        const textLower = text.toLowerCase();
+        const wantsCheaper = /дешевл|подешевл|дёшев|бюджетн|ниже.?цен|по.?дешевле|доступн/.test(textLower);
+        const wantsExpensive = /дорож|подорож|премиум|выше.?цен|по.?дороже|люкс/.test(textLower);
+
+        if (wantsCheaper) {
+          const minPrice = Math.min(...previousProducts.map((p) => Number(p.price)));
+          priceOptions.maxPrice = minPrice;
+        } else if (wantsExpensive) {
+          const maxPrice = Math.max(...previousProducts.map((p) => Number(p.price)));
+          priceOptions.minPrice = maxPrice;
+        }
+
+        const alternatives = await this.productsService.findAlternatives(
+          previousProducts,
+          excludeIds,
+          priceOptions,
+        );
+        const prevNames = previousProducts.map((p) => `${p.name} (${Number(p.price).toFixed(0)} ₽)`).join(', ');
+        if (alternatives.length > 0) {
+          const altLines = alternatives.map((p, i) => {
+            const parts = [`${i + 1}. ${p.name}`];
+            if (p.description) parts.push(`   Описание: ${p.description}`);
+            const dimParts: string[] = [];
+            if (p.width) dimParts.push(p.width);
+            if (p.height) dimParts.push(p.height);
+            if (p.depth) dimParts.push(p.depth);
+            if (dimParts.length > 0) parts.push(`   Размеры: ${dimParts.join(' x ')}`);
+            if (p.weight) parts.push(`   Вес: ${p.weight}`);
+            parts.push(`   Цена: ${Number(p.price).toFixed(2)} ₽`);
+            parts.push(`   В наличии: ${p.quantity} шт.`);
+            return parts.join('\n');
+          });
+          productContext =
+            `Клиент ранее интересовался: ${prevNames}.\n` +
+            `Система нашла альтернативные товары из той же категории:\n\n${altLines.join('\n\n')}`;
+          matchedProducts = alternatives;
+        } else if (wantsCheaper) {
+          // No cheaper alternatives found — tell LLM explicitly
+          productContext =
+            `Клиент ранее интересовался: ${prevNames}.\n` +
+            `Клиент просит дешевле, но система проверила каталог и НЕ нашла товаров дешевле в этой категории. ` +
+            `Честно сообщи что дешевле вариантов нет.`;
+        } else if (wantsExpensive) {
+          productContext =
+            `Клиент ранее интересовался: ${prevNames}.\n` +
+            `Клиент просит дороже, но система проверила каталог и НЕ нашла товаров дороже в этой категории. ` +
+            `Честно сообщи что дороже вариантов нет.`;
+        }
+      }
+    }
+
+    return { context: productContext, products: matchedProducts };
+  }
+
+  /** Full products for the AI service's matches, in match order. */
+  private async loadMatchedProducts(matches: Array<{ product_id: string }>): Promise<Product[]> {
+    const products = await this.productsService.findByIds(matches.map((m) => m.product_id));
+    const productMap = new Map(products.map((p) => [p.id, p]));
+    return matches
+      .map((m) => productMap.get(m.product_id))
+      .filter((p): p is Product => p !== undefined);
+  }
   private async formatProductContext(
     searchResults: Array<{ product_id: string; product_name: string; product_description: string | null; similarity: number }>,
     source: 'photo' | 'text',
@@ -846,6 +844,14 @@ export class TelegramService {
 
   private readonly maxProductPhotos = 5;
 
+  /**
+   * The AI service keeps each peer's dialogue (history, client facts, summary),
+   * so only the new message is sent; the rows here are for the dashboard.
+   */
+  private conversationId(peerId: string): string {
+    return `telegram:${peerId}`;
+  }
+
   private async persistAndReply(
     userId: string,
     peerId: string,
@@ -1201,11 +1207,13 @@ export class TelegramService {
 
   async clearPeerHistory(userId: string, peerId: string): Promise<void> {
     await this.conversationRepository.delete({ userId, peerId });
+    await this.aiService.deleteConversation(userId, this.conversationId(peerId));
     await this.ordersService.clearCart(userId, peerId);
   }
 
   async deletePeer(userId: string, peerId: string): Promise<void> {
     await this.conversationRepository.delete({ userId, peerId });
+    await this.aiService.deleteConversation(userId, this.conversationId(peerId));
     await this.peerRepository.delete({ userId, peerId });
   }
 